@@ -0,0 +1,61 @@
+''' Compares the old way of evaluating conditions, building the parser and
+transforming the tree every time, with evaluating a compiled condition.
+
+Run with: python -m benchmarks.conditions '''
+import timeit
+
+from cacahuate.grammar import Condition, ConditionTransformer, \
+    compile_condition, get_parser
+
+CONDITION = '!!3<0 || !(form.input == "0" && ("da" != "de")) && ' \
+    'form.number >= 2'
+
+VALUES = {
+    'form': {
+        'input': 'no',
+        'number': 2,
+    },
+}
+
+
+def build_parser():
+    ''' builds a brand new parser, like Condition() used to do '''
+    return get_parser.__wrapped__()
+
+
+def old_path():
+    tree = build_parser().parse(CONDITION)
+
+    return ConditionTransformer(VALUES).transform(tree)
+
+
+def shared_parser_path():
+    tree = Condition().parse(CONDITION)
+
+    return ConditionTransformer(VALUES).transform(tree)
+
+
+def compiled_path(evaluator=compile_condition(Condition().parse(CONDITION))):
+    return evaluator(VALUES)
+
+
+def run(name, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+
+    print('{:<24} {:>12.2f} us/evaluation'.format(name, seconds * 1e6))
+
+    return seconds
+
+
+def main():
+    assert old_path() == shared_parser_path() == compiled_path()
+
+    old = run('parser per evaluation', old_path, 20)
+    run('shared parser', shared_parser_path, 2000)
+    new = run('compiled condition', compiled_path, 200000)
+
+    print('speedup: {:.0f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+''' Runs executions of synthetic processes from start to end through
+`Xml.start` and `Handler.__call__`, answering every human node like the http
+api would. Executions are kept by the memory storage, messages go through the
+memory queue and redis is replaced by fakeredis, so no services are
+needed.
+
+Needs fakeredis with lua scripting, installed with the bench extra:
+
+    pip install -e .[bench]
+
+Run with: python -m benchmarks.e2e [scenario ...] '''
+from itacate import Config
+from time import perf_counter
+import argparse
+import os
+import pika
+import resource
+import simplejson as json
+import sys
+import tempfile
+
+from benchmarks import processes
+from benchmarks.fakes import bind_fake_redis
+from cacahuate.dedup import new_message_id
+from cacahuate.handler import Handler
+from cacahuate.models import Execution, User
+from cacahuate.node import Validation
+from cacahuate.queues import get_queue
+from cacahuate.xml import Xml
+
+USER = 'bench'
+
+SCENARIOS = {
+    'linear': lambda args: processes.linear(args.length),
+    'conditions': lambda args: processes.conditions(args.depth),
+    'forms': lambda args: processes.forms(
+        args.length, args.forms, args.inputs,
+    ),
+    'validations': lambda args: processes.validations(args.length),
+}
+
+
+def make_config(xml_path):
+    config = Config(os.path.dirname(os.path.realpath(__file__)))
+    config.from_object('cacahuate.settings')
+    config.from_mapping({
+        'XML_PATH': xml_path,
+        'STORAGE_BACKEND': 'memory',
+        'QUEUE_BACKEND': 'memory',
+    })
+
+    return config
+
+
+class Run:
+    ''' Executions of a single process, sharing the fake backends '''
+
+    def __init__(self, config, name, rejections):
+        self.config = config
+        self.name = name
+        self.rejections = rejections
+
+        self.handler = Handler(config)
+        self.queue = get_queue(config)
+        self.channel = self.queue.get_channel()
+
+        # seconds spent handling every message
+        self.latencies = []
+
+    def answer(self, xml, node, rejected):
+        ''' the body of the request that completes the given node '''
+        if isinstance(node, Validation):
+            if rejected < self.rejections:
+                return {
+                    'response': 'reject',
+                    'comment': 'again',
+                    'inputs': [{
+                        'ref': 'start.{}.0:start_form.data'.format(USER),
+                    }],
+                }
+
+            return {
+                'response': 'accept',
+                'comment': '',
+            }
+
+        return {
+            'form_array': [{
+                'ref': form['ref'],
+                'data': {
+                    input['name']: 'yes' for input in form['inputs']
+                },
+            } for form in xml.get_node_forms(node.id)],
+        }
+
+    def publish(self, pointer, input):
+        self.channel.basic_publish(
+            exchange='',
+            routing_key=self.config['RABBIT_QUEUE'],
+            body=json.dumps({
+                'command': 'step',
+                'pointer_id': pointer.id,
+                'user_identifier': USER,
+                'input': input,
+            }),
+            properties=pika.BasicProperties(
+                delivery_mode=2,
+                message_id=new_message_id(),
+            ),
+        )
+
+    def drain(self):
+        handler = self.handler
+
+        while not self.queue.commands.empty():
+            method, properties, body = self.queue.get()
+
+            started = perf_counter()
+            handler(self.channel, method, properties, body)
+            self.latencies.append(perf_counter() - started)
+
+    def execute(self):
+        xml = Xml.load(self.config, self.name)
+        node = xml.get_start_node()
+
+        execution = xml.start(
+            node,
+            node.validate_input(self.answer(xml, node, 0)),
+            self.handler.get_storage(),
+            self.channel,
+            USER,
+        )
+        rejected = 0
+
+        while True:
+            self.drain()
+
+            execution = Execution.get(execution.id)
+
+            if execution is None:
+                return
+
+            pointers = execution.proxy.pointers.get()
+
+            if not pointers:
+                raise RuntimeError('Execution {} got stuck'.format(
+                    execution.id,
+                ))
+
+            for pointer in pointers:
+                node = xml.get_node(pointer.node_id)
+                body = self.answer(xml, node, rejected)
+
+                if body.get('response') == 'reject':
+                    rejected += 1
+
+                self.publish(pointer, node.validate_input(body))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def peak_rss():
+    ''' maximum resident set size of this process so far, in MiB '''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if sys.platform == 'darwin':
+        # bytes instead of KiB
+        rss /= 1024
+
+    return rss / 1024
+
+
+def run_scenario(config, name, args):
+    run = Run(config, name, args.rejections)
+
+    # warm up caches: compiled process, registry, parsers
+    run.execute()
+    run.latencies = []
+
+    started = perf_counter()
+
+    for i in range(args.executions):
+        run.execute()
+
+    elapsed = perf_counter() - started
+    handling = sum(run.latencies)
+
+    return {
+        'scenario': name,
+        'executions': args.executions,
+        'steps': len(run.latencies),
+        'steps_per_second': len(run.latencies) / handling,
+        'executions_per_second': args.executions / elapsed,
+        'p50_ms': percentile(run.latencies, 0.5) * 1000,
+        'p99_ms': percentile(run.latencies, 0.99) * 1000,
+        'peak_rss_mib': peak_rss(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        'scenarios', nargs='*',
+        help='scenarios to run among {}, all by default'.format(
+            ', '.join(SCENARIOS),
+        ),
+    )
+    parser.add_argument('--executions', type=int, default=20)
+    parser.add_argument('--length', type=int, default=20,
+                        help='nodes of the linear, forms and validations '
+                        'scenarios')
+    parser.add_argument('--depth', type=int, default=10,
+                        help='nested conditionals')
+    parser.add_argument('--forms', type=int, default=10,
+                        help='forms per action')
+    parser.add_argument('--inputs', type=int, default=10,
+                        help='inputs per form')
+    parser.add_argument('--rejections', type=int, default=3,
+                        help='times a validation rejects before accepting')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as json')
+    args = parser.parse_args()
+
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario {}'.format(name))
+
+    bind_fake_redis()
+    User(identifier=USER, fullname='Benchmark').save()
+
+    results = []
+    scenarios = args.scenarios or list(SCENARIOS)
+
+    with tempfile.TemporaryDirectory() as xml_path:
+        config = make_config(xml_path)
+
+        for name in scenarios:
+            filename = '{}.2018-01-01.xml'.format(name)
+
+            with open(os.path.join(xml_path, filename), 'w') as f:
+                f.write(SCENARIOS[name](args))
+
+        for name in scenarios:
+            results.append(run_scenario(config, name, args))
+
+            if not args.json:
+                print(
+                    '{scenario:<12} {steps:>6} steps {steps_per_second:>9.1f}'
+                    ' steps/s  p50 {p50_ms:>7.3f} ms  p99 {p99_ms:>7.3f} ms'
+                    '  peak rss {peak_rss_mib:>6.1f} MiB'.format(
+                        **results[-1]
+                    )
+                )
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
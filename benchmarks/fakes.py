@@ -0,0 +1,20 @@
+''' In-process stand-ins for the services used by a worker. Redis is
+replaced by fakeredis, the models' lua scripts need lupa too. Both come with
+the bench extra, `pip install -e .[bench]` '''
+
+
+def bind_fake_redis():
+    ''' binds the models to an in-process redis '''
+    from coralillo import Engine  # noqa
+    from coralillo.lua import Lua  # noqa
+    import fakeredis  # noqa
+
+    from cacahuate.models import bind_models  # noqa
+
+    engine = Engine()
+    engine.redis = fakeredis.FakeStrictRedis()
+    engine.lua = Lua(engine.redis)
+
+    bind_models(engine)
+
+    return engine
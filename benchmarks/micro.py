@@ -0,0 +1,248 @@
+''' Measures the functions that run in every step or request, one at a time.
+Results can be written as json and compared with the ones of another commit.
+
+Run with: python -m benchmarks.micro [--output run.json] [--compare old.json]
+[name ...] '''
+from datetime import datetime
+from itacate import Config
+from xml.dom import minidom
+import argparse
+import os
+import platform
+import subprocess
+import timeit
+
+import simplejson as json
+
+from benchmarks import processes
+from cacahuate.compiler import CompiledProcess, ExpandedIter
+from cacahuate.grammar import Condition, ConditionTransformer
+from cacahuate.handler import Handler
+from cacahuate.inputs import make_input
+from cacahuate.jsontypes import SortedMap
+from cacahuate.node import Form, make_node
+from cacahuate.xml import Xml
+
+# a fixture that contains each node type
+NODE_FIXTURES = {
+    'action': 'simple.2018-02-19.xml',
+    'validation': 'all-nodes-invalidated.2018-05-24.xml',
+    'exit': 'exit.2018-05-03.xml',
+    'if': 'else.2018-07-10.xml',
+    'elif': 'else.2018-07-10.xml',
+    'else': 'else.2018-07-10.xml',
+    'request': 'request.2018-05-18.xml',
+    'call': 'call.2018-05-18.xml',
+}
+
+OPTIONS = '<options><option value="a">A</option>' \
+    '<option value="b">B</option></options>'
+
+# input type -> (attributes and children, valid value)
+INPUTS = {
+    'text': ('', 'some text'),
+    'password': ('', 'secret'),
+    'int': ('', 42),
+    'float': ('', 3.14),
+    'checkbox': (OPTIONS, ['a', 'b']),
+    'radio': (OPTIONS, 'a'),
+    'select': (OPTIONS, 'b'),
+    'file': (' provider="doqer"', {
+        'id': 1, 'mime': 'text/plain', 'name': 'file.txt', 'type': 'doqer',
+    }),
+    'datetime': ('', '2018-06-13T21:15:00.000Z'),
+    'date': ('', '2018-06-13T00:00:00.000Z'),
+}
+
+CONDITION = '!(form.input == "0" && ("da" != "de")) || form.number >= 2'
+
+
+def make_config():
+    config = Config(os.path.dirname(os.path.realpath(__file__)))
+    config.from_object('cacahuate.settings')
+
+    return config
+
+
+def xml_benchmarks(config):
+    filename = 'all-inputs.2018-04-04.xml'
+    path = os.path.join(config['XML_PATH'], filename)
+    xml = Xml(config, filename)
+
+    yield 'xml.init', lambda: Xml(config, filename)
+    yield 'xml.get_state', xml.get_state
+    yield 'compiler.compile', lambda: CompiledProcess(path)
+
+
+def node_benchmarks(config):
+    for tag, filename in NODE_FIXTURES.items():
+        document = minidom.parse(os.path.join(config['XML_PATH'], filename))
+        element = document.getElementsByTagName(tag)[0]
+
+        yield 'make_node.{}'.format(tag), (
+            lambda element=element: make_node(element, ExpandedIter(element))
+        )
+
+
+def form_array(forms, inputs):
+    return {
+        'form_array': [{
+            'ref': 'node1_form{}'.format(i) if i else 'node1_form',
+            'data': {
+                'data{}'.format(j) if j else 'data': 'yes'
+                for j in range(inputs)
+            },
+        } for i in range(forms)],
+    }
+
+
+def validate_input_benchmarks(config):
+    document = minidom.parseString(processes.forms(2, 20, 20))
+    element = document.getElementsByTagName('action')[1]
+    node = make_node(element, ExpandedIter(element))
+    data = form_array(20, 20)
+
+    assert len(node.validate_input(data)) == 20
+
+    yield 'action.validate_input.20x20', lambda: node.validate_input(data)
+
+
+def input_benchmarks(config):
+    for input_type, (extra, value) in INPUTS.items():
+        if extra.startswith(' '):
+            attributes, children = extra, ''
+        else:
+            attributes, children = '', extra
+
+        element = minidom.parseString(
+            '<input type="{}" name="field" required="required"{}>{}'
+            '</input>'.format(input_type, attributes, children)
+        ).documentElement
+        input = make_input(element)
+        input.validate(value, 0)
+
+        yield 'input.validate.{}'.format(input_type), (
+            lambda input=input, value=value: input.validate(value, 0)
+        )
+
+
+def condition_benchmarks(config):
+    values = {
+        'form': {
+            'input': 'no',
+            'number': 2,
+        },
+    }
+    tree = Condition().parse(CONDITION)
+
+    yield 'condition.parse', lambda: Condition().parse(CONDITION)
+    yield 'condition.transform', \
+        lambda: ConditionTransformer(values).transform(tree)
+
+
+def sorted_map_benchmarks(config):
+    items = [{'id': 'item{}'.format(i), 'value': i} for i in range(100)]
+
+    yield 'sorted_map.100', lambda: SortedMap(items, key='id').to_json()
+
+
+def compact_values_benchmarks(config):
+    handler = Handler(config)
+    input = [
+        Form.state_json('form{}'.format(i), [{
+            'name': 'data{}'.format(j),
+            'value': j,
+            'value_caption': str(j),
+        } for j in range(20)])
+        for i in range(20)
+    ]
+
+    yield 'handler.compact_values.20x20', lambda: handler.compact_values(input)
+
+
+GROUPS = [
+    xml_benchmarks,
+    node_benchmarks,
+    validate_input_benchmarks,
+    input_benchmarks,
+    condition_benchmarks,
+    sorted_map_benchmarks,
+    compact_values_benchmarks,
+]
+
+
+def measure(func, repeat):
+    ''' the best time per call among `repeat` runs of about 0.2s each '''
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = timer.repeat(repeat=repeat, number=number)
+
+    return {
+        'seconds': min(times) / number,
+        'mean_seconds': sum(times) / len(times) / number,
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        'names', nargs='*',
+        help='run only the benchmarks whose name starts with one of these',
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the results to this file')
+    parser.add_argument('--compare', help='results of a previous run')
+    args = parser.parse_args()
+
+    config = make_config()
+    baseline = {}
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results = {}
+
+    for group in GROUPS:
+        for name, func in group(config):
+            if args.names and not any(map(name.startswith, args.names)):
+                continue
+
+            results[name] = measure(func, args.repeat)
+            line = '{:<32} {:>12.2f} us'.format(
+                name, results[name]['seconds'] * 1e6,
+            )
+
+            if name in baseline:
+                line += '  {:>6.2f}x'.format(
+                    baseline[name]['seconds'] / results[name]['seconds']
+                )
+
+            print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'date': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+''' Synthetic process definitions of configurable size for the benchmarks.
+Every function returns the xml of a process whose first node is the action
+`start`, filled by anyone, and whose other human nodes are assigned to the
+user that filled it '''
+
+HEADER = '''<?xml version="1.0" encoding="UTF-8"?>
+<process-spec>
+  <process-info>
+    <author>benchmarks</author>
+    <date>2018-01-01</date>
+    <name>{name}</name>
+    <public>true</public>
+    <description>Synthetic process for benchmarks</description>
+  </process-info>
+  <process>
+'''
+
+FOOTER = '''  </process>
+</process-spec>
+'''
+
+INPUT = '<input type="text" name="{name}" label="{name}" />'
+
+
+def form(form_id, inputs=1):
+    return '<form id="{}">{}</form>'.format(form_id, ''.join(
+        INPUT.format(name='data{}'.format(i) if i else 'data')
+        for i in range(inputs)
+    ))
+
+
+def action(node_id, forms=1, inputs=1, backend='backref'):
+    if backend == 'anyone':
+        auth = '<auth-filter backend="anyone"></auth-filter>'
+    else:
+        auth = '<auth-filter backend="backref">' \
+            '<param name="identifier" type="ref">user#start</param>' \
+            '</auth-filter>'
+
+    return '''<action id="{id}">
+      {auth}
+      <node-info><name>{id}</name><description>{id}</description></node-info>
+      <form-array>{forms}</form-array>
+    </action>
+'''.format(id=node_id, auth=auth, forms=''.join(
+        form('{}_form{}'.format(node_id, i) if i else '{}_form'.format(
+            node_id,
+        ), inputs)
+        for i in range(forms)
+    ))
+
+
+def validation(node_id, dependencies):
+    return '''<validation id="{id}">
+      <dependencies>{deps}</dependencies>
+      <node-info><name>{id}</name><description>{id}</description></node-info>
+      <auth-filter backend="backref">
+        <param name="identifier" type="ref">user#start</param>
+      </auth-filter>
+    </validation>
+'''.format(id=node_id, deps=''.join(
+        '<dep>{}</dep>'.format(dep) for dep in dependencies
+    ))
+
+
+def process(name, body):
+    return HEADER.format(name=name) + action('start', backend='anyone') + \
+        body + FOOTER
+
+
+def linear(length=20):
+    ''' `length` actions one after the other '''
+    return process('linear', ''.join(
+        action('node{}'.format(i)) for i in range(1, length)
+    ))
+
+
+def conditions(depth=10):
+    ''' `depth` nested levels of an `if` whose condition is false followed by
+    an `elif` whose block holds the next level '''
+    body = action('deepest')
+
+    for i in reversed(range(depth)):
+        body = '''<if id="if{i}">
+      <condition>start_form.data == "no" || {i} &gt; {depth}</condition>
+      <block>{skipped}</block>
+    </if>
+    <elif id="elif{i}">
+      <condition>
+        start_form.data == "yes" &amp;&amp; {i} &lt; {depth}
+      </condition>
+      <block>{body}</block>
+    </elif>
+'''.format(
+            i=i,
+            depth=depth,
+            skipped=action('skipped{}'.format(i)),
+            body=body,
+        )
+
+    return process('conditions', body)
+
+
+def forms(length=5, forms=10, inputs=10):
+    ''' `length` actions with `forms` forms of `inputs` inputs each '''
+    return process('forms', ''.join(
+        action('node{}'.format(i), forms, inputs) for i in range(1, length)
+    ))
+
+
+def validations(length=5):
+    ''' `length` actions followed by a validation that depends on all of
+    them '''
+    return process('validations', ''.join(
+        action('node{}'.format(i)) for i in range(1, length)
+    ) + validation('approval', ['start_form.data'] + [
+        'node{}_form.data'.format(i) for i in range(1, length)
+    ]) + action('end'))
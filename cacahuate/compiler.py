@@ -0,0 +1,367 @@
+''' Turns process definitions into in-memory graphs of nodes so they don't
+have to be parsed again on every step. Compiled processes can also be stored
+next to their xml files so new workers don't need to parse the xml at all.
+Compiled files are pickles, so they are signed with COMPILED_SECRET and only
+the ones whose signature matches are loaded '''
+from collections import namedtuple
+from hashlib import sha256
+from lark.exceptions import GrammarError, ParseError, LexError
+from xml.dom import minidom
+from xml.dom.minidom import Element
+from xml.parsers.expat import ExpatError
+import hmac
+import logging
+import os
+import pickle
+import struct
+
+from cacahuate.errors import ProcessNotFound, ElementNotFound, MalformedProcess
+from cacahuate.xml import NODES, XML_ATTRIBUTES, get_text, form_to_dict
+from cacahuate.node import make_node, Conditional
+
+LOGGER = logging.getLogger(__name__)
+
+# compiled processes of this worker indexed by path
+CACHE = {}
+
+# Compiled files are named after their xml file plus this suffix
+COMPILED_SUFFIX = '.compiled'
+
+# Layout of a compiled file: magic bytes, format version, the length of the
+# cacahuate version that wrote it, then the version itself, the sha256 of the
+# xml it was compiled from and the hmac-sha256 with COMPILED_SECRET of the
+# pickled process that follows
+COMPILED_MAGIC = b'CACAHUATE'
+COMPILED_FORMAT = 3
+COMPILED_HEADER = struct.Struct('>9sHB')
+DIGEST_SIZE = 32
+
+with open(os.path.join(os.path.dirname(__file__), 'version.txt')) as f:
+    VERSION = f.read().strip().encode()
+
+# ids of the nodes that follow a given node. `adjacent` is the next node in
+# the document, used by most nodes and by conditionals whose condition held,
+# `past_block` is the one after the node's own block, used when the condition
+# of a conditional was false. Both skip the elif/else chains found when
+# leaving a block. None means the end of the process.
+Successors = namedtuple('Successors', ['adjacent', 'past_block'])
+
+
+class ExpandedIter:
+    ''' The iterator given to the nodes' contructors, which read their
+    condition from it. Elements are already fully loaded in memory '''
+
+    def __init__(self, element):
+        self.element = element
+        self.parser = self
+
+    def expandNode(self, node):
+        # nothing to do, the whole document is already in memory
+        pass
+
+    def get_next_condition(self):
+        for child in element_children(self.element):
+            if child.tagName != 'condition':
+                raise ElementNotFound(
+                    'Requested a condition but found {}'.format(child.tagName)
+                )
+
+            return get_text(child)
+
+        raise ElementNotFound('Condition not found')
+
+
+class CompiledProcess:
+    ''' The immutable in-memory graph of a process definition. Nodes are built
+    once and are shared between every execution of this process '''
+
+    def __init__(self, path):
+        self.filename = os.path.basename(path)
+        self.stamp = None
+
+        try:
+            document = minidom.parse(path)
+        except FileNotFoundError:
+            raise ProcessNotFound(self.filename)
+        except ExpatError as e:
+            raise MalformedProcess(str(e))
+
+        children = element_children(document.documentElement)
+
+        if len(children) == 0:
+            raise MalformedProcess('This process lacks the process-info node')
+
+        info_node = children[0]
+
+        if info_node.tagName != 'process-info':
+            raise MalformedProcess('process-info node must be the first node')
+
+        self.info = {}
+
+        for attr, func in XML_ATTRIBUTES.items():
+            try:
+                node = info_node.getElementsByTagName(attr)[0]
+            except IndexError:
+                raise MalformedProcess(
+                    'Process\' metadata lacks node {}'.format(attr)
+                )
+
+            self.info[attr] = func(get_text(node))
+
+        # nodes in document order and indexed by id
+        self.nodes = []
+        self.index = {}
+        self.forms = {}
+
+        # for every node in self.nodes its tag, the number of blocks that
+        # contain it and the position of the first node after its subtree
+        self.tags = []
+        self.depths = []
+        self.ends = []
+
+        for element in children[1:]:
+            self.add_element(element, 0)
+
+        self.parse_conditions()
+
+        # position of every node id and, for every field written as
+        # `form.input`, the (node id, field) pairs that depend on it. Used to
+        # find the fields invalidated by a rejection without visiting the
+        # whole process
+        self.positions = {}
+        self.dependents = {}
+
+        for pos, node in enumerate(self.nodes):
+            if self.index[node.id] is not node:
+                continue
+
+            self.positions[node.id] = pos
+
+            for dep, field in node.dependent_fields():
+                self.dependents.setdefault(dep, []).append((node.id, field))
+
+        self.successors = {}
+
+        for pos, node in enumerate(self.nodes):
+            self.successors.setdefault(node.id, Successors(
+                adjacent=self.find_successor(pos + 1, self.depths[pos]),
+                past_block=self.find_successor(
+                    self.ends[pos], self.depths[pos]
+                ),
+            ))
+
+    def add_element(self, element, depth):
+        ''' walks the document in order, building every node found '''
+        if element.tagName == 'block':
+            depth += 1
+
+        if element.tagName in NODES:
+            node_id = element.getAttribute('id')
+
+            try:
+                node = make_node(element, ExpandedIter(element))
+            except Exception as e:
+                # e.g. an unknown input type raises ValueError
+                raise MalformedProcess(
+                    'Node {} is malformed: {}'.format(node_id, str(e))
+                )
+
+            pos = len(self.nodes)
+
+            self.nodes.append(node)
+            self.tags.append(element.tagName)
+            self.depths.append(depth)
+            self.ends.append(None)
+
+            if node.id not in self.index:
+                self.index[node.id] = node
+                self.forms[node.id] = list(map(
+                    form_to_dict,
+                    element.getElementsByTagName('form'),
+                ))
+
+        for child in element_children(element):
+            self.add_element(child, depth)
+
+        if element.tagName in NODES:
+            self.ends[pos] = len(self.nodes)
+
+    def parse_conditions(self):
+        ''' parses the condition of every conditional so the trees are
+        stored along with the process '''
+        for node in self.nodes:
+            if not isinstance(node, Conditional):
+                continue
+
+            try:
+                node.get_tree()
+            except (GrammarError, ParseError, LexError) as e:
+                raise MalformedProcess(
+                    'Condition of node {} is invalid: {}'.format(
+                        node.id, str(e),
+                    )
+                )
+
+    def find_successor(self, pos, depth):
+        ''' given the position where the search starts and the depth of the
+        node we come from return the id of the next node to be executed '''
+        if pos >= len(self.nodes):
+            return None
+
+        # when leaving a block the rest of the elif/else chain is skipped
+        if self.depths[pos] < depth:
+            while self.tags[pos] in ('elif', 'else'):
+                pos = self.ends[pos]
+
+                if pos >= len(self.nodes):
+                    return None
+
+        return self.nodes[pos].id
+
+    def get_node(self, node_id):
+        try:
+            return self.index[node_id]
+        except KeyError:
+            raise ElementNotFound(
+                'node {} was not found in {}'.format(node_id, self.filename)
+            )
+
+    def get_successor(self, node_id, past_block=False):
+        ''' returns the node that follows node_id, raises StopIteration if
+        the process ends there '''
+        successors = self.successors[node_id]
+        next_id = successors.past_block if past_block else successors.adjacent
+
+        if next_id is None:
+            raise StopIteration
+
+        return self.index[next_id]
+
+    def get_dependents(self, field):
+        ''' returns the (node id, field) pairs that depend on the given
+        `form.input` field '''
+        return self.dependents.get(field, [])
+
+    def get_position(self, node_id):
+        return self.positions[node_id]
+
+    def get_start_node(self):
+        try:
+            return self.nodes[0]
+        except IndexError:
+            raise ElementNotFound(
+                'process {} has no nodes'.format(self.filename)
+            )
+
+
+def element_children(element):
+    return [
+        child for child in element.childNodes if isinstance(child, Element)
+    ]
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return sha256(f.read()).digest()
+
+
+def sign(payload, secret):
+    if isinstance(secret, str):
+        secret = secret.encode()
+
+    return hmac.new(secret, payload, sha256).digest()
+
+
+def dump(process, path, secret):
+    ''' writes the compiled process to the compiled file of the xml found
+    in path, signed with secret. Returns the name of the written file '''
+    payload = pickle.dumps(process, pickle.HIGHEST_PROTOCOL)
+    compiled_path = path + COMPILED_SUFFIX
+
+    with open(compiled_path, 'wb') as f:
+        f.write(COMPILED_HEADER.pack(
+            COMPILED_MAGIC, COMPILED_FORMAT, len(VERSION)
+        ))
+        f.write(VERSION)
+        f.write(file_digest(path))
+        f.write(sign(payload, secret))
+        f.write(payload)
+
+    return compiled_path
+
+
+def read(path, secret):
+    ''' reads the compiled file of the xml found in path. Returns None if
+    there is no compiled file or if it cannot be used, in which case the xml
+    must be compiled again. Without a secret compiled files are ignored,
+    their signature cannot be checked '''
+    if not secret:
+        return None
+
+    compiled_path = path + COMPILED_SUFFIX
+
+    try:
+        with open(compiled_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        magic, fmt, version_size = COMPILED_HEADER.unpack_from(data)
+    except struct.error:
+        magic, fmt, version_size = None, None, 0
+
+    if magic != COMPILED_MAGIC or fmt != COMPILED_FORMAT:
+        LOGGER.warning('{} is not a compiled process'.format(compiled_path))
+        return None
+
+    start = COMPILED_HEADER.size
+    version = data[start:start + version_size]
+    start += version_size
+    source_digest = data[start:start + DIGEST_SIZE]
+    start += DIGEST_SIZE
+    signature = data[start:start + DIGEST_SIZE]
+    payload = data[start + DIGEST_SIZE:]
+
+    if version != VERSION:
+        LOGGER.info('{} was compiled by another version of cacahuate'.format(
+            compiled_path,
+        ))
+        return None
+
+    if source_digest != file_digest(path):
+        LOGGER.info('{} is older than its xml'.format(compiled_path))
+        return None
+
+    if not hmac.compare_digest(signature, sign(payload, secret)):
+        LOGGER.warning(
+            '{} is corrupted or was not signed with COMPILED_SECRET'.format(
+                compiled_path,
+            )
+        )
+        return None
+
+    return pickle.loads(payload)
+
+
+def load(config, filename) -> CompiledProcess:
+    ''' returns the compiled version of the given process file, compiling it
+    only if it is not cached or the file changed since it was cached. A
+    compiled file written by `cacahuate-compile` is used if present '''
+    path = os.path.join(config['XML_PATH'], filename)
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise ProcessNotFound(filename)
+
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    process = CACHE.get(path)
+
+    if process is None or process.stamp != stamp:
+        process = read(path, config['COMPILED_SECRET']) or \
+            CompiledProcess(path)
+        process.stamp = stamp
+        CACHE[path] = process
+
+    return process
@@ -0,0 +1,39 @@
+''' Every message sent to the workers carries a unique id in its `message_id`
+property. The ids of the messages already handled are kept in redis for a
+while, so a message delivered again is not handled twice '''
+from uuid import uuid4
+
+from cacahuate.models import Pointer
+
+
+def new_message_id() -> str:
+    return uuid4().hex
+
+
+class DedupStore:
+
+    def __init__(self, config, redis=None):
+        self.ttl = config['MESSAGE_DEDUP_TTL']
+        self.redis = redis
+
+    def get_redis(self):
+        if self.redis is None:
+            self.redis = Pointer.get_redis()
+
+        return self.redis
+
+    def key(self, message_id):
+        return 'cacahuate:handled:{}'.format(message_id)
+
+    def seen(self, message_id) -> bool:
+        if not self.ttl or not message_id:
+            return False
+
+        return bool(self.get_redis().exists(self.key(message_id)))
+
+    def mark(self, message_id):
+        ''' remembers the message as handled '''
+        if not self.ttl or not message_id:
+            return
+
+        self.get_redis().set(self.key(message_id), 1, ex=self.ttl)
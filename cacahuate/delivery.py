@@ -0,0 +1,228 @@
+''' At-least-once delivery for the worker. Consumed messages are acknowledged
+in batches once they were handled and, if publisher confirms are enabled, once
+the broker confirmed every message published while handling them. Messages
+whose handling failed are rejected instead, see `Deliveries.handled`.
+Everything here runs in the connection's thread '''
+from collections import OrderedDict
+import logging
+import pika
+import pymongo.errors
+import redis.exceptions
+
+LOGGER = logging.getLogger(__name__)
+
+# errors of a service the handler depends on being unavailable. A message
+# whose handling raised one of them is sent back to the queue to be handled
+# again, any other error sends it to the dead letter queue
+TRANSIENT_ERRORS = (
+    pymongo.errors.ConnectionFailure,
+    redis.exceptions.ConnectionError,
+    redis.exceptions.TimeoutError,
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.NackError,
+)
+
+
+class Delivery:
+    ''' A consumed message waiting to be acknowledged '''
+
+    def __init__(self, tag, start):
+        self.tag = tag
+        self.handled = False
+
+        # None to acknowledge it once handled, True to send it back to the
+        # queue and False to reject it
+        self.requeue = None
+
+        # the messages published while it was handled have sequence numbers
+        # in (start, end]. Might include messages of other deliveries handled
+        # at the same time
+        self.start = start
+        self.end = None
+
+
+class CountingChannel:
+    ''' Proxy of the worker's channel that keeps the sequence number of the
+    messages published through it, the one the broker uses in its confirms '''
+
+    def __init__(self, channel, deliveries):
+        self.channel = channel
+        self.deliveries = deliveries
+
+    def basic_publish(self, *args, **kwargs):
+        self.channel.basic_publish(*args, **kwargs)
+        self.deliveries.published += 1
+
+    def __getattr__(self, name):
+        return getattr(self.channel, name)
+
+
+class Deliveries:
+
+    def __init__(self, connection, channel, config):
+        self.connection = connection
+        self.channel = channel
+        self.confirms = config['RABBIT_WORKER_CONFIRMS']
+        self.interval = config['RABBIT_ACK_INTERVAL']
+
+        # never wait for more messages than the broker would send
+        self.batch_size = max(min(
+            config['RABBIT_ACK_BATCH_SIZE'],
+            config['RABBIT_PREFETCH_COUNT'] or config['RABBIT_ACK_BATCH_SIZE'],
+        ), 1)
+
+        self.pending = OrderedDict()
+        self.waiting = 0
+
+        # sequence number of the last published message, the highest one
+        # below which the broker answered every message and the ones it
+        # answered out of order
+        self.published = 0
+        self.confirmed = 0
+        self.answered = set()
+        self.nacked = set()
+
+    def start(self):
+        if self.confirms:
+            # when they cannot be tracked every publish waits for its confirm,
+            # so a handled message has nothing left to wait for
+            self.confirms = enable_confirms(self.channel, self.on_confirm)
+
+        self.schedule()
+
+    def wrap(self, channel):
+        ''' the channel given to the handler '''
+        if not self.confirms:
+            return channel
+
+        return CountingChannel(channel, self)
+
+    def schedule(self):
+        # pika < 1.0 calls it add_timeout
+        call_later = getattr(self.connection, 'call_later', None) or \
+            self.connection.add_timeout
+
+        call_later(self.interval, self.tick)
+
+    def tick(self):
+        self.flush()
+        self.schedule()
+
+    def received(self, method):
+        self.pending[method.delivery_tag] = Delivery(
+            method.delivery_tag,
+            self.published,
+        )
+
+    def handled(self, method, error=None):
+        ''' the message was handled. If it failed with `error` it is sent
+        back to the queue when the error is transient, otherwise it is
+        rejected and the broker moves it to the dead letter queue '''
+        delivery = self.pending.get(method.delivery_tag)
+
+        if delivery is None:
+            return
+
+        if error is not None:
+            delivery.requeue = isinstance(error, TRANSIENT_ERRORS)
+
+        delivery.handled = True
+        delivery.end = self.published
+        self.waiting += 1
+
+        if self.waiting >= self.batch_size:
+            self.flush()
+
+    def on_confirm(self, frame):
+        method = frame.method
+        tags = range(self.confirmed + 1, method.delivery_tag + 1) \
+            if method.multiple else [method.delivery_tag]
+
+        self.answered.update(tags)
+
+        if isinstance(method, pika.spec.Basic.Nack):
+            LOGGER.error('Broker rejected published messages {}'.format(
+                ', '.join(map(str, tags)),
+            ))
+            self.nacked.update(tags)
+
+        while self.confirmed + 1 in self.answered:
+            self.confirmed += 1
+            self.answered.remove(self.confirmed)
+
+        if self.waiting >= self.batch_size:
+            # not from within the frame's dispatch
+            self.connection.add_callback_threadsafe(self.flush)
+
+    def ready(self, delivery):
+        if not delivery.handled:
+            return False
+
+        return not self.confirms or delivery.end <= self.confirmed
+
+    def failed(self, delivery):
+        return any(
+            delivery.start < seq <= delivery.end for seq in self.nacked
+        )
+
+    def flush(self):
+        ''' acknowledges with a single basic_ack the handled deliveries that
+        precede the first one still in progress. Those whose published
+        messages were rejected are sent back to the queue, and the failed
+        ones are sent back or rejected '''
+        last = None
+
+        while self.pending:
+            tag, delivery = next(iter(self.pending.items()))
+
+            if not self.ready(delivery):
+                break
+
+            del self.pending[tag]
+            self.waiting -= 1
+
+            requeue = True if self.failed(delivery) else delivery.requeue
+
+            if requeue is None:
+                last = tag
+                continue
+
+            if last is not None:
+                self.channel.basic_ack(delivery_tag=last, multiple=True)
+                last = None
+
+            self.channel.basic_nack(delivery_tag=tag, requeue=requeue)
+
+        if last is not None:
+            self.channel.basic_ack(delivery_tag=last, multiple=True)
+
+        if not self.pending:
+            self.nacked.clear()
+
+
+def enable_confirms(channel, callback) -> bool:
+    ''' puts the channel in confirm mode. Unlike the channel's own
+    `confirm_delivery` publishing does not wait for the broker, its answers
+    are given to callback as they arrive. The broker handles the selection
+    before anything published after it, so there is no need to wait for it.
+
+    This relies on the private implementation of pika's blocking channel. If
+    it is not the expected one the channel's own `confirm_delivery` is used
+    and False is returned '''
+    impl = getattr(channel, '_impl', None)
+
+    try:
+        if pika.__version__.startswith('0.'):
+            impl.confirm_delivery(callback=callback, nowait=True)
+        else:
+            impl.confirm_delivery(ack_nack_callback=callback)
+    except (AttributeError, TypeError) as e:
+        LOGGER.warning(
+            'Could not track publisher confirms, every publish will wait for '
+            'its own: {}'.format(repr(e))
+        )
+        channel.confirm_delivery()
+
+        return False
+
+    return True
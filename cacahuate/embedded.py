@@ -0,0 +1,87 @@
+''' Runs the http api and the workers in a single process. The steps are sent
+through the memory queue to a pool of threads running the same handler as the
+workers, so no broker is needed '''
+from threading import Thread
+from werkzeug.serving import make_server
+import argparse
+import logging
+import signal
+
+from cacahuate.metrics import start_exporter
+from cacahuate.profiler import get_profiler
+from cacahuate.queues import get_queue
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Embedded:
+    ''' The workers of an http api application, handling the commands it
+    publishes in `threads` threads '''
+
+    def __init__(self, app, threads):
+        self.app = app
+        self.config = app.config
+
+        self.config['QUEUE_BACKEND'] = 'memory'
+        self.config['WORKER_THREADS'] = threads
+
+        self.queue = get_queue(self.config)
+        self.engine = Thread(target=self.queue.consume, daemon=True)
+
+    def start(self):
+        self.engine.start()
+
+    def stop(self):
+        ''' waits for the commands already published to be handled '''
+        self.queue.stop()
+        self.engine.join()
+
+    def serve(self, host, port):
+        server = make_server(host, port, self.app, threaded=True)
+
+        self.start()
+        LOGGER.info('Serving on http://{}:{}'.format(host, port))
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            LOGGER.info('cacahuate stopped')
+        finally:
+            server.server_close()
+            self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='The cacahuate http api and workers in a single process',
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=4,
+        help='threads handling the steps',
+    )
+    args = parser.parse_args()
+
+    # loads the settings, logging and timezone like any deployment of the
+    # api. Setting STORAGE_BACKEND to memory in them removes the need for mongo
+    from cacahuate.http.wsgi import app  # noqa
+
+    embedded = Embedded(app, args.threads)
+
+    # expose the step timings
+    start_exporter(app.config)
+
+    # SIGUSR2 profiles the steps handled in the next PROFILER_WINDOW seconds
+    get_profiler(app.config).install()
+
+    # stop like with ctrl+c, finishing the steps already queued
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    embedded.serve(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
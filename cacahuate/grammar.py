@@ -1,28 +1,115 @@
+from functools import lru_cache
 from lark import Lark, Transformer
 import operator
 import os
 
+OPERATORS = {
+    'op_eq': operator.eq,
+    'op_ne': operator.ne,
+    'op_lt': operator.lt,
+    'op_lte': operator.le,
+    'op_gt': operator.gt,
+    'op_gte': operator.ge,
+    'op_or': operator.or_,
+    'op_and': operator.and_,
+}
+
+
+@lru_cache(maxsize=None)
+def get_parser():
+    ''' builds the condition parser, only once per process '''
+    filename = os.path.join(
+        os.path.dirname(__file__),
+        'grammars/condition.g'
+    )
+
+    with open(filename) as grammar_file:
+        return Lark(
+            grammar_file.read(),
+            start='or_test',
+            parser='lalr',
+        )
+
 
 class Condition:
 
     def __init__(self):
-        filename = os.path.join(
-            os.path.dirname(__file__),
-            'grammars/condition.g'
-        )
-
-        with open(filename) as grammar_file:
-            self.parser = Lark(
-                grammar_file.read(),
-                start='or_test',
-                parser='lalr',
-            )
+        self.parser = get_parser()
 
     def parse(self, string):
         ''' returns the tree '''
         return self.parser.parse(string)
 
 
+def compile_condition(tree):
+    ''' turns a condition tree into a function that evaluates it given the
+    values of the execution, like this:
+
+    compile_condition(tree)(values)
+
+    which is equivalent to ConditionTransformer(values).transform(tree) but
+    walks the tree only once '''
+    if tree.data in ('or_test', 'and_test', 'comparison'):
+        operands = list(map(compile_condition, tree.children[::2]))
+        ops = [OPERATORS[op.data] for op in tree.children[1::2]]
+
+        if len(operands) == 1:
+            return operands[0]
+
+        if tree.data == 'comparison' and len(operands) > 2:
+            # `a < b < c` would mean `(a < b) < c`, never supported
+            raise ValueError('Chained comparisons are not supported')
+
+        if len(operands) == 2:
+            left, right = operands
+            op = ops[0]
+
+            return lambda values: op(left(values), right(values))
+
+        first = operands[0]
+        rest = list(zip(ops, operands[1:]))
+
+        def fold(values):
+            result = first(values)
+
+            for op, operand in rest:
+                result = op(result, operand(values))
+
+            return result
+
+        return fold
+
+    if tree.data == 'not_test':
+        if len(tree.children) == 1:
+            return compile_condition(tree.children[0])
+
+        operand = compile_condition(tree.children[1])
+
+        return lambda values: not operand(values)
+
+    if tree.data == 'atom_expr':
+        return compile_condition(tree.children[0])
+
+    if tree.data == 'ref':
+        obj_id, member = [
+            variable.children[0][:] for variable in tree.children
+        ]
+
+        return lambda values: values[obj_id][member]
+
+    if tree.data == 'string':
+        string = tree.children[0][1:-1]
+
+        return lambda values: string
+
+    if tree.data == 'number':
+        number = float(tree.children[0])
+
+        return lambda values: number
+
+    raise ValueError('Unexpected {} in condition'.format(tree.data))
+
+
 class ConditionTransformer(Transformer):
     ''' can be used to transform a tree like this:
 
@@ -1,15 +1,20 @@
 from coralillo.errors import ModelNotFoundError
 from datetime import datetime
-from pymongo import MongoClient
 import logging
 import pika
 import simplejson as json
 
+from cacahuate.dedup import DedupStore, new_message_id
 from cacahuate.errors import CannotMove, ElementNotFound, InconsistentState, \
     MisconfiguredProvider, EndOfProcess
-from cacahuate.models import Execution, Pointer, User
+from cacahuate.metrics import tagged, timed
+from cacahuate.profiler import get_profiler, set_process
+from cacahuate.models import Execution, Pointer, User, Transaction, \
+    get_many_by
 from cacahuate.xml import Xml
-from cacahuate.node import make_node, UserAttachedNode
+from cacahuate.node import UserAttachedNode
+from cacahuate.session import Batch, StateSession
+from cacahuate.storage import get_storage
 
 LOGGER = logging.getLogger(__name__)
 
@@ -20,12 +25,39 @@ class Handler:
 
     def __init__(self, config):
         self.config = config
-        self.mongo = None
+        self.storage = None
+        self.dedup = DedupStore(config)
+        self.profiler = get_profiler(config)
+        self.chain_length = config['SYNC_CHAIN_LENGTH']
+
+        if self.chain_length and redelivers(config):
+            # a chained pointer is only known by this worker until its step is
+            # done. If the worker dies meanwhile the message delivered again
+            # finds its own pointer deleted and the execution gets stuck
+            LOGGER.warning(
+                'SYNC_CHAIN_LENGTH is ignored, the queue delivers again the '
+                'messages of dead workers'
+            )
+            self.chain_length = 0
 
     def __call__(self, channel, method, properties, body: bytes):
-        ''' the main callback of cacahuate '''
+        ''' the main callback of cacahuate. Messages already handled are
+        skipped, a message is remembered once it was handled so one that is
+        delivered again while it is being handled is not detected '''
         message = json.loads(body)
+        message_id = getattr(properties, 'message_id', None)
+
+        if self.dedup.seen(message_id):
+            return LOGGER.info('Skipped duplicated message {}'.format(
+                message_id,
+            ))
+
+        with self.profiler.profile():
+            self.handle(message, channel)
 
+        self.dedup.mark(message_id)
+
+    def handle(self, message: dict, channel):
         if message['command'] == 'cancel':
             self.cancel_execution(message)
         elif message['command'] == 'step':
@@ -40,88 +72,117 @@ class Handler:
                 'Unrecognized command {}'.format(message['command'])
             )
 
-        if not self.config['RABBIT_NO_ACK']:
-            channel.basic_ack(delivery_tag=method.delivery_tag)
-
     def call(self, message: dict, channel):
-        pointer, user, input = self.recover_step(message)
-        execution = pointer.proxy.execution.get()
+        with timed('recover_step'):
+            pointer, user, input = self.recover_step(message)
+        chain_length = 0
 
-        xml = Xml.load(self.config, execution.process_name, direct=True)
-        xmliter = iter(xml)
+        while True:
+            qdata = self.step(pointer, user, input, channel)
 
-        node = make_node(xmliter.find(
-            lambda e: e.getAttribute('id') == pointer.node_id
-        ), xmliter)
+            if not qdata:
+                return
 
-        # node's lifetime ends here
-        self.teardown(node, pointer, user, input)
+            pointer, input = qdata
 
-        # compute the next node in the sequence
-        try:
-            next_node, state = self.next(xml, node, execution)
-        except EndOfProcess:
-            # finish the execution
-            return self.finish_execution(execution)
+            # Sync nodes are queued immediatly unless they can be chained to
+            # this step
+            if chain_length >= self.chain_length:
+                return self.queue_step(channel, pointer, input)
 
-        # node's begining of life
-        qdata = self.wakeup(next_node, execution, channel, state)
+            chain_length += 1
+            user = self.get_user('__system__')
 
-        # Sync nodes are queued immediatly
-        if qdata:
-            new_pointer, new_input = qdata
+            LOGGER.debug('Chaining pointer p:{} n:{}'.format(
+                pointer.id,
+                pointer.node_id,
+            ))
 
-            channel.queue_declare(
-                queue=self.config['RABBIT_QUEUE'],
-                durable=True
-            )
+    def step(self, pointer, user, input, channel):
+        ''' moves the execution from the given pointer to the next node. If
+        that node is synchronous returns its pointer and the input computed by
+        its work '''
+        execution = pointer.proxy.execution.get()
 
+        with timed('xml_load'):
+            xml = Xml.load(self.config, execution.process_name, direct=True)
+
+        set_process(xml.id)
+
+        with tagged(process=xml.id):
+            with timed('node_lookup'):
+                node = xml.get_node(pointer.node_id)
+
+            # changes to the execution and to the pointer log are written
+            # once the step is done, even if it fails halfway
+            with StateSession(
+                self.get_storage(), execution.id,
+            ) as session, Batch(
+                self.get_storage(), 'pointer',
+            ) as pointers:
+                with tagged(node_type=node_type(node)):
+                    # node's lifetime ends here
+                    with timed('teardown'):
+                        self.teardown(
+                            node, pointer, user, input, session, pointers,
+                        )
+
+                    # compute the next node in the sequence
+                    try:
+                        with timed('next'):
+                            next_node = self.next(xml, node, session)
+                    except EndOfProcess:
+                        # finish the execution
+                        return self.finish_execution(execution, session)
+
+                # node's begining of life
+                with tagged(node_type=node_type(next_node)), timed('wakeup'):
+                    return self.wakeup(
+                        next_node, execution, channel, session, pointers,
+                    )
+
+    def queue_step(self, channel, pointer, input):
+        with timed('sync_publish'):
             channel.basic_publish(
                 exchange='',
                 routing_key=self.config['RABBIT_QUEUE'],
                 body=json.dumps({
                     'command': 'step',
-                    'pointer_id': new_pointer.id,
+                    'pointer_id': pointer.id,
                     'user_identifier': '__system__',
-                    'input': new_input,
+                    'input': input,
                 }),
                 properties=pika.BasicProperties(
                     delivery_mode=2,
+                    message_id=new_message_id(),
                 ),
             )
 
-    def next(self, xml, node, execution):
+    def next(self, xml, node, session):
         ''' Given a position in the script, return the next position '''
         # Return next node by simple adjacency, works for actions and accepted
         # validations
-
-        collection = self.get_mongo()[
-            self.config['EXECUTION_COLLECTION']
-        ]
-        state = next(collection.find({'id': execution.id}))
-
         try:
             while True:
                 node = node.next(
                     xml,
-                    state,
-                    self.get_mongo(),
+                    session.state,
+                    session,
                     self.config
                 )
 
-                # refresh state because previous call might have changed it
-                state = next(collection.find({'id': execution.id}))
+                state = session.state
 
                 if node.id in state['state']['items']:
                     if state['state']['items'][node.id]['state'] == 'valid':
                         continue
 
-                return node, state
+                return node
         except StopIteration:
             # End of process
             raise EndOfProcess
 
-    def wakeup(self, node, execution, channel, state):
+    def wakeup(self, node, execution, channel, session, pointers):
         ''' Waking up a node often means to notify someone or something about
         the execution, this is the first step in node's lifecycle '''
 
@@ -133,49 +194,46 @@ class Handler:
             execution.id,
         ))
 
-        # mark this node as ongoing
-        exc_col = self.get_mongo()[self.config['EXECUTION_COLLECTION']]
-        exc_col.update_one({
-            'id': execution.id,
-        }, {
-            '$set': {
-                'state.items.{}.state'.format(node.id): 'ongoing',
-            },
-        })
+        state = session.state
 
         # update registry about this pointer
-        ptr_col = self.get_mongo()[self.config['POINTER_COLLECTION']]
-        ptr_col.insert_one(node.pointer_entry(execution, pointer))
+        entry = node.pointer_entry(execution, pointer)
+        pointers.insert_one(entry)
 
-        # notify someone (can raise an exception
-        if isinstance(node, UserAttachedNode):
-            notified_users = self.notify_users(node, pointer, channel, state)
-        else:
-            notified_users = []
+        try:
+            # notify someone (can raise an exception
+            if isinstance(node, UserAttachedNode):
+                notified_users = self.notify_users(
+                    node, pointer, channel, state,
+                )
+            else:
+                notified_users = []
 
-        # do some work (can raise an exception
-        if not node.is_async():
-            input = node.work(self.config, state, channel, self.get_mongo())
-        else:
-            input = []
-
-        # set actors to this pointer (means everything succeeded)
-        ptr_col.update_one({
-            'id': pointer.id,
-        }, {
-            '$set': {
-                'notified_users': notified_users,
-            },
-        })
+            # do some work (can raise an exception
+            if not node.is_async():
+                input = node.work(
+                    self.config, state, channel, self.get_storage(),
+                )
+            else:
+                input = []
+        finally:
+            # mark this node as ongoing. Done after notifying because the
+            # users of an invalidated node are found using its previous state
+            session.set({
+                'state.items.{}.state'.format(node.id): 'ongoing',
+            })
+
+        # set actors to this pointer (means everything succeeded). The entry
+        # is not written yet so it is enough to modify it
+        entry['notified_users'] = notified_users
 
         # nodes with forms are not queued
         if not node.is_async():
             return pointer, input
 
-    def teardown(self, node, pointer, user, input):
+    def teardown(self, node, pointer, user, input, session, pointers):
         ''' finishes the node's lifecycle '''
         execution = pointer.proxy.execution.get()
-        execution.proxy.actors.add(user)
 
         actor_json = {
             '_type': 'actor',
@@ -189,36 +247,24 @@ class Handler:
         }
 
         # update pointer
-        collection = self.get_mongo()[self.config['POINTER_COLLECTION']]
-        collection.update_one({
-            'id': pointer.id,
-        }, {
-            '$set': {
-                'finished_at': datetime.now(),
-                'actors.items.{identifier}'.format(
-                    identifier=user.identifier,
-                ): actor_json,
-            },
+        pointers.update_one(pointer.id, {
+            'finished_at': datetime.now(),
+            'actors.items.{identifier}'.format(
+                identifier=user.identifier,
+            ): actor_json,
         })
 
         values = self.compact_values(input)
 
         # update state
-        collection = self.get_mongo()[
-            self.config['EXECUTION_COLLECTION']
-        ]
-        collection.update_one({
-            'id': execution.id,
-        }, {
-            '$set': {**{
-                'state.items.{node}.state'.format(node=node.id): 'valid',
-                'state.items.{node}.actors.items.{identifier}'.format(
-                    node=node.id,
-                    identifier=user.identifier,
-                ): actor_json,
-                'actors.{}'.format(node.id): user.identifier,
-            }, **values},
-        })
+        session.set({**{
+            'state.items.{node}.state'.format(node=node.id): 'valid',
+            'state.items.{node}.actors.items.{identifier}'.format(
+                node=node.id,
+                identifier=user.identifier,
+            ): actor_json,
+            'actors.{}'.format(node.id): user.identifier,
+        }, **values})
 
         LOGGER.debug('Deleted pointer p:{} n:{} e:{}'.format(
             pointer.id,
@@ -226,24 +272,25 @@ class Handler:
             execution.id,
         ))
 
-        pointer.delete()
+        with Transaction() as transaction:
+            transaction.add(execution, 'actors', user)
+            transaction.delete(pointer)
 
-    def finish_execution(self, execution):
+    def finish_execution(self, execution, session=None):
         """ shuts down this execution and every related object """
-        mongo = self.get_mongo()
-        collection = mongo[self.config['EXECUTION_COLLECTION']]
-        collection.update_one({
-            'id': execution.id,
-        }, {
-            '$set': {
-                'status': 'finished',
-                'finished_at': datetime.now()
-            }
+        if session is None:
+            session = StateSession(self.get_storage(), execution.id)
+
+        session.set({
+            'status': 'finished',
+            'finished_at': datetime.now()
         })
+        session.flush()
 
         LOGGER.debug('Finished e:{}'.format(execution.id))
 
-        execution.delete()
+        with Transaction() as transaction:
+            transaction.delete(execution)
 
     def compact_values(self, input):
         compact = {}
@@ -263,18 +310,16 @@ class Handler:
             if actor['state'] == 'invalid'
         ]
 
-        return list(map(
-            lambda u: User.get_by('identifier', u),
-            users
-        ))
+        return get_many_by(User, 'identifier', users)
 
     def notify_users(self, node, pointer, channel, state):
         node_state = state['state']['items'][node.id]
 
-        if node_state['state'] == 'invalid':
-            users = self.get_invalid_users(node_state)
-        else:
-            users = node.get_actors(self.config, state)
+        with timed('hierarchy'):
+            if node_state['state'] == 'invalid':
+                users = self.get_invalid_users(node_state)
+            else:
+                users = node.get_actors(self.config, state)
 
         if type(users) != list:
             raise MisconfiguredProvider('Provider returned non list')
@@ -286,36 +331,34 @@ class Handler:
                 )
             )
 
-        channel.exchange_declare(
-            exchange=self.config['RABBIT_NOTIFY_EXCHANGE'],
-            exchange_type='direct'
-        )
-
         notified_users = []
 
-        for user in users:
-            notified_users.append(user.to_json())
-
-            user.proxy.tasks.add(pointer)
-
-            mediums = self.get_contact_channels(user)
-
-            for medium, params in mediums:
-                channel.basic_publish(
-                    exchange=self.config['RABBIT_NOTIFY_EXCHANGE'],
-                    routing_key=medium,
-                    body=json.dumps({**{
-                        'data': {
-                            'pointer': pointer.to_json(
-                                include=['*', 'execution']
-                            ),
-                            'cacahuate_url': self.config['GUI_URL'],
-                        },
-                    }, **params}),
-                    properties=pika.BasicProperties(
-                        delivery_mode=2,
-                    ),
-                )
+        with Transaction() as transaction:
+            for user in users:
+                notified_users.append(user.to_json())
+
+                transaction.add(user, 'tasks', pointer)
+
+        pointer_json = pointer.to_json(include=['*', 'execution'])
+
+        with timed('notify_publish'):
+            for user in users:
+                mediums = self.get_contact_channels(user)
+
+                for medium, params in mediums:
+                    channel.basic_publish(
+                        exchange=self.config['RABBIT_NOTIFY_EXCHANGE'],
+                        routing_key=medium,
+                        body=json.dumps({**{
+                            'data': {
+                                'pointer': pointer_json,
+                                'cacahuate_url': self.config['GUI_URL'],
+                            },
+                        }, **params}),
+                        properties=pika.BasicProperties(
+                            delivery_mode=2,
+                        ),
+                    )
 
         LOGGER.debug('Waking up n:{} found users: {}'.format(
             node.id,
@@ -324,14 +367,11 @@ class Handler:
 
         return notified_users
 
-    def get_mongo(self):
-        if self.mongo is None:
-            client = MongoClient(self.config['MONGO_URI'])
-            db = client[self.config['MONGO_DBNAME']]
-
-            self.mongo = db
+    def get_storage(self):
+        if self.storage is None:
+            self.storage = get_storage(self.config)
 
-        return self.mongo
+        return self.storage
 
     def get_contact_channels(self, user: User):
         return [('email', {
@@ -347,9 +387,13 @@ class Handler:
             node_id=node.id,
             name=node.name,
             description=node.description,
-        ).save()
+        )
+
+        with Transaction() as transaction:
+            transaction.save(pointer)
+            transaction.add(pointer, 'execution', execution)
 
-        pointer.proxy.execution.set(execution)
+        pointer.execution = execution
 
         return pointer
 
@@ -361,37 +405,46 @@ class Handler:
         except ModelNotFoundError:
             raise InconsistentState('Queued dead pointer')
 
-        user = User.get_by('identifier', message.get('user_identifier'))
+        return (
+            pointer,
+            self.get_user(message.get('user_identifier')),
+            message['input'],
+        )
+
+    def get_user(self, identifier):
+        user = User.get_by('identifier', identifier)
 
         if user is None:
-            if message.get('user_identifier') == '__system__':
+            if identifier == '__system__':
                 user = User(identifier='__system__', fullname='System').save()
             else:
                 raise InconsistentState('sent identifier of unexisten user')
 
-        return (
-            pointer,
-            user,
-            message['input'],
-        )
+        return user
 
     def cancel_execution(self, message):
         execution = Execution.get_or_exception(message['execution_id'])
 
-        for pointer in execution.proxy.pointers.get():
-            pointer.delete()
+        with Transaction() as transaction:
+            for pointer in execution.proxy.pointers.get():
+                transaction.delete(pointer)
 
-        collection = self.get_mongo()[
-            self.config['EXECUTION_COLLECTION']
-        ]
+            transaction.delete(execution)
 
-        collection.update_one({
-            'id': execution.id,
-        }, {
-            '$set': {
-                'status': 'cancelled',
-                'finished_at': datetime.now()
-            }
+        self.get_storage().update_execution(execution.id, {
+            'status': 'cancelled',
+            'finished_at': datetime.now()
         })
 
-        execution.delete()
+
+def redelivers(config):
+    ''' whether the queue delivers again the messages a worker was handling
+    when it died. Assumed for custom queues '''
+    if config['QUEUE_BACKEND'] == 'rabbit':
+        return not config['RABBIT_NO_ACK']
+
+    return config['QUEUE_BACKEND'] != 'memory'
+
+
+def node_type(node):
+    return type(node).__name__.lower()
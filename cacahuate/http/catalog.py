@@ -0,0 +1,51 @@
+''' Caches the responses that describe the available processes. They can only
+change when the process registry does, so they are built once per registry
+generation and served with an etag '''
+from flask import json, request
+from hashlib import sha1
+from threading import Lock
+
+from cacahuate.http.wsgi import app
+from cacahuate.registry import get_registry
+
+
+class Catalog:
+
+    def __init__(self):
+        self.generation = None
+        self.responses = {}
+        self.lock = Lock()
+
+    def get(self, config, key, build):
+        ''' returns the json body and etag stored under key, calling build to
+        compute the body if it is not cached for the current generation of
+        the registry '''
+        registry = get_registry(config)
+        registry.refresh()
+        generation = (config['XML_PATH'], registry.generation)
+
+        with self.lock:
+            if generation != self.generation:
+                self.generation = generation
+                self.responses = {}
+
+            responses = self.responses
+
+        if key not in responses:
+            body = json.dumps(build())
+            responses[key] = (body, sha1(body.encode()).hexdigest())
+
+        return responses[key]
+
+    def response(self, config, key, build):
+        ''' a response for the cached body, or a 304 if the client already
+        has it '''
+        body, etag = self.get(config, key, build)
+
+        response = app.response_class(
+            body,
+            mimetype='application/json',
+        )
+        response.set_etag(etag)
+
+        return response.make_conditional(request)
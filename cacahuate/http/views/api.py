@@ -1,24 +1,29 @@
 from coralillo.errors import ModelNotFoundError
 from datetime import datetime
 from flask import g
-from flask import request, jsonify, json
+from flask import request, jsonify, json, send_file
 import pika
-import pymongo
 import os
 
+from cacahuate.dedup import new_message_id
 from cacahuate.errors import ProcessNotFound, ElementNotFound, MalformedProcess
+from cacahuate.http.catalog import Catalog
 from cacahuate.http.errors import BadRequest, NotFound, UnprocessableEntity, \
     Forbidden
 from cacahuate.http.middleware import requires_json, requires_auth, \
     pagination
 from cacahuate.http.validation import validate_json, validate_auth
-from cacahuate.http.wsgi import app, mongo
+from cacahuate.http.wsgi import app
 from cacahuate.models import Execution, Pointer
-from cacahuate.rabbit import get_channel
-from cacahuate.xml import Xml, form_to_dict, get_text
-from cacahuate.node import make_node
+from cacahuate.queues import get_queue
+from cacahuate.storage import get_storage
+from cacahuate.xml import Xml
+from cacahuate.node import Validation
 
 
+# cached responses of the process endpoints
+catalog = Catalog()
+
 DATE_FIELDS = [
     'started_at',
     'finished_at',
@@ -50,23 +55,18 @@ def index():
 @app.route('/v1/execution', methods=['GET'])
 @pagination
 def execution_list():
-    collection = mongo.db[app.config['EXECUTION_COLLECTION']]
+    executions = get_storage(app.config).list_executions(g.offset, g.limit)
 
     return jsonify({
-        "data": list(map(
-            json_prepare,
-            collection.find().skip(g.offset).limit(g.limit)
-        )),
+        "data": list(map(json_prepare, executions)),
     })
 
 
 @app.route('/v1/execution/<id>', methods=['GET'])
 def process_status(id):
-    collection = mongo.db[app.config['EXECUTION_COLLECTION']]
+    exc = get_storage(app.config).get_execution(id)
 
-    try:
-        exc = next(collection.find({'id': id}))
-    except StopIteration:
+    if exc is None:
         raise ModelNotFoundError(
             'Specified execution never existed, and never will'
         )
@@ -81,7 +81,7 @@ def process_status(id):
 def delete_process(id):
     execution = Execution.get_or_exception(id)
 
-    channel = get_channel()
+    channel = get_queue(app.config).get_channel()
     channel.basic_publish(
         exchange='',
         routing_key=app.config['RABBIT_QUEUE'],
@@ -91,6 +91,7 @@ def delete_process(id):
         }),
         properties=pika.BasicProperties(
             delivery_mode=2,
+            message_id=new_message_id(),
         ),
     )
 
@@ -119,8 +120,7 @@ def start_process():
             'where': 'request.body.process_name',
         }])
 
-    xmliter = iter(xml)
-    node = make_node(next(xmliter), xmliter)
+    node = xml.get_start_node()
 
     # Check for authorization
     validate_auth(node, g.user)
@@ -128,10 +128,12 @@ def start_process():
     # check if there are any forms present
     input = node.validate_input(request.json)
 
-    # get rabbit channel for process queue
-    channel = get_channel()
+    # get a channel for the process queue
+    channel = get_queue(app.config).get_channel()
 
-    execution = xml.start(node, input, mongo.db, channel, g.user.identifier)
+    execution = xml.start(
+        node, input, get_storage(app.config), channel, g.user.identifier
+    )
 
     return {
         'data': execution.to_json(),
@@ -156,13 +158,9 @@ def continue_process():
         }])
 
     xml = Xml.load(app.config, execution.process_name, direct=True)
-    xmliter = iter(xml)
 
     try:
-        continue_point = make_node(
-            xmliter.find(lambda e: e.getAttribute('id') == node_id),
-            xmliter
-        )
+        continue_point = xml.get_node(node_id)
     except ElementNotFound as e:
         raise BadRequest([{
             'detail': 'node_id is not a valid node',
@@ -190,7 +188,7 @@ def continue_process():
     collected_input = continue_point.validate_input(request.json)
 
     # trigger rabbit
-    channel = get_channel()
+    channel = get_queue(app.config).get_channel()
     channel.basic_publish(
         exchange='',
         routing_key=app.config['RABBIT_QUEUE'],
@@ -202,6 +200,7 @@ def continue_process():
         }),
         properties=pika.BasicProperties(
             delivery_mode=2,
+            message_id=new_message_id(),
         ),
     )
 
@@ -214,19 +213,11 @@ def continue_process():
 def list_process():
     def add_form(xml):
         json_xml = xml.to_json()
-        forms = []
-        xmliter = iter(xml)
-        first_node = next(xmliter)
-        xmliter.parser.expandNode(first_node)
-
-        for form in first_node.getElementsByTagName('form'):
-            forms.append(form_to_dict(form))
-
-        json_xml['form_array'] = forms
+        json_xml['form_array'] = xml.get_node_forms(xml.get_start_node().id)
 
         return json_xml
 
-    return jsonify({
+    return catalog.response(app.config, 'list', lambda: {
         'data': list(filter(
             lambda x: x,
             map(
@@ -237,8 +228,7 @@ def list_process():
     })
 
 
-@app.route('/v1/process/<name>', methods=['GET'])
-def find_process(name):
+def load_process(name):
     version = request.args.get('version', '')
 
     if version:
@@ -247,7 +237,7 @@ def find_process(name):
     process_name = "{}{}".format(name, version)
 
     try:
-        xml = Xml.load(app.config, process_name)
+        return Xml.load(app.config, process_name)
     except ProcessNotFound as e:
         raise NotFound([{
             'detail': '{} process does not exist'
@@ -255,30 +245,25 @@ def find_process(name):
             'where': 'request.body.process_name',
         }])
 
-    return jsonify({
-        'data': xml.to_json()
+
+@app.route('/v1/process/<name>', methods=['GET'])
+def find_process(name):
+    key = 'process:{}:{}'.format(name, request.args.get('version', ''))
+
+    return catalog.response(app.config, key, lambda: {
+        'data': load_process(name).to_json(),
     })
 
 
 @app.route('/v1/process/<name>.xml', methods=['GET'])
 def xml_process(name):
-    version = request.args.get('version', '')
+    xml = load_process(name)
 
-    if version:
-        version = ".{}".format(version)
-
-    process_name = "{}{}".format(name, version)
-
-    try:
-        xml = Xml.load(app.config, process_name)
-    except ProcessNotFound as e:
-        raise NotFound([{
-            'detail': '{} process does not exist'
-                      .format(process_name),
-            'where': 'request.body.process_name',
-        }])
-    ruta = os.path.join(app.config['XML_PATH'], xml.filename)
-    return open(ruta).read(), {'Content-Type': 'text/xml; charset=utf-8'}
+    return send_file(
+        os.path.join(app.config['XML_PATH'], xml.filename),
+        mimetype='text/xml',
+        conditional=True,
+    )
 
 
 @app.route('/v1/activity', methods=['GET'])
@@ -317,32 +302,23 @@ def task_read(id):
         }])
 
     execution = pointer.proxy.execution.get()
-    collection = mongo.db[app.config['EXECUTION_COLLECTION']]
-    state = collection.find_one({
-        'id': execution.id,
-    })
+    state = get_storage(app.config).get_execution(execution.id)
 
     xml = Xml.load(
         app.config,
         execution.process_name,
         direct=True
     )
-    xmliter = iter(xml)
-    node = xmliter.find(lambda e: e.getAttribute('id') == pointer.node_id)
-
-    xmliter.parser.expandNode(node)
+    node = xml.get_node(pointer.node_id)
 
     # Response body
     json_data = pointer.to_json(include=['*', 'execution'])
 
     # Append node info
-    json_data['node_type'] = node.tagName
+    json_data['node_type'] = node.to_json()['type']
 
     # Append forms
-    forms = []
-    for form in node.getElementsByTagName('form'):
-        forms.append(form_to_dict(form))
-    json_data['form_array'] = forms
+    json_data['form_array'] = xml.get_node_forms(pointer.node_id)
 
     # If any append previous work done
     node_state = state['state']['items'][pointer.node_id]
@@ -355,14 +331,9 @@ def task_read(id):
         json_data['prev_work'] = action['forms']
 
     # Append validation
-    if node.tagName == 'validation':
-        deps = list(map(
-            lambda node: get_text(node),
-            node.getElementsByTagName('dep')
-        ))
-
+    if isinstance(node, Validation):
         fields = []
-        for dep in deps:
+        for dep in node.dependencies:
             form_ref, input_name = dep.split('.')
 
             # TODO this could be done in O(log N + K)
@@ -413,62 +384,21 @@ def task_read(id):
 @app.route('/v1/log/<id>', methods=['GET'])
 @pagination
 def list_logs(id):
-    collection = mongo.db[app.config['POINTER_COLLECTION']]
-    node_id = request.args.get('node_id')
-    query = {'execution.id': id}
-
-    if node_id:
-        query['node.id'] = node_id
+    pointers = get_storage(app.config).list_pointers(
+        id, request.args.get('node_id'), g.offset, g.limit,
+    )
 
     return jsonify({
-        "data": list(map(
-            json_prepare,
-            collection.find(query).skip(g.offset).limit(g.limit).sort([
-                ('started_at', pymongo.DESCENDING)
-            ])
-        )),
+        "data": list(map(json_prepare, pointers)),
     })
 
 
 @app.route('/v1/process/<id>/statistics', methods=['GET'])
 def node_statistics(id):
-    collection = mongo.db[app.config['POINTER_COLLECTION']]
-    query = [
-        {"$match": {"process_id": id}},
-        {"$project": {
-            "process_id": "$process_id",
-            "node": "$node.id",
-            "difference_time": {
-                "$subtract": ["$finished_at", "$started_at"],
-            },
-        }},
-        {"$group": {
-            "_id": {"process_id": "$process_id", "node": "$node"},
-            "process_id": {"$first": "$process_id"},
-            "node": {"$first": "$node"},
-            "max": {
-                "$max": {
-                    "$divide": ["$difference_time", 1000],
-                },
-            },
-            "min": {
-                "$min": {
-                    "$divide": ["$difference_time", 1000],
-                },
-            },
-            "average": {
-                "$avg": {
-                    "$divide": ["$difference_time", 1000],
-                },
-            },
-        }},
-
-        {"$sort": {"execution": 1, "node": 1}}
-    ]
     return jsonify({
         "data": list(map(
             json_prepare,
-            collection.aggregate(query)
+            get_storage(app.config).node_statistics(id),
         )),
     })
 
@@ -476,42 +406,9 @@ def node_statistics(id):
 @app.route('/v1/process/statistics', methods=['GET'])
 @pagination
 def process_statistics():
-    collection = mongo.db[app.config['EXECUTION_COLLECTION']]
-    query = [
-        {"$match": {"status": "finished"}},
-        {"$skip": g.offset},
-        {"$limit": g.limit},
-        {"$project": {"difference_time": {
-            "$subtract": ["$finished_at", "$started_at"]
-            }, "process":{"id": "$process.id"},
-        }},
-
-        {"$group": {
-            "_id": "$process.id",
-            "process": {"$first": "$process.id"},
-            "max": {
-                "$max": {
-                    "$divide": ["$difference_time", 1000],
-                },
-            },
-            "min": {
-                "$min": {
-                    "$divide": ["$difference_time", 1000],
-                },
-            },
-            "average": {
-                "$avg": {
-                    "$divide": ["$difference_time", 1000],
-                },
-            },
-
-        }},
-        {"$sort": {"process": 1}},
-    ]
-
     return jsonify({
         "data": list(map(
             json_prepare,
-            collection.aggregate(query)
+            get_storage(app.config).process_statistics(g.offset, g.limit),
         )),
     })
@@ -2,7 +2,6 @@ from flask import Flask
 from flask.logging import default_handler
 from flask_coralillo import Coralillo
 from flask_cors import CORS
-from flask_pymongo import PyMongo
 
 import logging.config
 import os
@@ -32,7 +31,6 @@ cora = Coralillo(app)
 bind_models(cora._engine)
 
 # The database
-mongo = PyMongo(app)
 create_indexes(app.config)
 
 # Url converters
@@ -1,32 +1,222 @@
+from functools import partial
+from queue import Queue
+from threading import Thread
 import logging
 import pika
+import simplejson as json
+import time
 import traceback
 
+from .delivery import Deliveries
 from .handler import Handler
+from .models import Pointer
+from .topology import Topology
 
 LOGGER = logging.getLogger(__name__)
 
 
+class ThreadsafeChannel:
+    ''' Proxy of a channel that can be used from threads other than the
+    connection's. Calls are run by the connection's thread and their results
+    are discarded '''
+
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+
+    def __getattr__(self, name):
+        method = getattr(self.channel, name)
+
+        def call(*args, **kwargs):
+            self.connection.add_callback_threadsafe(
+                partial(method, *args, **kwargs)
+            )
+
+        return call
+
+
+class Lane(Thread):
+    ''' Handles one by one the messages of the executions assigned to it '''
+
+    def __init__(self, config, channel, done=None):
+        super().__init__(daemon=True)
+
+        self.handler = Handler(config)
+        self.channel = channel
+        self.messages = Queue()
+
+        # called with every message once handled and the exception its
+        # handling raised, if any
+        self.done = done
+
+    def run(self):
+        while True:
+            item = self.messages.get()
+
+            if item is None:
+                return
+
+            method, properties, body = item
+            error = None
+
+            try:
+                self.handler(self.channel, method, properties, body)
+            except Exception as e:
+                error = e
+                LOGGER.error(traceback.format_exc())
+            finally:
+                if self.done is not None:
+                    self.done(method, error)
+
+
+class Pool:
+    ''' Distributes the incoming messages among a fixed set of lanes. All
+    the messages of an execution go to the same lane, so they are handled in
+    the order they arrived and never at the same time '''
+
+    def __init__(self, config, size):
+        self.config = config
+        self.size = size
+        self.lanes = []
+
+    def start(self, connection, channel, deliveries=None):
+        done = None
+
+        if deliveries is not None:
+            channel = deliveries.wrap(channel)
+            done = ThreadsafeChannel(connection, deliveries).handled
+
+        self.start_lanes(ThreadsafeChannel(connection, channel), done)
+
+    def start_lanes(self, channel, done=None):
+        ''' the lanes publish using `channel`, which must be safe to use from
+        any thread, and call `done` with every message they handle and the
+        exception it raised '''
+        self.lanes = [
+            Lane(self.config, channel, done) for i in range(self.size)
+        ]
+
+        for lane in self.lanes:
+            lane.start()
+
+    def stop(self):
+        for lane in self.lanes:
+            lane.messages.put(None)
+
+        for lane in self.lanes:
+            lane.join()
+
+    def execution_key(self, body):
+        ''' the id of the execution this message is about, or something
+        unique to it if the execution cannot be found '''
+        try:
+            message = json.loads(body)
+        except ValueError:
+            return body
+
+        if 'execution_id' in message:
+            return message['execution_id']
+
+        pointer = Pointer.get(message.get('pointer_id'))
+
+        if pointer is None:
+            return message.get('pointer_id')
+
+        execution = pointer.proxy.execution.get()
+
+        if execution is None:
+            return pointer.id
+
+        return execution.id
+
+    def __call__(self, channel, method, properties, body: bytes):
+        lane = self.lanes[hash(self.execution_key(body)) % len(self.lanes)]
+        lane.messages.put((method, properties, body))
+
+
 class Loop:
 
-    def __init__(self, config: dict):
+    def __init__(self, config: dict, counter=None):
         self.config = config
         self.handler = Handler(config)
+        self.topology = Topology(config)
+        self.connected = False
+
+        # shared with the supervisor, counts the handled messages
+        self.counter = counter
 
     def start(self):
+        ''' consumes messages, connecting again to the broker whenever the
+        connection is lost '''
+        delay = self.config['RABBIT_RECONNECT_DELAY']
+
+        while True:
+            try:
+                return self.consume()
+            except pika.exceptions.AMQPConnectionError as e:
+                LOGGER.error('Lost connection to the broker: {}'.format(
+                    repr(e),
+                ))
+
+            if self.connected:
+                delay = self.config['RABBIT_RECONNECT_DELAY']
+
+            LOGGER.info('Reconnecting in {}s'.format(delay))
+
+            try:
+                time.sleep(delay)
+            except KeyboardInterrupt:
+                return LOGGER.info('cacahuate stopped')
+
+            delay = min(delay * 2, self.config['RABBIT_MAX_RECONNECT_DELAY'])
+
+    def count(self, callback):
+        def counted(channel, method, properties, body):
+            callback(channel, method, properties, body)
+
+            with self.counter.get_lock():
+                self.counter.value += 1
+
+        return counted
+
+    def consume(self):
+        self.connected = False
+
         connection = pika.BlockingConnection(pika.ConnectionParameters(
             host=self.config['RABBIT_HOST'],
         ))
         channel = connection.channel()
 
-        channel.queue_declare(
-            queue=self.config['RABBIT_QUEUE'],
-            durable=True,
-        )
+        # declared again on every connection
+        self.topology.declare(channel)
         LOGGER.info('Declared queue {}'.format(self.config['RABBIT_QUEUE']))
+        self.connected = True
+
+        channel.basic_qos(
+            prefetch_count=self.config['RABBIT_PREFETCH_COUNT'],
+        )
+
+        pool = None
+        deliveries = None
+        callback = self.handler
+
+        if not self.config['RABBIT_NO_ACK']:
+            deliveries = Deliveries(connection, channel, self.config)
+            deliveries.start()
+
+        if self.config['WORKER_THREADS'] > 1:
+            pool = Pool(self.config, self.config['WORKER_THREADS'])
+            pool.start(connection, channel, deliveries)
+            callback = pool
+
+        if deliveries is not None:
+            callback = self.track(callback, deliveries, pool is not None)
+
+        if self.counter is not None:
+            callback = self.count(callback)
 
         channel.basic_consume(
-            self.handler,
+            callback,
             queue=self.config['RABBIT_QUEUE'],
             consumer_tag=self.config['RABBIT_CONSUMER_TAG'],
             no_ack=self.config['RABBIT_NO_ACK'],
@@ -38,5 +228,51 @@ class Loop:
             channel.start_consuming()
         except KeyboardInterrupt:
             LOGGER.info('cacahuate stopped')
+        except pika.exceptions.AMQPConnectionError:
+            raise
         except Exception as e:
             LOGGER.error(traceback.format_exc())
+        finally:
+            if pool is not None:
+                self.stop_pool(pool, connection, channel, deliveries)
+
+    def track(self, callback, deliveries, threaded):
+        ''' wraps callback to keep track of the messages to acknowledge. In
+        threads the lanes tell when they are done with a message. A message
+        whose handling fails is logged and given to the deliveries with its
+        error like in the lanes, which send it back to the queue or to the
+        dead letter queue '''
+        channel = deliveries.wrap(deliveries.channel)
+
+        def tracked(_, method, properties, body):
+            deliveries.received(method)
+
+            try:
+                callback(channel, method, properties, body)
+            except Exception as e:
+                # in threads a message that could not reach a lane is done
+                LOGGER.error(traceback.format_exc())
+                deliveries.handled(method, e)
+            else:
+                if not threaded:
+                    deliveries.handled(method)
+
+        return tracked
+
+    def stop_pool(self, pool, connection, channel, deliveries=None):
+        ''' waits for the lanes to finish the messages they already have and
+        sends what they published and the acknowledgements '''
+        try:
+            channel.stop_consuming()
+        except Exception:
+            pass
+
+        pool.stop()
+
+        try:
+            connection.process_data_events(time_limit=0)
+
+            if deliveries is not None:
+                deliveries.flush()
+        except Exception:
+            LOGGER.error(traceback.format_exc())
@@ -4,6 +4,7 @@ from coralillo import Engine
 from itacate import Config
 from lark.exceptions import GrammarError, ParseError, LexError
 from xml.dom import pulldom
+import argparse
 import logging
 import logging.config
 import os
@@ -11,19 +12,40 @@ import re
 import sys
 import time
 
+from cacahuate.compiler import CompiledProcess, dump
+from cacahuate.errors import MalformedProcess
 from cacahuate.indexes import create_indexes
-from cacahuate.loop import Loop
+from cacahuate.metrics import start_exporter
 from cacahuate.models import bind_models
+from cacahuate.profiler import get_profiler
+from cacahuate.queues import get_queue
+from cacahuate.supervisor import Supervisor
 from cacahuate.xml import NODES, get_text
 from cacahuate.grammar import Condition
 
 
-def main():
-    # Load the config
+def load_config():
     config = Config(os.path.dirname(os.path.realpath(__file__)))
     config.from_object('cacahuate.settings')
     config.from_envvar('CACAHUATE_SETTINGS', silent=True)
 
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='The cacahuate worker')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='run this many worker processes under a supervisor that '
+             'restarts them when they die',
+    )
+    args = parser.parse_args()
+
+    # Load the config
+    config = load_config()
+
     # Set the timezone
     os.environ['TZ'] = config['TIMEZONE']
     time.tzset()
@@ -31,6 +53,16 @@ def main():
     # Setup logging
     logging.config.dictConfig(config['LOGGING'])
 
+    if args.workers is None:
+        return run_worker(config)
+
+    if args.workers < 1:
+        sys.exit('--workers must be at least 1')
+
+    Supervisor(config, args.workers, run_worker).start()
+
+
+def run_worker(config, counter=None):
     # Load the models
     eng = Engine(
         host=config['REDIS_HOST'],
@@ -42,9 +74,15 @@ def main():
     # Create mongo indexes
     create_indexes(config)
 
-    # start the loop
-    loop = Loop(config)
-    loop.start()
+    # expose the step timings
+    start_exporter(config)
+
+    # SIGUSR2 profiles the messages handled in the next PROFILER_WINDOW
+    # seconds
+    get_profiler(config).install()
+
+    # consume the commands
+    get_queue(config).consume(counter)
 
 
 def rng_path():
@@ -265,5 +303,30 @@ def xml_validate(filename=None):
             passed_nodes.append(node.getAttribute('id'))
 
 
+def xml_compile(filenames=None, config=None):
+    ''' validates the given process files and writes their compiled version
+    next to them, signed with COMPILED_SECRET '''
+    if not filenames:
+        if len(sys.argv) < 2:
+            sys.exit("Must specify at least one file to compile")
+        filenames = sys.argv[1:]
+
+    if config is None:
+        config = load_config()
+
+    if not config['COMPILED_SECRET']:
+        sys.exit('COMPILED_SECRET must be set to sign the compiled files')
+
+    for filename in filenames:
+        xml_validate(filename)
+
+        try:
+            process = CompiledProcess(filename)
+        except MalformedProcess as e:
+            sys.exit('{} {}'.format(filename, str(e)))
+
+        print(dump(process, filename, config['COMPILED_SECRET']))
+
+
 if __name__ == '__main__':
     main()
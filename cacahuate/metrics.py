@@ -0,0 +1,210 @@
+''' Cumulative time spent by the worker in every phase of a step, labeled by
+process and node type, and the state of the mongo connection pools of the
+process. Exposed in prometheus' text format through a small http server or
+written periodically to a file '''
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Lock, Thread, local
+import logging
+import os
+import re
+import time
+
+from cacahuate.mongo import WAIT_BUCKETS, all_pool_stats
+
+LOGGER = logging.getLogger(__name__)
+
+LABELS = ('phase', 'process', 'node_type')
+
+
+class Timings:
+
+    def __init__(self):
+        self.lock = Lock()
+
+        # label values -> [count, seconds]
+        self.values = {}
+
+    def add(self, labels: tuple, seconds: float):
+        with self.lock:
+            value = self.values.setdefault(labels, [0, 0.0])
+            value[0] += 1
+            value[1] += seconds
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+
+    def to_prometheus(self) -> str:
+        with self.lock:
+            values = sorted(self.values.items())
+
+        lines = [
+            '# HELP cacahuate_step_phase_seconds Time spent in every phase '
+            'of a step',
+            '# TYPE cacahuate_step_phase_seconds summary',
+        ]
+
+        for labels, (count, seconds) in values:
+            tags = ','.join(
+                '{}="{}"'.format(name, escape(value))
+                for name, value in zip(LABELS, labels)
+            )
+
+            lines.append('cacahuate_step_phase_seconds_count{{{}}} {}'.format(
+                tags, count,
+            ))
+            lines.append('cacahuate_step_phase_seconds_sum{{{}}} {}'.format(
+                tags, repr(seconds),
+            ))
+
+        return '\n'.join(lines) + '\n'
+
+
+TIMINGS = Timings()
+
+# labels of the current thread
+CONTEXT = local()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def pools_to_prometheus(pools: dict) -> str:
+    ''' the stats of the mongo pools given by `all_pool_stats` '''
+    series = [
+        ('open', 'open_connections', 'gauge', 'Connections open'),
+        ('checked_out', 'checked_out_connections', 'gauge',
+         'Connections checked out'),
+        ('checkouts', 'checkouts_total', 'counter',
+         'Connections checked out since the client was created'),
+        ('failed_checkouts', 'failed_checkouts_total', 'counter',
+         'Connections that could not be checked out'),
+    ]
+    name = 'cacahuate_mongo_pool_{}'
+    lines = []
+
+    # the uri without its credentials
+    tags = {
+        uri: 'uri="{}"'.format(escape(re.sub(r'//[^/@]*@', '//', uri)))
+        for uri in pools
+    }
+
+    for key, metric, kind, description in series:
+        metric = name.format(metric)
+        lines.append('# HELP {} {}'.format(metric, description))
+        lines.append('# TYPE {} {}'.format(metric, kind))
+
+        for uri, stats in sorted(pools.items()):
+            lines.append('{}{{{}}} {}'.format(metric, tags[uri], stats[key]))
+
+    wait = name.format('wait_seconds')
+    lines.append('# HELP {} Time spent waiting to check out a '
+                 'connection'.format(wait))
+    lines.append('# TYPE {} histogram'.format(wait))
+
+    for uri, stats in sorted(pools.items()):
+        count = 0
+
+        for bound, waits in zip(WAIT_BUCKETS + ('+Inf',), stats['waits']):
+            count += waits
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                wait, tags[uri], bound, count,
+            ))
+
+        lines.append('{}_sum{{{}}} {}'.format(
+            wait, tags[uri], repr(stats['wait_time']),
+        ))
+        lines.append('{}_count{{{}}} {}'.format(wait, tags[uri], count))
+
+    return '\n'.join(lines) + '\n'
+
+
+def render() -> str:
+    ''' every metric of this process '''
+    return TIMINGS.to_prometheus() + pools_to_prometheus(all_pool_stats())
+
+
+@contextmanager
+def tagged(**labels):
+    ''' sets the labels of the phases timed inside the block '''
+    previous = getattr(CONTEXT, 'labels', {})
+    CONTEXT.labels = {**previous, **labels}
+
+    try:
+        yield
+    finally:
+        CONTEXT.labels = previous
+
+
+@contextmanager
+def timed(phase):
+    labels = getattr(CONTEXT, 'labels', {})
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        TIMINGS.add(
+            (phase, labels.get('process', ''), labels.get('node_type', '')),
+            time.perf_counter() - started,
+        )
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = render().encode('utf8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def dump(path):
+    ''' writes the metrics to the given file, replacing it at once '''
+    temp = '{}.tmp'.format(path)
+
+    with open(temp, 'w') as f:
+        f.write(render())
+
+    os.replace(temp, path)
+
+
+def start_exporter(config):
+    ''' exposes the metrics of this process as configured '''
+    port = config['METRICS_PORT']
+    path = config['METRICS_FILE']
+
+    if port:
+        try:
+            server = HTTPServer((config['METRICS_HOST'], port), MetricsHandler)
+        except OSError as e:
+            LOGGER.error('Could not serve metrics in port {}: {}'.format(
+                port, e,
+            ))
+        else:
+            Thread(target=server.serve_forever, daemon=True).start()
+            LOGGER.info('Serving metrics in port {}'.format(port))
+
+    if path:
+        path = path.format(pid=os.getpid())
+        interval = config['METRICS_DUMP_INTERVAL']
+
+        def run():
+            while True:
+                time.sleep(interval)
+
+                try:
+                    dump(path)
+                except OSError as e:
+                    LOGGER.error('Could not write metrics: {}'.format(e))
+
+        Thread(target=run, daemon=True).start()
@@ -1,6 +1,8 @@
 import sys
 import inspect
 from coralillo import Model, fields
+from coralillo.datamodel import debyte_string, debyte_hash
+from coralillo.fields import Relation, MultipleRelation
 
 
 class Execution(Model):
@@ -56,6 +58,125 @@ class Token(Model):
     user = fields.ForeignIdRelation(User, inverse='tokens')
 
 
+class Transaction:
+    ''' Groups changes to the models so they are sent to redis in a single
+    MULTI/EXEC, no matter how many objects they touch. Changes are sent when
+    the block ends without errors '''
+
+    def __init__(self, redis=None):
+        self.redis = redis or Pointer.get_redis()
+        self.pipe = self.redis.pipeline(transaction=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def save(self, obj):
+        ''' same as obj.save() '''
+        self.pipe.hset(obj.key(), 'id', obj.id)
+
+        for fieldname, field in obj.proxy:
+            if not isinstance(field, Relation):
+                field.save(getattr(obj, fieldname), self.pipe, commit=False)
+
+        self.pipe.sadd(type(obj).members_key(), obj.id)
+        obj._persisted = True
+
+        return obj
+
+    def add(self, obj, relation, value):
+        ''' relates value to obj through the given relation and its inverse,
+        like obj.proxy.<relation>.add(value) '''
+        field = getattr(obj.proxy, relation)
+        field.relate(value, self.pipe)
+
+        if field.inverse:
+            getattr(value.proxy, field.inverse).relate(obj, self.pipe)
+
+    def delete(self, obj):
+        ''' same as obj.delete() for models whose relations only need to be
+        unlinked. The ids of the related objects are read in one round-trip '''
+        reader = self.redis.pipeline(transaction=False)
+        relations = []
+
+        for fieldname, field in obj.proxy:
+            if not isinstance(field, Relation):
+                continue
+
+            if isinstance(field, MultipleRelation):
+                field.get_related_ids(reader)
+            else:
+                reader.hget(obj.key(), field.name)
+
+            relations.append(field)
+
+        for field, ids in zip(relations, reader.execute()):
+            if not isinstance(field, MultipleRelation):
+                ids = [ids] if ids else []
+
+            if field.inverse:
+                for related_id in map(debyte_string, ids):
+                    related = field.model()(id=related_id)
+                    getattr(related.proxy, field.inverse).unrelate(
+                        obj, self.pipe,
+                    )
+
+            if isinstance(field, MultipleRelation):
+                self.pipe.delete(field.key())
+
+        for fieldname, field in obj.proxy:
+            if not isinstance(field, Relation):
+                field.delete(self.pipe)
+
+        self.pipe.delete(obj.key())
+        self.pipe.srem(type(obj).members_key(), obj.id)
+
+    def execute(self):
+        return self.pipe.execute()
+
+
+def get_many(cls, ids):
+    ''' like cls.get(id) for every id, in one round-trip. Missing objects
+    are returned as None '''
+    redis = cls.get_redis()
+    pipe = redis.pipeline(transaction=False)
+
+    for id in ids:
+        pipe.hgetall('{}:{}:obj'.format(cls.cls_key(), id))
+
+    objs = []
+
+    for id, data in zip(ids, pipe.execute()):
+        if not id or not data:
+            objs.append(None)
+            continue
+
+        obj = cls(id=id)
+        obj._persisted = True
+        data = debyte_hash(data)
+
+        for fieldname, field in obj.proxy:
+            setattr(obj, fieldname, field.recover(data, redis))
+
+        objs.append(obj)
+
+    return objs
+
+
+def get_many_by(cls, field, values):
+    ''' like cls.get_by(field, value) for every value, in two round-trips '''
+    if not values:
+        return []
+
+    redis = cls.get_redis()
+    ids = redis.hmget(cls.cls_key() + ':index_' + field, values)
+
+    return get_many(cls, [debyte_string(id) for id in ids])
+
+
 def bind_models(eng):
     for name, cls in inspect.getmembers(sys.modules[__name__]):
         if inspect.isclass(cls):
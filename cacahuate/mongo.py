@@ -0,0 +1,186 @@
+''' The mongo client shared by everything that runs in a process: the worker,
+the http api and the creation of indexes. Clients are not shared across
+forks, every process that needs one creates its own '''
+from bisect import bisect_left
+from pymongo import MongoClient
+from pymongo.monitoring import ConnectionPoolListener
+from pymongo.write_concern import WriteConcern
+from threading import Lock, local
+import time
+
+from cacahuate.perprocess import per_process
+
+# upper bounds in seconds of the buckets of the checkout wait times
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolStats(ConnectionPoolListener):
+    ''' Keeps count of the connections of a client's pools and of the time
+    spent waiting to check one out '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.waiting = local()
+
+        self.open = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self.failed_checkouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+        # checkouts that waited up to every bucket's bound, the last one for
+        # longer waits
+        self.waits = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def to_json(self):
+        with self.lock:
+            return {
+                'open': self.open,
+                'checked_out': self.checked_out,
+                'checkouts': self.checkouts,
+                'failed_checkouts': self.failed_checkouts,
+                'wait_time': self.wait_time,
+                'max_wait_time': self.max_wait_time,
+                'waits': list(self.waits),
+            }
+
+    def stop_waiting(self):
+        started = getattr(self.waiting, 'started', None)
+        self.waiting.started = None
+
+        if started is None:
+            return 0.0
+
+        return time.monotonic() - started
+
+    def add_wait(self, waited):
+        self.wait_time += waited
+        self.waits[bisect_left(WAIT_BUCKETS, waited)] += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self.lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event):
+        self.waiting.started = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        waited = self.stop_waiting()
+
+        with self.lock:
+            self.failed_checkouts += 1
+            self.add_wait(waited)
+
+    def connection_checked_out(self, event):
+        waited = self.stop_waiting()
+
+        with self.lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.add_wait(waited)
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+
+def client_options(config):
+    options = {
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'],
+        'serverSelectionTimeoutMS':
+            config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        'waitQueueTimeoutMS': config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+        'readPreference': config['MONGO_READ_PREFERENCE'],
+    }
+    options.update(write_concern_options(config['MONGO_WRITE_CONCERN']))
+
+    return {
+        key: value for key, value in options.items() if value is not None
+    }
+
+
+# keys of a write concern document -> the client option that sets them
+WRITE_CONCERN_OPTIONS = {
+    'w': 'w',
+    'wtimeout': 'wTimeoutMS',
+    'j': 'journal',
+    'fsync': 'fsync',
+}
+
+
+def write_concern_options(setting) -> dict:
+    ''' the client options for a write concern given as the arguments of
+    pymongo's WriteConcern, whose names are the same in every version '''
+    try:
+        document = WriteConcern(**setting).document
+    except TypeError as e:
+        raise ValueError('Invalid MONGO_WRITE_CONCERN {}: {}'.format(
+            setting, e,
+        ))
+
+    return {
+        WRITE_CONCERN_OPTIONS[key]: value for key, value in document.items()
+    }
+
+
+@per_process('MONGO_URI')
+def get_entry(config):
+    ''' the client of this process for MONGO_URI and the stats of its
+    pool '''
+    stats = PoolStats()
+    client = MongoClient(
+        config['MONGO_URI'],
+        event_listeners=[stats],
+        **client_options(config)
+    )
+
+    return client, stats
+
+
+def get_client(config) -> MongoClient:
+    ''' the client of this process for MONGO_URI, created on first use '''
+    client, _ = get_entry(config)
+
+    return client
+
+
+def get_db(config):
+    return get_client(config)[config['MONGO_DBNAME']]
+
+
+def pool_stats(config) -> dict:
+    ''' statistics of the connection pool of this process' client '''
+    _, stats = get_entry(config)
+
+    return stats.to_json()
+
+
+def all_pool_stats() -> dict:
+    ''' statistics of the pools of the clients this process created, indexed
+    by MONGO_URI '''
+    return {
+        uri: stats.to_json() for uri, (_, stats) in get_entry.items()
+    }
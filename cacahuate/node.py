@@ -11,7 +11,7 @@ from cacahuate.errors import InconsistentState, MisconfiguredProvider
 from cacahuate.errors import InvalidInputError, InputError, RequiredListError
 from cacahuate.errors import RequiredDictError
 from cacahuate.errors import ValidationErrors, RequiredInputError, EndOfProcess
-from cacahuate.grammar import Condition, ConditionTransformer
+from cacahuate.grammar import Condition, compile_condition
 from cacahuate.http.errors import BadRequest
 from cacahuate.inputs import make_input
 from cacahuate.jsontypes import Map, SortedMap
@@ -105,15 +105,15 @@ class Node:
     def validate_input(self, json_data):
         raise NotImplementedError('Must be implemented in subclass')
 
-    def next(self, xml, state, mongo, config):
+    def next(self, xml, state, session, config):
         # Return next node by simple adjacency
-        xmliter = iter(xml)
-        xmliter.find(lambda e: e.getAttribute('id') == self.id)
+        return xml.get_successor(self.id)
 
-        return make_node(xmliter.next_skipping_elifelse(), xmliter)
-
-    def dependent_refs(self, invalidated, node_state):
-        raise NotImplementedError('Must be implemented in subclass')
+    def dependent_fields(self):
+        ''' returns pairs (dependency, field) for every field of this node
+        that depends on a field of a previous node, both written as
+        `form.input` '''
+        return []
 
     def in_state(self, ref, node_state):
         ''' returns true if this ref is part of this state '''
@@ -129,25 +129,6 @@ class Node:
         except KeyError:
             return False
 
-    def get_invalidated_fields(self, invalidated, state):
-        ''' debe devolver un conjunto de referencias a campos que deben ser
-        invalidados, a partir de campos invalidados previamente '''
-        node_state = state['state']['items'][self.id]
-
-        if node_state['state'] == 'unfilled':
-            return []
-
-        found_refs = []
-
-        for ref in invalidated:
-            # for refs in this node's forms
-            if self.in_state(ref, node_state):
-                found_refs.append(ref)
-
-        found_refs += self.dependent_refs(invalidated, node_state)
-
-        return found_refs
-
     def pointer_entry(self, execution, pointer, notified_users=None):
         return {
             'id': pointer.id,
@@ -312,26 +293,13 @@ class Action(UserAttachedNode):
     def is_async(self):
         return True
 
-    def dependent_refs(self, invalidated, node_state):
-        ''' finds dependencies of the invalidated set in this node '''
-        refs = set()
-        actor = next(iter(node_state['actors']['items'].keys()))
-
-        for dep in invalidated:
-            _, depref = dep.split(':')
-
-            for form in self.form_array:
-                for field in form.inputs:
-                    for dep in field.dependencies:
-                        if depref == dep:
-                            refs.add('{node}.{actor}.0:{form}.{input}'.format(
-                                node=self.id,
-                                actor=actor,
-                                form=form.ref,
-                                input=field.name,
-                            ))
-
-        return refs
+    def dependent_fields(self):
+        return [
+            (dep, '{}.{}'.format(form.ref, field.name))
+            for form in self.form_array
+            for field in form.inputs
+            for dep in field.dependencies
+        ]
 
     def validate_form_spec(self, form_specs, associated_data) -> dict:
         ''' Validates the given data against the spec contained in form.
@@ -442,29 +410,58 @@ class Validation(UserAttachedNode):
     def is_async(self):
         return True
 
-    def next(self, xml, state, mongo, config):
+    def next(self, xml, state, session, config):
         if state['values'][self.id]['response'] == 'accept':
-            return super().next(xml, state, mongo, config)
-
-        # find the data backwards
-        first_node_found = False
-        first_invalid_node = None
-        invalidated = set(
-            i['ref']
-            for i in state['values'][self.id]['inputs']
-        )
-        xmliter = iter(xml)
-
-        for element in xmliter:
-            node = make_node(element, xmliter)
+            return super().next(xml, state, session, config)
+
+        # find the data backwards following the fields that depend on the
+        # rejected ones
+        items = state['state']['items']
+        invalidated = set()
+        invalid_nodes = set()
+        pending = []
+
+        for i in state['values'][self.id]['inputs']:
+            ref = i['ref']
+            node_id = ref.split('.')[0]
+            node_state = items.get(node_id)
+
+            if node_state is not None and \
+                    node_state['state'] != 'unfilled' and \
+                    self.in_state(ref, node_state):
+                invalid_nodes.add(node_id)
+
+            if ref not in invalidated:
+                invalidated.add(ref)
+                pending.append(ref)
+
+        while pending:
+            _, field = pending.pop().split(':')
+
+            for node_id, dependent in xml.get_dependents(field):
+                node_state = items[node_id]
+                actors = node_state['actors']['items']
+
+                if node_state['state'] == 'unfilled' or not actors:
+                    continue
+
+                ref = '{node}.{actor}.0:{field}'.format(
+                    node=node_id,
+                    actor=next(iter(actors)),
+                    field=dependent,
+                )
+                invalid_nodes.add(node_id)
 
-            more_fields = node.get_invalidated_fields(invalidated, state)
+                if ref not in invalidated:
+                    invalidated.add(ref)
+                    pending.append(ref)
 
-            invalidated.update(more_fields)
+        first_invalid_node = None
 
-            if more_fields and not first_node_found:
-                first_node_found = True
-                first_invalid_node = node
+        if invalid_nodes:
+            first_invalid_node = xml.get_node(
+                min(invalid_nodes, key=xml.get_position)
+            )
 
         comment = state['values'][self.id]['comment']
 
@@ -514,14 +511,7 @@ class Validation(UserAttachedNode):
         updates = dict(get_update_keys(invalidated))
 
         # update state
-        collection = mongo[
-            config['EXECUTION_COLLECTION']
-        ]
-        collection.update_one({
-            'id': state['id'],
-        }, {
-            '$set': updates,
-        })
+        session.set(updates)
 
         return first_invalid_node
 
@@ -547,23 +537,12 @@ class Validation(UserAttachedNode):
                 'request.body.inputs.{}.ref'.format(index)
             )
 
-        if not self.in_dependencies(field['ref']):
+        if '{}.{}'.format(ref, input) not in self.dependencies:
             raise InvalidInputError(
                 'inputs.{}.ref'.format(index),
                 'request.body.inputs.{}.ref'.format(index)
             )
 
-    def in_dependencies(self, ref):
-        node, user, form, field = ref.split('.')
-        index, ref = form.split(':')
-        fref = ref + '.' + field
-
-        for dep in self.dependencies:
-            if dep == fref:
-                return True
-
-        return False
-
     def validate_input(self, json_data):
         if 'response' not in json_data:
             raise RequiredInputError('response', 'request.body.response')
@@ -603,19 +582,8 @@ class Validation(UserAttachedNode):
             },
         ])]
 
-    def dependent_refs(self, invalidated, node_state):
-        ''' finds dependencies of the invalidated set in this node '''
-        refs = set()
-        actor = next(iter(node_state['actors']['items'].keys()))
-
-        for inref in invalidated:
-            if self.in_dependencies(inref):
-                refs.add('{node}.{actor}.0:approval.response'.format(
-                    node=self.id,
-                    actor=actor,
-                ))
-
-        return refs
+    def dependent_fields(self):
+        return [(dep, 'approval.response') for dep in self.dependencies]
 
 
 class CallFormInput(Node):
@@ -682,11 +650,9 @@ class Call(FullyContainedNode):
     def is_async(self):
         return False
 
-    def work(self, config, state, channel, mongo):
+    def work(self, config, state, channel, storage):
         xml = Xml.load(config, self.procname)
-
-        xmliter = iter(xml)
-        node = make_node(next(xmliter), xmliter)
+        node = xml.get_start_node()
 
         data = {
             'form_array': [f.render(state['values']) for f in self.forms],
@@ -694,13 +660,10 @@ class Call(FullyContainedNode):
 
         collected_input = node.validate_input(data)
 
-        xml.start(node, collected_input, mongo, channel, '__system__')
+        xml.start(node, collected_input, storage, channel, '__system__')
 
         return []
 
-    def dependent_refs(self, invalidated, node_state):
-        return set()
-
 
 class Exit(FullyContainedNode):
     ''' A node that kills an execution with some status '''
@@ -714,10 +677,10 @@ class Exit(FullyContainedNode):
     def is_async(self):
         return False
 
-    def next(self, xml, state, mongo, config):
+    def next(self, xml, state, session, config):
         raise EndOfProcess
 
-    def work(self, config, state, channel, mongo):
+    def work(self, config, state, channel, storage):
         return []
 
 
@@ -730,26 +693,44 @@ class Conditional(Node):
         self.description = type + ' ' + self.id
 
         self.condition = xmliter.get_next_condition()
+        self.tree = None
+        self.evaluator = None
 
     def is_async(self):
         return False
 
-    def next(self, xml, state, mongo, config):
-        xmliter = iter(xml)
+    def get_tree(self):
+        ''' returns the parsed condition, it is parsed only once per node '''
+        if self.tree is None:
+            self.tree = Condition().parse(self.condition)
+
+        return self.tree
 
-        # consume up to this node
-        ifnode = xmliter.find(lambda e: e.getAttribute('id') == self.id)
+    def evaluate(self, values):
+        ''' evaluates the condition against the values of an execution, the
+        condition is compiled only once per node '''
+        if self.evaluator is None:
+            self.evaluator = compile_condition(self.get_tree())
 
-        if not state['values'][self.id]['condition']:
-            xmliter.expand(ifnode)
+        return self.evaluator(values)
 
-        return make_node(xmliter.next_skipping_elifelse(), xmliter)
+    def __getstate__(self):
+        # compiled conditions cannot be pickled, they are compiled again
+        state = self.__dict__.copy()
+        state['evaluator'] = None
 
-    def work(self, config, state, channel, mongo):
-        tree = Condition().parse(self.condition)
+        return state
 
+    def next(self, xml, state, session, config):
+        # a false condition skips this node's block
+        return xml.get_successor(
+            self.id,
+            past_block=not state['values'][self.id]['condition'],
+        )
+
+    def work(self, config, state, channel, storage):
         try:
-            value = ConditionTransformer(state['values']).transform(tree)
+            value = self.evaluate(state['values'])
         except ValueError as e:
             raise InconsistentState('Could not evaluate condition: {}'.format(
                 str(e)
@@ -764,9 +745,6 @@ class Conditional(Node):
             }
         ])]
 
-    def dependent_refs(self, invalidated, node_state):
-        return set()
-
 
 class If(Conditional):
 
@@ -791,7 +769,7 @@ class Else(Node):
         self.name = 'ELSE ' + self.id
         self.description = 'ELSE ' + self.id
 
-    def work(self, config, state, channel, mongo):
+    def work(self, config, state, channel, storage):
         return [Form.state_json(self.id, [
             {
                 'name': 'condition',
@@ -857,7 +835,7 @@ class Request(FullyContainedNode):
 
         return res_dict
 
-    def work(self, config, state, channel, mongo):
+    def work(self, config, state, channel, storage):
         response = self.make_request(state['values'])
 
         return [Form.state_json(self.id, [
@@ -884,9 +862,6 @@ class Request(FullyContainedNode):
     def is_async(self):
         return False
 
-    def dependent_refs(self, invalidated, node_state):
-        return set()
-
 
 def make_node(element, xmliter) -> Node:
     ''' returns a build Node object given an Element object '''
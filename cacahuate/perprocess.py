@@ -0,0 +1,53 @@
+''' Objects shared by everything that runs in a process, like the mongo client
+or the queue, created on first use. They are never shared across forks, every
+process creates its own '''
+from functools import update_wrapper
+from threading import Lock
+import os
+
+
+class PerProcess:
+    ''' Calls `factory(config)` once per process and per value of the `key`
+    setting, returning the same object afterwards '''
+
+    def __init__(self, factory, key):
+        self.factory = factory
+        self.key = key
+        self.lock = Lock()
+
+        # objects of this process indexed by the value of the setting
+        self.instances = {}
+        self.pid = None
+
+        update_wrapper(self, factory)
+
+    def __call__(self, config):
+        value = config[self.key]
+
+        with self.lock:
+            if self.pid != os.getpid():
+                # inherited from the parent process, must not be used
+                self.instances = {}
+                self.pid = os.getpid()
+
+            if value not in self.instances:
+                self.instances[value] = self.factory(config)
+
+            return self.instances[value]
+
+    def items(self) -> list:
+        ''' the (value, object) pairs created by this process '''
+        with self.lock:
+            if self.pid != os.getpid():
+                return []
+
+            return list(self.instances.items())
+
+
+def per_process(key):
+    ''' decorates a factory that takes the config so it is called once per
+    process and per value of the `key` setting '''
+    def decorator(factory):
+        return PerProcess(factory, key)
+
+    return decorator
@@ -0,0 +1,186 @@
+''' Opt-in profiling of the messages handled by a worker. Every
+PROFILER_EVERY-th message is profiled, and so is every message handled in the
+PROFILER_WINDOW seconds after the worker receives SIGUSR2. The results are
+accumulated per process and written to PROFILER_PATH: collapsed stacks,
+readable by flamegraph.pl and speedscope, or cProfile's stats '''
+from collections import Counter
+from contextlib import contextmanager
+from threading import Event, Lock, Thread, get_ident, local
+import cProfile
+import logging
+import os
+import pstats
+import signal
+import sys
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+# the process of the message profiled in the current thread
+CURRENT = local()
+
+PROFILER = None
+
+
+class StackSampler:
+    ''' Samples the stack of the thread that creates it from another thread.
+    Unlike a SIGPROF based sampler it works outside the main thread '''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = get_ident()
+        self.stacks = Counter()
+        self.stopped = Event()
+        self.thread = Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+
+class CProfiler:
+
+    def __init__(self, interval):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+
+class Profiler:
+
+    def __init__(self, config):
+        self.every = config['PROFILER_EVERY']
+        self.window = config['PROFILER_WINDOW']
+        self.interval = config['PROFILER_INTERVAL']
+        self.path = config['PROFILER_PATH']
+        self.mode = config['PROFILER_MODE']
+
+        self.lock = Lock()
+        self.count = 0
+        self.until = 0
+
+        # process -> collapsed stacks or stats
+        self.results = {}
+
+    def install(self):
+        ''' lets SIGUSR2 start a profiling window, only in the main thread '''
+        signal.signal(signal.SIGUSR2, self.handle_signal)
+
+    def handle_signal(self, signum, frame):
+        self.until = time.monotonic() + self.window
+
+    def should_profile(self):
+        if not self.every and not self.until:
+            return False
+
+        with self.lock:
+            self.count += 1
+            count = self.count
+
+        if self.every and count % self.every == 0:
+            return True
+
+        return time.monotonic() < self.until
+
+    @contextmanager
+    def profile(self):
+        ''' profiles the block if it is its turn '''
+        if not self.should_profile():
+            yield
+            return
+
+        cls = CProfiler if self.mode == 'cprofile' else StackSampler
+        profiler = cls(self.interval)
+        CURRENT.process = None
+
+        try:
+            profiler.start()
+        except ValueError as e:
+            # another profiler is running in this thread
+            LOGGER.warning('Could not profile: {}'.format(e))
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            profiler.stop()
+            self.save(CURRENT.process or 'unknown', profiler)
+
+    def save(self, process, profiler):
+        with self.lock:
+            try:
+                os.makedirs(self.path, exist_ok=True)
+
+                if isinstance(profiler, CProfiler):
+                    self.save_stats(process, profiler.profile)
+                else:
+                    self.save_stacks(process, profiler.stacks)
+            except OSError as e:
+                LOGGER.error('Could not write profile: {}'.format(e))
+
+    def filename(self, process, extension):
+        return os.path.join(self.path, '{}.{}.{}'.format(
+            process, os.getpid(), extension,
+        ))
+
+    def save_stacks(self, process, stacks):
+        total = self.results.setdefault(process, Counter())
+        total.update(stacks)
+
+        with open(self.filename(process, 'collapsed'), 'w') as f:
+            for stack, count in sorted(total.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+    def save_stats(self, process, profile):
+        if process in self.results:
+            self.results[process].add(profile)
+        else:
+            self.results[process] = pstats.Stats(profile)
+
+        self.results[process].dump_stats(self.filename(process, 'prof'))
+
+
+def collapse(frame):
+    ''' the stack ending in frame as `file:function;file:function` from the
+    outermost call '''
+    names = []
+
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(
+            os.path.basename(code.co_filename),
+            code.co_name,
+        ))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+
+def set_process(name):
+    ''' names the process the message profiled in this thread belongs to '''
+    CURRENT.process = name
+
+
+def get_profiler(config) -> Profiler:
+    ''' the profiler of this process '''
+    global PROFILER
+
+    if PROFILER is None:
+        PROFILER = Profiler(config)
+
+    return PROFILER
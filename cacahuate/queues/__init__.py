@@ -0,0 +1,22 @@
+''' The queue that carries the commands for the workers and the notifications
+they publish, chosen with the QUEUE_BACKEND setting. Publishers get an object
+with the `basic_publish` of a pika channel, so the handler works the same with
+every backend. Every process has its own queue, so the memory backend is
+shared by everything that runs in the process '''
+from cacahuate.perprocess import per_process
+from cacahuate.utils import user_import
+
+
+@per_process('QUEUE_BACKEND')
+def get_queue(config):
+    ''' the queue of this process for QUEUE_BACKEND, created on first
+    use '''
+    Queue = user_import(
+        config['QUEUE_BACKEND'],
+        'Queue',
+        config['CUSTOM_QUEUE_BACKENDS'],
+        'cacahuate.queues',
+        config['ENABLED_QUEUE_BACKENDS'],
+    )
+
+    return Queue(config)
@@ -0,0 +1,122 @@
+import logging
+import traceback
+
+from cacahuate.handler import Handler
+from cacahuate.loop import Pool
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Method:
+    ''' What the handler needs from the delivery of a message '''
+
+    def __init__(self, delivery_tag):
+        self.delivery_tag = delivery_tag
+
+
+class QueueChannel:
+    ''' Has the `basic_publish` of a pika channel, so it can be given to the
+    handler and to the http api in its place. Messages published to
+    RABBIT_QUEUE through the default exchange are sent to the workers and the
+    ones published to RABBIT_NOTIFY_EXCHANGE are notifications, routed by
+    medium '''
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.config = queue.config
+
+    def basic_publish(self, exchange, routing_key, body, properties=None,
+                      **kwargs):
+        message_id = getattr(properties, 'message_id', None)
+
+        if exchange == '' and routing_key == self.config['RABBIT_QUEUE']:
+            self.queue.put(body, message_id)
+        elif exchange == self.config['RABBIT_NOTIFY_EXCHANGE']:
+            self.queue.notify(routing_key, body)
+        else:
+            LOGGER.warning('Dropped message to {} {}'.format(
+                exchange, routing_key,
+            ))
+
+        return True
+
+
+class BaseQueue:
+    ''' Carries the commands sent to the workers, step and cancel, and the
+    notifications they publish '''
+
+    def __init__(self, config):
+        self.config = config
+
+    def get_channel(self):
+        ''' an object with the `basic_publish` of a pika channel, shared by
+        all the threads of the process '''
+        return QueueChannel(self)
+
+    def put(self, body, message_id=None):
+        ''' sends a command to the workers '''
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def notify(self, medium, body):
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def get(self):
+        ''' waits for the next command and returns it as `(method,
+        properties, body)`, or None once the queue is stopped '''
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def ack(self, method):
+        ''' the command was handled '''
+        pass
+
+    def handled(self, method, error=None):
+        ''' the command was handled, `error` is what its handling raised. These
+        queues keep no failed commands, they are acknowledged too '''
+        self.ack(method)
+
+    def stop(self):
+        ''' makes `consume` return after the command being handled '''
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def consume(self, counter=None):
+        ''' handles the commands until the queue is stopped, using
+        WORKER_THREADS threads. `counter` is incremented with every message
+        like in Loop '''
+        channel = self.get_channel()
+        pool = None
+        callback = Handler(self.config)
+
+        if self.config['WORKER_THREADS'] > 1:
+            pool = Pool(self.config, self.config['WORKER_THREADS'])
+            pool.start_lanes(channel, self.handled)
+            callback = pool
+
+        LOGGER.info('cacahuate started')
+
+        try:
+            while True:
+                item = self.get()
+
+                if item is None:
+                    break
+
+                method, properties, body = item
+                error = None
+
+                try:
+                    callback(channel, method, properties, body)
+                except Exception as e:
+                    error = e
+                    LOGGER.error(traceback.format_exc())
+                finally:
+                    if pool is None:
+                        self.handled(method, error)
+
+                if counter is not None:
+                    with counter.get_lock():
+                        counter.value += 1
+        except KeyboardInterrupt:
+            LOGGER.info('cacahuate stopped')
+        finally:
+            if pool is not None:
+                pool.stop()
@@ -0,0 +1,52 @@
+from collections import deque
+from itertools import count
+from queue import Queue
+from threading import Lock
+import pika
+
+from cacahuate.queues.base import BaseQueue, Method
+
+
+class MemoryQueue(BaseQueue):
+    ''' Commands are kept in the process and handled by its own threads, so
+    the http api and the workers must run in the same process. Commands not
+    yet handled are lost when it exits. There is nobody to consume the
+    notifications, the last MEMORY_QUEUE_NOTIFICATIONS of every medium are
+    kept in `notifications` '''
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        self.commands = Queue()
+        self.delivery_tags = count(1)
+
+        self.lock = Lock()
+        self.notifications = {}
+
+    def put(self, body, message_id=None):
+        self.commands.put((
+            pika.BasicProperties(delivery_mode=2, message_id=message_id),
+            body,
+        ))
+
+    def notify(self, medium, body):
+        with self.lock:
+            if medium not in self.notifications:
+                self.notifications[medium] = deque(
+                    maxlen=self.config['MEMORY_QUEUE_NOTIFICATIONS'],
+                )
+
+            self.notifications[medium].append(body)
+
+    def get(self):
+        item = self.commands.get()
+
+        if item is None:
+            return None
+
+        properties, body = item
+
+        return Method(next(self.delivery_tags)), properties, body
+
+    def stop(self):
+        self.commands.put(None)
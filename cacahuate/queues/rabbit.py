@@ -0,0 +1,14 @@
+from cacahuate.loop import Loop
+from cacahuate.queues.base import BaseQueue
+from cacahuate.rabbit import get_pool
+
+
+class RabbitQueue(BaseQueue):
+    ''' Commands go to RABBIT_QUEUE and notifications to
+    RABBIT_NOTIFY_EXCHANGE of the broker in RABBIT_HOST '''
+
+    def get_channel(self):
+        return get_pool(self.config)
+
+    def consume(self, counter=None):
+        Loop(self.config, counter).start()
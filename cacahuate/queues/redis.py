@@ -0,0 +1,153 @@
+from collections import deque
+from redis.exceptions import ResponseError
+import logging
+import os
+import pika
+import socket
+
+from cacahuate.models import Pointer
+from cacahuate.queues.base import BaseQueue, Method
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RedisQueue(BaseQueue):
+    ''' Commands are entries of the REDIS_STREAM stream, read by the workers
+    through the REDIS_STREAM_GROUP consumer group. An entry is acknowledged
+    and deleted once handled, the ones a dead worker left pending are claimed
+    by another after REDIS_STREAM_CLAIM_IDLE milliseconds. Notifications are
+    added to a stream per medium named REDIS_NOTIFY_STREAM:<medium>. Uses the
+    redis server of the models '''
+
+    def __init__(self, config, redis=None):
+        super().__init__(config)
+
+        self.stream = config['REDIS_STREAM']
+        self.group = config['REDIS_STREAM_GROUP']
+        self.consumer = '{}-{}'.format(socket.gethostname(), os.getpid())
+        self.redis = redis
+
+        # entries read but not handed yet
+        self.buffer = deque()
+
+        # read this consumer's pending entries before asking for new ones,
+        # starting after this id
+        self.recovering = '0'
+        self.stopped = False
+
+    def get_redis(self):
+        if self.redis is None:
+            self.redis = Pointer.get_redis()
+
+        return self.redis
+
+    def put(self, body, message_id=None):
+        self.get_redis().xadd(self.stream, {
+            'body': body,
+            'message_id': message_id or '',
+        })
+
+    def notify(self, medium, body):
+        self.get_redis().xadd(
+            '{}:{}'.format(self.config['REDIS_NOTIFY_STREAM'], medium),
+            {'body': body},
+            maxlen=self.config['REDIS_NOTIFY_STREAM_MAXLEN'],
+            approximate=True,
+        )
+
+    def create_group(self):
+        try:
+            self.get_redis().xgroup_create(
+                self.stream, self.group, id='0', mkstream=True,
+            )
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def claim(self):
+        ''' takes the entries pending for too long in other consumers '''
+        redis = self.get_redis()
+        idle = self.config['REDIS_STREAM_CLAIM_IDLE']
+
+        pending = [
+            entry['message_id']
+            for entry in redis.xpending_range(
+                self.stream, self.group, '-', '+',
+                self.config['REDIS_STREAM_COUNT'],
+            )
+            if entry['time_since_delivered'] >= idle and
+            entry['consumer'].decode() != self.consumer
+        ]
+
+        if not pending:
+            return
+
+        entries = redis.xclaim(
+            self.stream, self.group, self.consumer, idle, pending,
+        )
+        LOGGER.info('Claimed {} pending messages'.format(len(entries)))
+
+        self.buffer.extend(entries)
+
+    def read(self):
+        if self.recovering:
+            start = self.recovering
+            block = None
+        else:
+            start = '>'
+            block = self.config['REDIS_STREAM_BLOCK']
+
+        response = self.get_redis().xreadgroup(
+            self.group, self.consumer, {self.stream: start},
+            count=self.config['REDIS_STREAM_COUNT'],
+            block=block,
+        )
+        entries = response[0][1] if response else []
+
+        if self.recovering:
+            self.recovering = entries[-1][0] if entries else None
+
+        self.buffer.extend(entries)
+
+        return entries
+
+    def get(self):
+        while not self.buffer:
+            if self.stopped:
+                return None
+
+            if not self.read():
+                # nothing new, check for abandoned entries meanwhile
+                self.claim()
+
+        entry_id, fields = self.buffer.popleft()
+
+        if not fields:
+            # deleted while pending
+            self.ack(Method(entry_id))
+
+            return self.get()
+
+        message_id = fields.get(b'message_id') or None
+
+        if message_id is not None:
+            message_id = message_id.decode()
+
+        return Method(entry_id), pika.BasicProperties(
+            delivery_mode=2,
+            message_id=message_id,
+        ), fields.get(b'body')
+
+    def ack(self, method):
+        pipe = self.get_redis().pipeline()
+        pipe.xack(self.stream, self.group, method.delivery_tag)
+        pipe.xdel(self.stream, method.delivery_tag)
+        pipe.execute()
+
+    def stop(self):
+        self.stopped = True
+
+    def consume(self, counter=None):
+        self.create_group()
+
+        super().consume(counter)
@@ -1,23 +1,143 @@
+''' Channels used by the http api to publish to the broker. They are kept
+open and shared by all the requests handled by a process, like the mongo
+client in cacahuate.mongo '''
+from queue import Empty, LifoQueue
+from threading import Condition
+import logging
 import pika
-from flask import g
 
-from cacahuate.http.wsgi import app
+from cacahuate.perprocess import per_process
+from cacahuate.topology import Topology
 
+LOGGER = logging.getLogger(__name__)
 
-def get_channel():
-    channel = getattr(g, '_channel', None)
 
-    if channel is None:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(
-            host=app.config['RABBIT_HOST'],
+class Publisher:
+    ''' A connection to the broker and the channel used to publish on it '''
+
+    def __init__(self, config):
+        self.connection = pika.BlockingConnection(pika.ConnectionParameters(
+            host=config['RABBIT_HOST'],
+            heartbeat=config['RABBIT_HEARTBEAT'],
         ))
-        channel = connection.channel()
+        self.channel = self.connection.channel()
+
+        Topology(config).declare(self.channel)
+
+        if config['RABBIT_PUBLISHER_CONFIRMS']:
+            self.channel.confirm_delivery()
+
+    def keepalive(self):
+        ''' answers the heartbeats that arrived while the publisher was idle.
+        Raises if the connection is gone '''
+        self.connection.process_data_events(time_limit=0)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+class ChannelPool:
+    ''' Up to `size` publishers shared by the threads of a process. It has the
+    signature of a channel's `basic_publish` so it can be used in its place '''
+
+    def __init__(self, config, size):
+        self.config = config
+        self.size = size
+        self.idle = LifoQueue()
+        self.created = 0
+
+        # notified whenever a publisher is released or discarded
+        self.available = Condition()
+
+    def acquire(self) -> Publisher:
+        while True:
+            try:
+                publisher = self.idle.get_nowait()
+            except Empty:
+                publisher = self.create()
+
+            try:
+                publisher.keepalive()
+            except pika.exceptions.AMQPError as e:
+                LOGGER.warning('Dropped publisher connection: {}'.format(
+                    repr(e),
+                ))
+                self.discard(publisher)
+                continue
+
+            return publisher
+
+    def create(self) -> Publisher:
+        ''' a new publisher if the pool is not full, otherwise waits for one
+        to be released or for room to create it '''
+        with self.available:
+            while self.created >= self.size:
+                try:
+                    return self.idle.get_nowait()
+                except Empty:
+                    self.available.wait()
+
+            self.created += 1
+
+        try:
+            return Publisher(self.config)
+        except Exception:
+            self.forget()
+
+            raise
+
+    def release(self, publisher: Publisher):
+        with self.available:
+            self.idle.put(publisher)
+            self.available.notify()
+
+    def discard(self, publisher: Publisher):
+        publisher.close()
+        self.forget()
+
+    def forget(self):
+        ''' makes room for a new publisher '''
+        with self.available:
+            self.created -= 1
+            self.available.notify()
+
+    def basic_publish(self, **kwargs):
+        ''' publishes using one of the pool's channels. If the connection was
+        lost or the broker did not confirm the message it is sent once more
+        using a new connection '''
+        for attempt in range(2):
+            publisher = self.acquire()
+
+            try:
+                published = publisher.channel.basic_publish(**kwargs)
+
+                if published is False:
+                    # nacked by the broker, older pika versions return it
+                    raise pika.exceptions.NackError([])
+            except pika.exceptions.AMQPError as e:
+                self.discard(publisher)
+
+                if attempt:
+                    raise
+
+                LOGGER.warning('Could not publish, retrying: {}'.format(
+                    repr(e),
+                ))
+                continue
+            except Exception:
+                self.discard(publisher)
+                raise
+
+            self.release(publisher)
 
-        channel.queue_declare(
-            queue=app.config['RABBIT_QUEUE'],
-            durable=True,
-        )
+            return published
 
-        g._channel = channel
 
-    return channel
+@per_process('RABBIT_HOST')
+def get_pool(config) -> ChannelPool:
+    ''' the publisher pool of this process for RABBIT_HOST, created on first
+    use '''
+    return ChannelPool(config, config['RABBIT_PUBLISHER_POOL_SIZE'])
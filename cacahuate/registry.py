@@ -0,0 +1,157 @@
+''' Keeps an index of the processes available in XML_PATH so finding the
+latest version of a process doesn't need to list and sort the directory '''
+from threading import Lock
+import logging
+import os
+import time
+
+from cacahuate import compiler
+from cacahuate.errors import ProcessNotFound, MalformedProcess
+
+LOGGER = logging.getLogger(__name__)
+
+# one registry per process directory
+REGISTRIES = {}
+
+
+class Registry:
+    ''' Index of the process files found in a directory. Files are polled for
+    changes at most every XML_REFRESH_INTERVAL seconds, and only new or changed
+    files are compiled again '''
+
+    def __init__(self, config):
+        self.path = config['XML_PATH']
+        self.interval = config['XML_REFRESH_INTERVAL']
+        self.secret = config['COMPILED_SECRET']
+        self.lock = Lock()
+
+        self.checked_at = None
+
+        # filename -> (stamp, compiled process or the error found compiling it)
+        self.entries = {}
+
+        # process name -> its filenames sorted from the oldest version
+        self.versions = {}
+
+        # changes every time the set of processes or any of them changes
+        self.generation = 0
+
+    def refresh(self):
+        now = time.monotonic()
+
+        if self.checked_at is not None and \
+                now - self.checked_at < self.interval:
+            return
+
+        with self.lock:
+            if self.checked_at is not None and \
+                    now - self.checked_at < self.interval:
+                return
+
+            self.scan()
+            self.checked_at = now
+
+    def scan(self):
+        filenames = [
+            filename for filename in os.listdir(self.path)
+            if len(filename.split('.')) == 3
+        ]
+
+        entries = {}
+        changed = len(filenames) != len(self.entries)
+
+        for filename in filenames:
+            try:
+                stat = os.stat(os.path.join(self.path, filename))
+            except FileNotFoundError:
+                changed = True
+                continue
+
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            entry = self.entries.get(filename)
+
+            if entry is None or entry[0] != stamp:
+                try:
+                    entry = (stamp, compiler.load({
+                        'XML_PATH': self.path,
+                        'COMPILED_SECRET': self.secret,
+                    }, filename))
+                except ProcessNotFound:
+                    changed = True
+                    continue
+                except Exception as e:
+                    # kept for this file only, so it doesn't break the lookup
+                    # of the others. Reported only once, as long as the file
+                    # doesn't change
+                    LOGGER.error('Could not load process {}: {}'.format(
+                        filename, str(e),
+                    ))
+
+                    if not isinstance(e, MalformedProcess):
+                        e = MalformedProcess(str(e))
+
+                    entry = (stamp, e)
+
+                changed = True
+
+            entries[filename] = entry
+
+        if not changed:
+            return
+
+        versions = {}
+
+        for filename in sorted(entries):
+            versions.setdefault(filename.split('.')[0], []).append(filename)
+
+        self.entries = entries
+        self.versions = versions
+        self.generation += 1
+
+    def find(self, name, version=None):
+        ''' returns the requested version of a process, or its latest
+        version if none is given '''
+        self.refresh()
+
+        with self.lock:
+            entries = self.entries
+            filenames = self.versions.get(name, [])
+
+        if version:
+            filenames = [
+                filename for filename in filenames
+                if filename.split('.')[1] == version
+            ]
+
+        if len(filenames) == 0:
+            raise ProcessNotFound(
+                '{}.{}'.format(name, version) if version else name
+            )
+
+        _, process = entries[filenames[-1]]
+
+        if isinstance(process, MalformedProcess):
+            raise MalformedProcess(str(process))
+
+        return process
+
+    def processes(self):
+        ''' iterates over the correctly compiled processes from the latest
+        version of the last process in lexicographical order '''
+        self.refresh()
+
+        with self.lock:
+            entries = self.entries
+
+        for filename in reversed(sorted(entries)):
+            _, process = entries[filename]
+
+            if not isinstance(process, MalformedProcess):
+                yield process
+
+
+def get_registry(config) -> Registry:
+    try:
+        return REGISTRIES[config['XML_PATH']]
+    except KeyError:
+        return REGISTRIES.setdefault(config['XML_PATH'], Registry(config))
@@ -0,0 +1,128 @@
+''' The execution's document as seen by a single step. It is read once, the
+changes made during the step are applied to the local copy and written
+together when the step ends '''
+from copy import deepcopy
+
+from cacahuate.errors import InconsistentState
+
+
+class Batch:
+    ''' Writes to the documents of a kind queued during a step and sent in a
+    single ordered write when it ends. Queued documents can still be modified
+    until then '''
+
+    def __init__(self, storage, kind):
+        self.storage = storage
+        self.kind = kind
+        self.operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def insert_one(self, document: dict):
+        self.operations.append(('insert', document))
+
+    def update_one(self, id, updates: dict):
+        self.operations.append(('update', id, updates))
+
+    def flush(self):
+        if not self.operations:
+            return
+
+        self.storage.write(self.kind, self.operations)
+
+        self.operations = []
+
+
+class StateSession:
+
+    def __init__(self, storage, execution_id):
+        self.storage = storage
+        self.batch = Batch(storage, 'execution')
+        self.execution_id = execution_id
+        self.document = None
+
+        # dotted path -> value, as they will be sent in the $set
+        self.updates = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    @property
+    def state(self):
+        ''' the execution's document including the changes of this step '''
+        if self.document is None:
+            self.document = self.storage.get_execution(self.execution_id)
+
+            if self.document is None:
+                raise InconsistentState(
+                    'execution {} not found'.format(self.execution_id)
+                )
+
+        return self.document
+
+    def set(self, updates: dict):
+        ''' applies the given `$set` to the document and keeps it for the
+        flush. Paths contained in a path already set modify its value, so the
+        final `$set` never has conflicting paths '''
+        for path, value in updates.items():
+            value = deepcopy(value)
+
+            set_path(self.state, path, value)
+
+            if any(path.startswith(key + '.') for key in self.updates):
+                # the pending value is the object just modified
+                continue
+
+            for key in list(self.updates):
+                if key.startswith(path + '.'):
+                    del self.updates[key]
+
+            self.updates[path] = value
+
+    def flush(self):
+        ''' writes the pending changes, if any '''
+        if self.updates:
+            self.batch.update_one(self.execution_id, self.updates)
+
+            self.updates = {}
+
+        self.batch.flush()
+
+
+def set_path(document, path, value):
+    ''' sets value in the given dotted path of the document like mongo's
+    `$set` would, creating the missing documents on the way '''
+    keys = path.split('.')
+    container = document
+
+    for key in keys[:-1]:
+        if isinstance(container, list):
+            index = int(key)
+            pad_list(container, index)
+
+            if container[index] is None:
+                container[index] = {}
+
+            container = container[index]
+        else:
+            container = container.setdefault(key, {})
+
+    key = keys[-1]
+
+    if isinstance(container, list):
+        pad_list(container, int(key))
+        container[int(key)] = value
+    else:
+        container[key] = value
+
+
+def pad_list(items, index):
+    while len(items) <= index:
+        items.append(None)
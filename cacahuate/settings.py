@@ -7,8 +7,128 @@ RABBIT_HOST = 'localhost'
 RABBIT_QUEUE = 'cacahuate_process'
 RABBIT_NOTIFY_EXCHANGE = 'cacahuate_notify'
 RABBIT_CONSUMER_TAG = 'cacahuate_consumer_1'
+
+# Messages are acknowledged on delivery, so the ones a worker was handling
+# when it died are lost. Setting it to False makes the workers acknowledge
+# them once handled, so the broker delivers them again. Messages whose
+# handling failed because mongo, redis or the broker were unavailable are
+# sent back to the queue, those that failed for any other reason go to
+# RABBIT_DEAD_LETTER_QUEUE. Changing it changes the arguments of RABBIT_QUEUE,
+# which must be deleted before the workers and the api declare it again
 RABBIT_NO_ACK = True
 
+# Where the messages whose handling failed are kept when RABBIT_NO_ACK is
+# False, None drops them
+RABBIT_DEAD_LETTER_QUEUE = 'cacahuate_process_failed'
+
+# Messages the broker sends to a worker before it acknowledges them. Only
+# applies when RABBIT_NO_ACK is False
+RABBIT_PREFETCH_COUNT = 10
+
+# Handled messages are acknowledged together, when this many are waiting or
+# every RABBIT_ACK_INTERVAL seconds
+RABBIT_ACK_BATCH_SIZE = 5
+RABBIT_ACK_INTERVAL = 0.5
+
+# Acknowledge a message only once the broker confirmed the messages published
+# while handling it. Only applies when RABBIT_NO_ACK is False. Confirmations
+# are tracked without waiting for them through pika's private channel
+# implementation, if it changes every publish waits for its confirmation
+RABBIT_WORKER_CONFIRMS = True
+
+# Seconds the ids of handled messages are kept to skip them if delivered
+# again, 0 disables the check
+MESSAGE_DEDUP_TTL = 24 * 60 * 60
+
+# Seconds to wait before connecting again to the broker, doubled on every
+# failed attempt up to the maximum
+RABBIT_RECONNECT_DELAY = 1
+RABBIT_MAX_RECONNECT_DELAY = 60
+
+# Connections kept open by every process of the http api to publish messages,
+# shared by all its threads
+RABBIT_PUBLISHER_POOL_SIZE = 4
+
+# Heartbeat timeout in seconds negotiated with the broker by the publishers,
+# None uses the broker's
+RABBIT_HEARTBEAT = 60
+
+# Wait for the broker to confirm every message published by the http api
+RABBIT_PUBLISHER_CONFIRMS = False
+
+# What carries the commands to the workers and their notifications: 'rabbit',
+# 'redis' for streams in the redis server of the models or 'memory' to keep
+# them in the process, only useful when the api and the workers run in a
+# single process
+QUEUE_BACKEND = 'rabbit'
+
+ENABLED_QUEUE_BACKENDS = [
+    'rabbit',
+    'redis',
+    'memory',
+]
+
+# custom queue backends
+CUSTOM_QUEUE_BACKENDS = {
+    # 'name': 'importable.path',
+}
+
+# Streams of the redis queue. Commands are read by the workers in the group,
+# those left pending for REDIS_STREAM_CLAIM_IDLE milliseconds by a worker are
+# handled by another. Notifications go to REDIS_NOTIFY_STREAM:<medium>, which
+# is trimmed to about REDIS_NOTIFY_STREAM_MAXLEN entries
+REDIS_STREAM = 'cacahuate:process'
+REDIS_STREAM_GROUP = 'cacahuate_workers'
+REDIS_STREAM_COUNT = 10
+REDIS_STREAM_BLOCK = 1000
+REDIS_STREAM_CLAIM_IDLE = 5 * 60 * 1000
+REDIS_NOTIFY_STREAM = 'cacahuate:notify'
+REDIS_NOTIFY_STREAM_MAXLEN = 10000
+
+# Notifications of every medium kept by the memory queue
+MEMORY_QUEUE_NOTIFICATIONS = 1000
+
+# Threads handling messages in every worker. Messages of the same execution
+# are always handled in order by the same thread
+WORKER_THREADS = 1
+
+# How many synchronous nodes (conditionals, requests, calls, exits) a worker
+# runs right after the step that reached them instead of queuing them. 0 sends
+# every synchronous node through the queue. Ignored when the queue delivers
+# again the messages of dead workers (the redis queue, or rabbit with
+# RABBIT_NO_ACK = False), a chained node would be lost with its worker
+SYNC_CHAIN_LENGTH = 0
+
+# Time spent by the workers in every phase of a step and the state of their
+# mongo connection pools are exposed in prometheus' text format in this port
+# of METRICS_HOST and/or written every METRICS_DUMP_INTERVAL seconds to
+# METRICS_FILE, where {pid} is replaced by the worker's pid. None disables
+# them. With several workers only one of them can bind the port, use the file
+# instead
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None
+METRICS_FILE = None
+METRICS_DUMP_INTERVAL = 60
+
+# Profile every PROFILER_EVERY-th message handled by a worker, 0 disables it.
+# Sending SIGUSR2 to a worker, or to the supervisor to reach all of them,
+# profiles every message handled in the next PROFILER_WINDOW seconds. The
+# 'sampler' mode writes collapsed stacks taken every PROFILER_INTERVAL
+# seconds, 'cprofile' writes cProfile's stats. Files are named after the
+# process and the worker's pid
+PROFILER_EVERY = 0
+PROFILER_WINDOW = 60
+PROFILER_MODE = 'sampler'
+PROFILER_INTERVAL = 0.005
+PROFILER_PATH = '/tmp/cacahuate-profiles'
+
+# When running `cacahuated --workers N`, seconds to wait before restarting a
+# worker that died, doubled on every consecutive crash up to the maximum, and
+# seconds between reports of the throughput of every worker
+SUPERVISOR_BACKOFF = 1
+SUPERVISOR_MAX_BACKOFF = 60
+SUPERVISOR_REPORT_INTERVAL = 60
+
 # Default logging config
 LOGGING = {
     'version': 1,
@@ -47,12 +167,48 @@ LOGGING = {
     },
 }
 
-# Where to store xml files
+# Where to store xml files. The workers and the api trust everything in this
+# directory: only the users that run them should be able to write to it
 XML_PATH = os.path.join(base_dir, 'xml')
 
+# Key used to sign the compiled processes written by `cacahuate-compile`, and
+# to check them before loading. Compiled files are pickles, loading one that
+# was tampered with runs arbitrary code. None ignores compiled files
+COMPILED_SECRET = None
+
+# Seconds between checks for new or changed files in XML_PATH
+XML_REFRESH_INTERVAL = 2
+
+# Where the documents of executions and pointers are kept. 'memory' keeps them
+# in the process and loses them when it exits, it is only useful when the api
+# and the workers run in a single process
+STORAGE_BACKEND = 'mongo'
+
+ENABLED_STORAGE_BACKENDS = [
+    'mongo',
+    'memory',
+]
+
+# custom storage backends
+CUSTOM_STORAGE_BACKENDS = {
+    # 'name': 'importable.path',
+}
+
 # Mongodb
 MONGO_URI = 'mongodb://localhost/cacahuate'
 MONGO_DBNAME = 'cacahuate'
+
+# Options of the mongo client shared by the whole process, see pymongo's
+# MongoClient. None leaves pymongo's default
+MONGO_MAX_POOL_SIZE = 100
+MONGO_MIN_POOL_SIZE = 0
+MONGO_CONNECT_TIMEOUT_MS = 20000
+MONGO_SERVER_SELECTION_TIMEOUT_MS = 30000
+MONGO_WAIT_QUEUE_TIMEOUT_MS = None
+MONGO_READ_PREFERENCE = 'primary'
+# the arguments of pymongo's WriteConcern, for example
+# {'w': 'majority', 'wtimeout': 5000}
+MONGO_WRITE_CONCERN = {}
 POINTER_COLLECTION = 'pointer'
 EXECUTION_COLLECTION = 'execution'
 
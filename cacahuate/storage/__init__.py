@@ -0,0 +1,20 @@
+''' The storage of the documents of executions and pointers, chosen with the
+STORAGE_BACKEND setting. Like the mongo client every process has its own, so
+the memory backend is shared by everything that runs in the process '''
+from cacahuate.perprocess import per_process
+from cacahuate.utils import user_import
+
+
+@per_process('STORAGE_BACKEND')
+def get_storage(config):
+    ''' the storage of this process for STORAGE_BACKEND, created on first
+    use '''
+    Storage = user_import(
+        config['STORAGE_BACKEND'],
+        'Storage',
+        config['CUSTOM_STORAGE_BACKENDS'],
+        'cacahuate.storage',
+        config['ENABLED_STORAGE_BACKENDS'],
+    )
+
+    return Storage(config)
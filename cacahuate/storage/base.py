@@ -0,0 +1,47 @@
+class BaseStorage:
+    ''' Keeps the documents of the executions and the log of their pointers,
+    the persistent record of what happened in each execution. Documents are
+    dicts, updates are the `$set` of mongo: dotted paths and their values '''
+
+    def __init__(self, config):
+        self.config = config
+
+    def create_indexes(self):
+        pass
+
+    def insert_execution(self, document: dict):
+        self.write('execution', [('insert', document)])
+
+    def get_execution(self, id) -> dict:
+        ''' the document of the given execution or None '''
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def update_execution(self, id, updates: dict):
+        self.write('execution', [('update', id, updates)])
+
+    def list_executions(self, offset=0, limit=None) -> list:
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def insert_pointer(self, document: dict):
+        self.write('pointer', [('insert', document)])
+
+    def list_pointers(self, execution_id, node_id=None, offset=0,
+                      limit=None) -> list:
+        ''' the log of the given execution, the newest pointers first '''
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def write(self, kind: str, operations: list):
+        ''' applies in order the given operations to the documents of `kind`,
+        either 'execution' or 'pointer'. Operations are `('insert',
+        document)` or `('update', id, updates)` '''
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def node_statistics(self, process_id) -> list:
+        ''' max, min and average seconds spent in each node of the given
+        process '''
+        raise NotImplementedError('Must be implemented in subclasses')
+
+    def process_statistics(self, offset=0, limit=None) -> list:
+        ''' max, min and average seconds spent by the finished executions of
+        each process '''
+        raise NotImplementedError('Must be implemented in subclasses')
@@ -0,0 +1,144 @@
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+
+from cacahuate.session import set_path
+from cacahuate.storage.base import BaseStorage
+
+
+class MemoryStorage(BaseStorage):
+    ''' Keeps the documents in this process, they are lost when it exits.
+    Meant for single process deployments, tests and benchmarks. Documents are
+    copied in and out like a mongo client would '''
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        self.lock = Lock()
+
+        # kind -> id -> document, in insertion order
+        self.documents = {
+            'execution': OrderedDict(),
+            'pointer': OrderedDict(),
+        }
+
+    def clear(self):
+        with self.lock:
+            for documents in self.documents.values():
+                documents.clear()
+
+    def get_execution(self, id):
+        with self.lock:
+            document = self.documents['execution'].get(id)
+
+            return deepcopy(document)
+
+    def list_executions(self, offset=0, limit=None):
+        with self.lock:
+            documents = list(self.documents['execution'].values())
+
+            return deepcopy(paginate(documents, offset, limit))
+
+    def list_pointers(self, execution_id, node_id=None, offset=0, limit=None):
+        with self.lock:
+            documents = [
+                document for document in self.documents['pointer'].values()
+                if document['execution']['id'] == execution_id and (
+                    not node_id or document['node']['id'] == node_id
+                )
+            ]
+            documents.sort(key=lambda d: d['started_at'], reverse=True)
+
+            return deepcopy(paginate(documents, offset, limit))
+
+    def write(self, kind, operations):
+        documents = self.documents[kind]
+
+        with self.lock:
+            for operation in operations:
+                if operation[0] == 'insert':
+                    document = deepcopy(operation[1])
+                    documents[document['id']] = document
+
+                    continue
+
+                _, id, updates = operation
+                document = documents.get(id)
+
+                if document is None:
+                    continue
+
+                for path, value in updates.items():
+                    set_path(document, path, deepcopy(value))
+
+    def node_statistics(self, process_id):
+        with self.lock:
+            groups = OrderedDict()
+
+            for document in self.documents['pointer'].values():
+                if document.get('process_id') != process_id:
+                    continue
+
+                node = document['node']['id']
+                groups.setdefault(node, []).append(duration(document))
+
+        return [
+            dict(
+                _id={'process_id': process_id, 'node': node},
+                process_id=process_id,
+                node=node,
+                **summary(durations)
+            ) for node, durations in sorted(groups.items())
+        ]
+
+    def process_statistics(self, offset=0, limit=None):
+        with self.lock:
+            documents = paginate([
+                document for document in self.documents['execution'].values()
+                if document.get('status') == 'finished'
+            ], offset, limit)
+
+            groups = OrderedDict()
+
+            for document in documents:
+                process = (document.get('process') or {}).get('id')
+                groups.setdefault(process, []).append(duration(document))
+
+        return [
+            dict(_id=process, process=process, **summary(durations))
+            for process, durations in sorted(
+                groups.items(), key=lambda item: item[0] or '',
+            )
+        ]
+
+
+def paginate(documents, offset, limit):
+    if limit:
+        return documents[offset:offset + limit]
+
+    return documents[offset:]
+
+
+def duration(document):
+    ''' seconds between the start and the end of the document, None if it
+    has not finished '''
+    if not document.get('finished_at') or not document.get('started_at'):
+        return None
+
+    return (
+        document['finished_at'] - document['started_at']
+    ).total_seconds()
+
+
+def summary(durations):
+    ''' like mongo's $max, $min and $avg, which ignore missing values '''
+    durations = [d for d in durations if d is not None]
+
+    if not durations:
+        return {'max': None, 'min': None, 'average': None}
+
+    return {
+        'max': max(durations),
+        'min': min(durations),
+        'average': sum(durations) / len(durations),
+    }
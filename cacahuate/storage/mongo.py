@@ -0,0 +1,145 @@
+from pymongo import DESCENDING, InsertOne, UpdateOne
+
+from cacahuate.mongo import get_db
+from cacahuate.storage.base import BaseStorage
+
+
+class MongoStorage(BaseStorage):
+    ''' Stores the documents in the EXECUTION_COLLECTION and
+    POINTER_COLLECTION of the process' mongo client '''
+
+    def __init__(self, config):
+        super().__init__(config)
+
+        self.collections = {
+            'execution': config['EXECUTION_COLLECTION'],
+            'pointer': config['POINTER_COLLECTION'],
+        }
+
+    def collection(self, kind):
+        return get_db(self.config)[self.collections[kind]]
+
+    def create_indexes(self):
+        executions = self.collection('execution')
+
+        executions.create_index("id", unique=True)
+        executions.create_index("status")
+        executions.create_index("started_at")
+        executions.create_index("finished_at")
+
+        pointers = self.collection('pointer')
+
+        pointers.create_index("status")
+        pointers.create_index("execution.id")
+        pointers.create_index("started_at")
+        pointers.create_index("finished_at")
+
+    def get_execution(self, id):
+        return self.collection('execution').find_one({'id': id})
+
+    def list_executions(self, offset=0, limit=None):
+        return list(
+            self.collection('execution').find().skip(offset).limit(limit or 0)
+        )
+
+    def list_pointers(self, execution_id, node_id=None, offset=0, limit=None):
+        query = {'execution.id': execution_id}
+
+        if node_id:
+            query['node.id'] = node_id
+
+        return list(
+            self.collection('pointer').find(query).skip(offset).limit(
+                limit or 0
+            ).sort([
+                ('started_at', DESCENDING)
+            ])
+        )
+
+    def write(self, kind, operations):
+        if not operations:
+            return
+
+        self.collection(kind).bulk_write([
+            InsertOne(operation[1]) if operation[0] == 'insert' else
+            UpdateOne({'id': operation[1]}, {'$set': operation[2]})
+            for operation in operations
+        ], ordered=True)
+
+    def node_statistics(self, process_id):
+        query = [
+            {"$match": {"process_id": process_id}},
+            {"$project": {
+                "process_id": "$process_id",
+                "node": "$node.id",
+                "difference_time": {
+                    "$subtract": ["$finished_at", "$started_at"],
+                },
+            }},
+            {"$group": {
+                "_id": {"process_id": "$process_id", "node": "$node"},
+                "process_id": {"$first": "$process_id"},
+                "node": {"$first": "$node"},
+                "max": {
+                    "$max": {
+                        "$divide": ["$difference_time", 1000],
+                    },
+                },
+                "min": {
+                    "$min": {
+                        "$divide": ["$difference_time", 1000],
+                    },
+                },
+                "average": {
+                    "$avg": {
+                        "$divide": ["$difference_time", 1000],
+                    },
+                },
+            }},
+
+            {"$sort": {"execution": 1, "node": 1}}
+        ]
+
+        return list(self.collection('pointer').aggregate(query))
+
+    def process_statistics(self, offset=0, limit=None):
+        query = [
+            {"$match": {"status": "finished"}},
+            {"$skip": offset},
+        ]
+
+        if limit:
+            query.append({"$limit": limit})
+
+        query += [
+            {"$project": {
+                "difference_time": {
+                    "$subtract": ["$finished_at", "$started_at"],
+                },
+                "process": {"id": "$process.id"},
+            }},
+
+            {"$group": {
+                "_id": "$process.id",
+                "process": {"$first": "$process.id"},
+                "max": {
+                    "$max": {
+                        "$divide": ["$difference_time", 1000],
+                    },
+                },
+                "min": {
+                    "$min": {
+                        "$divide": ["$difference_time", 1000],
+                    },
+                },
+                "average": {
+                    "$avg": {
+                        "$divide": ["$difference_time", 1000],
+                    },
+                },
+
+            }},
+            {"$sort": {"process": 1}},
+        ]
+
+        return list(self.collection('execution').aggregate(query))
@@ -0,0 +1,165 @@
+''' Runs several workers as child processes, restarting them when they die '''
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Slot:
+    ''' One of the workers kept alive by the supervisor. The counter of
+    handled messages is kept across restarts '''
+
+    def __init__(self, index, counter):
+        self.index = index
+        self.counter = counter
+        self.process = None
+        self.started_at = None
+        self.failures = 0
+        self.restart_at = 0
+
+        # counter value and time of the last report
+        self.reported = 0
+        self.reported_at = None
+
+
+class Supervisor:
+
+    def __init__(self, config, size, target):
+        self.config = config
+        self.size = size
+        self.target = target
+        self.context = multiprocessing.get_context('fork')
+        self.slots = []
+        self.stopping = False
+
+    def start(self):
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGUSR2, self.forward_signal)
+
+        self.slots = [
+            Slot(i, self.context.Value('L', 0)) for i in range(self.size)
+        ]
+        next_report = time.monotonic() + \
+            self.config['SUPERVISOR_REPORT_INTERVAL']
+
+        try:
+            while not self.stopping:
+                now = time.monotonic()
+
+                for slot in self.slots:
+                    self.check(slot, now)
+
+                if now >= next_report:
+                    self.report(now)
+                    next_report = now + \
+                        self.config['SUPERVISOR_REPORT_INTERVAL']
+
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            LOGGER.info('supervisor stopped')
+        finally:
+            self.stop()
+
+    def handle_signal(self, signum, frame):
+        self.stopping = True
+
+    def forward_signal(self, signum, frame):
+        ''' sends the signal to every worker '''
+        for slot in self.slots:
+            if slot.process is not None and slot.process.is_alive():
+                os.kill(slot.process.pid, signum)
+
+    def check(self, slot, now):
+        if slot.process is None:
+            if now >= slot.restart_at:
+                self.spawn(slot, now)
+
+            return
+
+        if slot.process.is_alive():
+            return
+
+        delay = self.backoff(slot, now)
+
+        LOGGER.error(
+            'worker {} (pid {}) exited with code {}, restarting in {}s'.format(
+                slot.index,
+                slot.process.pid,
+                slot.process.exitcode,
+                delay,
+            )
+        )
+
+        slot.process = None
+        slot.restart_at = now + delay
+
+    def backoff(self, slot, now):
+        ''' seconds to wait before restarting a worker that just died. The
+        delay doubles with every consecutive crash and is reset once a worker
+        lives longer than the maximum delay '''
+        max_delay = self.config['SUPERVISOR_MAX_BACKOFF']
+
+        if now - slot.started_at >= max_delay:
+            slot.failures = 0
+
+        slot.failures += 1
+
+        return min(
+            self.config['SUPERVISOR_BACKOFF'] * 2 ** (slot.failures - 1),
+            max_delay,
+        )
+
+    def run(self, config, counter):
+        ''' runs in the worker, which must not keep the handlers of the
+        supervisor's signals. SIGUSR2 is ignored until the worker's profiler
+        installs its own handler, a forwarded one would kill it while it
+        starts '''
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+
+        self.target(config, counter)
+
+    def spawn(self, slot, now):
+        slot.process = self.context.Process(
+            target=self.run,
+            args=(self.config, slot.counter),
+            name='cacahuated-{}'.format(slot.index),
+        )
+        slot.process.start()
+        slot.started_at = now
+
+        if slot.reported_at is None:
+            slot.reported_at = now
+
+        LOGGER.info('started worker {} (pid {})'.format(
+            slot.index, slot.process.pid,
+        ))
+
+    def report(self, now):
+        for slot in self.slots:
+            handled = slot.counter.value
+            elapsed = now - slot.reported_at
+
+            LOGGER.info(
+                'worker {} (pid {}): {:.2f} messages/s, {} in total'.format(
+                    slot.index,
+                    slot.process.pid if slot.process else None,
+                    (handled - slot.reported) / elapsed if elapsed else 0,
+                    handled,
+                )
+            )
+
+            slot.reported = handled
+            slot.reported_at = now
+
+    def stop(self):
+        for slot in self.slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.process.terminate()
+
+        for slot in self.slots:
+            if slot.process is not None:
+                slot.process.join()
@@ -0,0 +1,50 @@
+''' The queues and exchanges cacahuate publishes to. They are declared once,
+when a channel is opened, so publishing never waits for a declaration '''
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Topology:
+
+    def __init__(self, config):
+        # queue names and their arguments
+        self.queues = [
+            (config['RABBIT_QUEUE'], None),
+        ]
+        dead_letter_queue = config['RABBIT_DEAD_LETTER_QUEUE']
+
+        if not config['RABBIT_NO_ACK'] and dead_letter_queue:
+            # rejected messages are routed by the default exchange to it
+            self.queues = [
+                (config['RABBIT_QUEUE'], {
+                    'x-dead-letter-exchange': '',
+                    'x-dead-letter-routing-key': dead_letter_queue,
+                }),
+                (dead_letter_queue, None),
+            ]
+        self.exchanges = [
+            (config['RABBIT_NOTIFY_EXCHANGE'], 'direct'),
+        ]
+
+    def declare(self, channel):
+        ''' declares everything in the given channel. Must be called again
+        for the channels of a new connection, the broker might have lost the
+        non durable parts '''
+        for queue, arguments in self.queues:
+            channel.queue_declare(
+                queue=queue,
+                durable=True,
+                arguments=arguments,
+            )
+
+        for exchange, exchange_type in self.exchanges:
+            channel.exchange_declare(
+                exchange=exchange,
+                exchange_type=exchange_type,
+            )
+
+        LOGGER.debug('Declared queues {} and exchanges {}'.format(
+            ', '.join(queue for queue, _ in self.queues),
+            ', '.join(exchange for exchange, _ in self.exchanges),
+        ))
@@ -1,15 +1,10 @@
-from collections import deque
 from datetime import datetime
 from jinja2 import Template, TemplateError
-from typing import TextIO, Callable
-from xml.dom import pulldom
-from xml.dom.minidom import Element
-from xml.sax._exceptions import SAXParseException
 import json
-import os
 import pika
 
-from cacahuate.errors import ProcessNotFound, ElementNotFound, MalformedProcess
+from cacahuate.dedup import new_message_id
+from cacahuate.errors import MalformedProcess
 from cacahuate.jsontypes import SortedMap
 from cacahuate.models import Execution, Pointer
 
@@ -35,7 +30,7 @@ NODES = (
 
 class Xml:
 
-    def __init__(self, config, filename):
+    def __init__(self, config, filename, process=None):
         try:
             self.id, self.version, _ = filename.split('.')
         except ValueError:
@@ -47,23 +42,15 @@ class Xml:
         self.filename = filename
         self.config = config
 
-        try:
-            info_node = self.get_info_node()
-        except StopIteration:
-            raise MalformedProcess('This process lacks the process-info node')
+        if process is None:
+            from cacahuate.compiler import load  # noqa
 
-        if info_node.tagName != 'process-info':
-            raise MalformedProcess('process-info node must be the first node')
+            process = load(config, filename)
 
-        for attr, func in XML_ATTRIBUTES.items():
-            try:
-                node = info_node.getElementsByTagName(attr)[0]
-            except IndexError:
-                raise MalformedProcess(
-                    'Process\' metadata lacks node {}'.format(attr)
-                )
+        self.process = process
 
-            setattr(self, attr, func(get_text(node)))
+        for attr, value in self.process.info.items():
+            setattr(self, attr, value)
 
     def get_name(self, collected_forms=[]):
         context = dict()
@@ -86,9 +73,9 @@ class Xml:
     name = property(get_name, set_name)
 
     @classmethod
-    def load(cls, config: dict, common_name: str, direct=False) -> TextIO:
-        ''' Loads an xml file and returns the corresponding TextIOWrapper for
-        further usage. The file might contain multiple versions so the latest
+    def load(cls, config: dict, common_name: str, direct=False) -> 'Xml':
+        ''' Returns the process identified by common_name, backed by its
+        compiled graph. The file might contain multiple versions so the latest
         one is chosen.
 
         common_name is the prefix of the file to find. If multiple files with
@@ -98,31 +85,18 @@ class Xml:
             # skip looking for the most recent version
             return Xml(config, common_name)
 
+        from cacahuate.registry import get_registry  # noqa
+
         try:
             name, version = common_name.split('.')
         except ValueError:
             name, version = common_name, None
 
-        files = reversed(sorted(os.listdir(config['XML_PATH'])))
-
-        for filename in files:
-            try:
-                fname, fversion, _ = filename.split('.')
-            except ValueError:
-                # Process with malformed name, sorry
-                continue
+        process = get_registry(config).find(name, version)
 
-            if fname == name:
-                if version:
-                    if fversion == version:
-                        return Xml(config, filename)
-                else:
-                    return Xml(config, filename)
+        return Xml(config, process.filename, process)
 
-        else:
-            raise ProcessNotFound(common_name)
-
-    def start(self, node, input, mongo, channel, user_identifier):
+    def start(self, node, input, storage, channel, user_identifier):
         # save the data
         execution = Execution(
             process_name=self.filename,
@@ -136,12 +110,10 @@ class Xml:
         ).save()
         pointer.proxy.execution.set(execution)
 
-        # log to mongo
-        collection = mongo[self.config['POINTER_COLLECTION']]
-        collection.insert_one(node.pointer_entry(execution, pointer))
+        # log to the storage
+        storage.insert_pointer(node.pointer_entry(execution, pointer))
 
-        collection = mongo[self.config['EXECUTION_COLLECTION']]
-        collection.insert_one({
+        storage.insert_execution({
             '_type': 'execution',
             'id': execution.id,
             'name': execution.name,
@@ -166,142 +138,65 @@ class Xml:
             }),
             properties=pika.BasicProperties(
                 delivery_mode=2,
+                message_id=new_message_id(),
             ),
         )
 
         return execution
 
-    def make_iterator(self, iterables):
-
-        class Iter():
-
-            def __init__(self, config, filename):
-                self.parser = pulldom.parse(
-                    open(os.path.join(config['XML_PATH'], filename))
-                )
-                self.block_stack = deque()
-
-            def find(self, testfunc: Callable[[Element], bool]) -> Element:
-                ''' Given an interator returned by the previous function, tries
-                to find the first node matching the given condition '''
-                # Since we already consumed the start node on initialization,
-                # this fix is needed for find() to be stable
-                for element in self:
-                    if testfunc(element):
-                        return element
-
-                raise ElementNotFound(
-                    'node matching the given condition was not found'
-                )
-
-            def get_next_condition(self):
-                for event, node in self.parser:
-                    if event != pulldom.START_ELEMENT:
-                        continue
-
-                    if node.tagName != 'condition':
-                        raise ElementNotFound(
-                            'Requested a condition but found {}'.format(
-                                node.tagName
-                            )
-                        )
-
-                    self.parser.expandNode(node)
-
-                    return get_text(node)
-
-                raise ElementNotFound('Condition not found')
+    def get_node(self, node_id):
+        ''' returns the already built node identified by node_id '''
+        return self.process.get_node(node_id)
 
-            def next_skipping_elifelse(self):
-                old_stack = len(self.block_stack)
-                proposed_next = next(self)
-                new_stack = len(self.block_stack)
+    def get_start_node(self):
+        return self.process.get_start_node()
 
-                if new_stack < old_stack:
-                    while proposed_next.tagName in ('elif', 'else'):
-                        self.parser.expandNode(proposed_next)
-                        proposed_next = next(self)
+    def get_successor(self, node_id, past_block=False):
+        ''' returns the node to be executed after node_id, see
+        cacahuate.compiler.Successors '''
+        return self.process.get_successor(node_id, past_block)
 
-                return proposed_next
+    def get_nodes(self):
+        ''' iterates over the built nodes of this process in the order they
+        appear in the xml file '''
+        return iter(self.process.nodes)
 
-            def expand(self, node):
-                self.parser.expandNode(node)
+    def get_node_forms(self, node_id):
+        ''' the forms contained in the given node, as dicts '''
+        return self.process.forms[node_id]
 
-            def __next__(self):
-                try:
-                    for event, node in self.parser:
-                        if event == pulldom.END_ELEMENT and \
-                                node.tagName == 'block':
-                            self.block_stack.pop()
-                        if event == pulldom.START_ELEMENT:
-                            if node.tagName == 'block':
-                                self.block_stack.append(1)
-                            elif node.tagName in iterables:
-                                return node
-                except SAXParseException:
-                    raise MalformedProcess
+    def get_dependents(self, field):
+        ''' the (node id, field) pairs of the fields that depend on the given
+        `form.input` field '''
+        return self.process.get_dependents(field)
 
-                raise StopIteration
-
-            def __iter__(self):
-                return self
-
-        return Iter(self.config, self.filename)
-
-    def get_info_node(self):
-        xmliter = self.make_iterator('process-info')
-        info_node = next(xmliter)
-        xmliter.parser.expandNode(info_node)
-
-        return info_node
-
-    def __iter__(self):
-        ''' Returns an inerator over the nodes and edges of a process defined
-        by the xmlfile descriptor. Uses XMLPullParser so no memory is consumed
-        for this task. '''
-        return self.make_iterator(NODES)
+    def get_position(self, node_id):
+        ''' position of the node in the document '''
+        return self.process.get_position(node_id)
 
     def get_state(self):
-        from cacahuate.node import make_node  # noqa
-
-        xmliter = iter(self)
-        items = []
-
-        for node in xmliter:
-            built_node = make_node(node, xmliter)
-
-            items.append(built_node.get_state())
-
-        return SortedMap(items, key='id').to_json()
+        return SortedMap(
+            [node.get_state() for node in self.get_nodes()],
+            key='id',
+        ).to_json()
 
     @classmethod
     def list(cls, config):
-        # Get all processes
-        files = reversed(sorted(os.listdir(config['XML_PATH'])))
+        from cacahuate.registry import get_registry  # noqa
 
-        # Load only the oldest processes
+        # Load only the latest version of public processes
         processes = []
 
-        for filename in files:
-            try:
-                id, version, _ = filename.split('.')
-            except ValueError:
-                continue
-
-            try:
-                xml = cls.load(config, filename, direct=True)
-            except ProcessNotFound:
-                continue
-            except MalformedProcess:
+        for process in get_registry(config).processes():
+            if not process.info['public']:
                 continue
 
-            if not xml.public:
-                continue
+            xml = cls(config, process.filename, process)
 
-            if len(processes) == 0 or processes[-1].id != id:
+            if len(processes) == 0 or processes[-1].id != xml.id:
                 processes.append(xml)
             else:
-                processes[-1].versions.append(version)
+                processes[-1].versions.append(xml.version)
 
         return processes
 
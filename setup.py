@@ -44,6 +44,8 @@ setup(
         'cacahuate.auth',
         'cacahuate.auth.backends',
         'cacahuate.auth.hierarchy',
+        'cacahuate.queues',
+        'cacahuate.storage',
     ],
 
     package_data={
@@ -55,13 +57,15 @@ setup(
             'cacahuated = cacahuate.main:main',
             'xml_validate = cacahuate.main:xml_validate',
             'rng_path = cacahuate.main:rng_path',
+            'cacahuate-compile = cacahuate.main:xml_compile',
+            'cacahuate-embedded = cacahuate.embedded:main',
         ],
     },
 
     install_requires=[
         'Flask-Coralillo',
         'Flask-Cors',
-        'Flask_PyMongo < 2.0',
+        'pymongo >= 3.9',
         'case_conversion',
         'coralillo >= 0.8',
         'flask >= 1.0',
@@ -74,6 +78,15 @@ setup(
         'passlib',
     ],
 
+    extras_require={
+        # the end to end benchmark runs the models on fakeredis, whose lua
+        # support needs lupa
+        'bench': [
+            'fakeredis[lua]',
+            'lupa',
+        ],
+    },
+
     setup_requires=[
         'pytest-runner',
     ],
@@ -844,6 +844,38 @@ def test_read_process(client):
     assert data['errors'][0]['detail'] == 'prueba process does not exist'
 
 
+def test_list_processes_etag(client):
+    res = client.get('/v1/process')
+
+    assert res.status_code == 200
+    assert res.headers['ETag']
+
+    res = client.get('/v1/process', headers={
+        'If-None-Match': res.headers['ETag'],
+    })
+
+    assert res.status_code == 304
+    assert res.data == b''
+
+
+def test_read_process_etag(client):
+    res = client.get('/v1/process/oldest?version=2018-02-14')
+    etag = res.headers['ETag']
+
+    res = client.get('/v1/process/oldest?version=2018-02-14', headers={
+        'If-None-Match': etag,
+    })
+
+    assert res.status_code == 304
+
+    res = client.get('/v1/process/oldest', headers={
+        'If-None-Match': etag,
+    })
+
+    assert res.status_code == 200
+    assert json.loads(res.data)['data']['version'] == '2018-02-17'
+
+
 def test_list_activities_requires(client):
     res = client.get('/v1/activity')
 
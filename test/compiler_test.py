@@ -0,0 +1,203 @@
+import os
+import pytest
+import shutil
+
+from cacahuate.compiler import load, CACHE, Successors, CompiledProcess, \
+    dump, read, COMPILED_SUFFIX
+from cacahuate.errors import ElementNotFound, ProcessNotFound
+from cacahuate.node import Action, If
+from cacahuate.xml import Xml
+
+
+def test_compiled_nodes(config):
+    process = load(config, 'else.2018-07-10.xml')
+
+    assert [node.id for node in process.nodes] == [
+        'start_node',
+        'condition01',
+        'action01',
+        'elif01',
+        'action02',
+        'else01',
+        'action03',
+    ]
+
+    node = process.get_node('condition01')
+
+    assert isinstance(node, If)
+    assert node.condition == 'secret01.password == "incorrect!"'
+
+    assert isinstance(process.get_start_node(), Action)
+
+    with pytest.raises(ElementNotFound):
+        process.get_node('nones')
+
+
+def test_compiled_forms(config):
+    process = load(config, 'simple.2018-02-19.xml')
+
+    assert process.forms['start_node'] == [{
+        'ref': 'start_form',
+        'inputs': [{
+            'type': 'text',
+            'name': 'data',
+            'required': True,
+            'label': 'Info',
+        }],
+    }]
+
+
+def test_successors(config):
+    process = load(config, 'else.2018-07-10.xml')
+
+    assert process.successors == {
+        'start_node': Successors('condition01', 'condition01'),
+        'condition01': Successors('action01', 'elif01'),
+        'action01': Successors(None, None),
+        'elif01': Successors('action02', 'else01'),
+        'action02': Successors(None, None),
+        'else01': Successors('action03', None),
+        'action03': Successors(None, None),
+    }
+
+    assert process.get_successor('condition01').id == 'action01'
+    assert process.get_successor('condition01', past_block=True).id == \
+        'elif01'
+
+    with pytest.raises(StopIteration):
+        process.get_successor('action02')
+
+
+def test_successors_nested(config):
+    process = load(config, 'anidated-conditions.2018-05-17.xml')
+
+    assert process.get_successor('d').id == 'e'
+    assert process.get_successor('inner2', past_block=True).id == 'e'
+
+
+def test_cache_is_reused(config):
+    first = Xml.load(config, 'simple.2018-02-19.xml', direct=True)
+    second = Xml.load(config, 'simple.2018-02-19.xml', direct=True)
+
+    assert first is not second
+    assert first.process is second.process
+    assert first.get_node('mid_node') is second.get_node('mid_node')
+
+
+def test_cache_refreshes_on_change(config, tmpdir):
+    shutil.copy(
+        os.path.join(config['XML_PATH'], 'simple.2018-02-19.xml'),
+        str(tmpdir),
+    )
+    config['XML_PATH'] = str(tmpdir)
+
+    first = load(config, 'simple.2018-02-19.xml')
+    path = os.path.join(str(tmpdir), 'simple.2018-02-19.xml')
+
+    with open(path) as f:
+        contents = f.read()
+
+    with open(path, 'w') as f:
+        f.write(contents.replace('Primer paso', 'Paso cero'))
+
+    second = load(config, 'simple.2018-02-19.xml')
+
+    assert second is not first
+    assert second.get_node('start_node').name == 'Paso cero'
+    assert CACHE[path] is second
+
+
+def test_load_not_found(config):
+    with pytest.raises(ProcessNotFound):
+        load(config, 'nones.2018-01-01.xml')
+
+
+def test_compiled_conditions(config):
+    process = load(config, 'condition.2018-05-17.xml')
+
+    for node in process.nodes:
+        if isinstance(node, If):
+            assert node.tree is not None
+
+
+def test_compiled_file(config, tmpdir, mocker):
+    shutil.copy(
+        os.path.join(config['XML_PATH'], 'else.2018-07-10.xml'),
+        str(tmpdir),
+    )
+    config['XML_PATH'] = str(tmpdir)
+    config['COMPILED_SECRET'] = 'secret'
+    path = os.path.join(str(tmpdir), 'else.2018-07-10.xml')
+
+    assert dump(CompiledProcess(path), path, 'secret') == \
+        path + COMPILED_SUFFIX
+
+    mocker.patch('cacahuate.compiler.minidom.parse')
+
+    process = load(config, 'else.2018-07-10.xml')
+
+    assert process.filename == 'else.2018-07-10.xml'
+    assert process.get_successor('condition01', past_block=True).id == \
+        'elif01'
+    assert process.get_node('condition01').tree is not None
+
+
+def test_compiled_file_outdated(config, tmpdir):
+    shutil.copy(
+        os.path.join(config['XML_PATH'], 'simple.2018-02-19.xml'),
+        str(tmpdir),
+    )
+    path = os.path.join(str(tmpdir), 'simple.2018-02-19.xml')
+
+    dump(CompiledProcess(path), path, 'secret')
+
+    with open(path, 'a') as f:
+        f.write('\n')
+
+    assert read(path, 'secret') is None
+
+
+def test_compiled_file_corrupted(config, tmpdir):
+    shutil.copy(
+        os.path.join(config['XML_PATH'], 'simple.2018-02-19.xml'),
+        str(tmpdir),
+    )
+    path = os.path.join(str(tmpdir), 'simple.2018-02-19.xml')
+    compiled_path = dump(CompiledProcess(path), path, 'secret')
+
+    with open(compiled_path, 'ab') as f:
+        f.write(b'nones')
+
+    assert read(path, 'secret') is None
+
+    with open(compiled_path, 'wb') as f:
+        f.write(b'nones')
+
+    assert read(path, 'secret') is None
+
+
+def test_compiled_file_signed(config, tmpdir):
+    shutil.copy(
+        os.path.join(config['XML_PATH'], 'simple.2018-02-19.xml'),
+        str(tmpdir),
+    )
+    path = os.path.join(str(tmpdir), 'simple.2018-02-19.xml')
+
+    dump(CompiledProcess(path), path, 'secret')
+
+    assert read(path, 'secret') is not None
+
+    # signed with another key or not checked at all
+    assert read(path, 'other') is None
+    assert read(path, None) is None
+
+
+def test_dependents(config):
+    process = load(config, 'validation-reloaded.2018-05-17.xml')
+
+    assert process.get_dependents('form1.task') == [
+        ('node2', 'form2.task'),
+        ('node4', 'approval.response'),
+    ]
+    assert process.get_dependents('form3.task') == []
+    assert process.get_position('node4') == 3
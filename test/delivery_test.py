@@ -0,0 +1,157 @@
+from redis.exceptions import ConnectionError
+from unittest.mock import MagicMock, call
+import pika
+
+from cacahuate.delivery import Deliveries, enable_confirms
+
+
+def method(tag):
+    return MagicMock(delivery_tag=tag)
+
+
+def confirm(tag, multiple=False, nack=False):
+    cls = pika.spec.Basic.Nack if nack else pika.spec.Basic.Ack
+
+    return MagicMock(method=cls(delivery_tag=tag, multiple=multiple))
+
+
+def make_deliveries(config, **settings):
+    config['RABBIT_ACK_BATCH_SIZE'] = 3
+    config.update(settings)
+
+    connection = MagicMock()
+    channel = MagicMock()
+    deliveries = Deliveries(connection, channel, config)
+    deliveries.start()
+
+    return deliveries
+
+
+def publish(deliveries, times=1):
+    channel = deliveries.wrap(deliveries.channel)
+
+    for i in range(times):
+        channel.basic_publish(exchange='', routing_key='q', body='')
+
+
+def test_batched_ack(config):
+    deliveries = make_deliveries(config, RABBIT_WORKER_CONFIRMS=False)
+    channel = deliveries.channel
+
+    for tag in (1, 2, 3):
+        deliveries.received(method(tag))
+
+    deliveries.handled(method(2))
+    deliveries.handled(method(3))
+
+    channel.basic_ack.assert_not_called()
+
+    deliveries.handled(method(1))
+
+    channel.basic_ack.assert_called_once_with(delivery_tag=3, multiple=True)
+    assert not deliveries.pending
+
+
+def test_ack_on_interval(config):
+    deliveries = make_deliveries(config, RABBIT_WORKER_CONFIRMS=False)
+    channel = deliveries.channel
+
+    deliveries.received(method(1))
+    deliveries.handled(method(1))
+
+    channel.basic_ack.assert_not_called()
+
+    delay, tick = deliveries.connection.call_later.call_args[0]
+    assert delay == config['RABBIT_ACK_INTERVAL']
+
+    tick()
+
+    channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+    assert deliveries.connection.call_later.call_count == 2
+
+
+def test_ack_waits_for_confirms(config):
+    deliveries = make_deliveries(config, RABBIT_ACK_BATCH_SIZE=1)
+    channel = deliveries.channel
+
+    channel._impl.confirm_delivery.assert_called_once()
+
+    deliveries.received(method(1))
+    publish(deliveries, 2)
+    deliveries.handled(method(1))
+
+    channel.basic_ack.assert_not_called()
+
+    deliveries.on_confirm(confirm(1))
+    deliveries.flush()
+
+    channel.basic_ack.assert_not_called()
+
+    deliveries.on_confirm(confirm(2, multiple=True))
+    flush = deliveries.connection.add_callback_threadsafe.call_args[0][0]
+    flush()
+
+    channel.basic_ack.assert_called_once_with(delivery_tag=1, multiple=True)
+
+
+def test_requeue_nacked(config):
+    deliveries = make_deliveries(config)
+    channel = deliveries.channel
+
+    for tag in (1, 2, 3):
+        deliveries.received(method(tag))
+        publish(deliveries)
+        deliveries.handled(method(tag))
+
+    deliveries.on_confirm(confirm(1))
+    deliveries.on_confirm(confirm(2, nack=True))
+    deliveries.on_confirm(confirm(3))
+    deliveries.flush()
+
+    assert [
+        c for c in channel.method_calls if c[0] in ('basic_ack', 'basic_nack')
+    ] == [
+        call.basic_ack(delivery_tag=1, multiple=True),
+        call.basic_nack(delivery_tag=2, requeue=True),
+        call.basic_ack(delivery_tag=3, multiple=True),
+    ]
+    assert not deliveries.nacked
+
+
+def test_reject_failed(config):
+    deliveries = make_deliveries(config, RABBIT_WORKER_CONFIRMS=False)
+    channel = deliveries.channel
+
+    for tag in (1, 2, 3, 4):
+        deliveries.received(method(tag))
+
+    deliveries.handled(method(1))
+    deliveries.handled(method(2), ConnectionError())
+    deliveries.handled(method(3), KeyError('form'))
+    deliveries.handled(method(4))
+    deliveries.flush()
+
+    assert [
+        c for c in channel.method_calls if c[0] in ('basic_ack', 'basic_nack')
+    ] == [
+        call.basic_ack(delivery_tag=1, multiple=True),
+        call.basic_nack(delivery_tag=2, requeue=True),
+        call.basic_nack(delivery_tag=3, requeue=False),
+        call.basic_ack(delivery_tag=4, multiple=True),
+    ]
+
+
+def test_confirms_fallback(config):
+    channel = MagicMock()
+    channel._impl.confirm_delivery.side_effect = TypeError('unexpected')
+
+    assert enable_confirms(channel, None) is False
+    channel.confirm_delivery.assert_called_once_with()
+
+    deliveries = make_deliveries(config)
+    deliveries.channel._impl.confirm_delivery.side_effect = TypeError
+    deliveries.start()
+
+    # publishes already waited for their confirms
+    assert deliveries.confirms is False
+    assert deliveries.wrap(deliveries.channel) is deliveries.channel
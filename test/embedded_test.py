@@ -0,0 +1,48 @@
+import simplejson as json
+
+from cacahuate.embedded import Embedded
+from cacahuate.http.wsgi import app
+from cacahuate.models import Execution
+from cacahuate.queues import get_queue
+
+from .utils import make_auth, make_user
+
+
+def test_steps_handled_in_process(client, config, mocker, mongo):
+    mocker.patch.dict(app.config)
+    mocker.patch.object(get_queue, 'instances', {})
+
+    embedded = Embedded(app, 2)
+    embedded.start()
+
+    juan = make_user('juan', 'Juan')
+
+    res = client.post('/v1/execution', headers={**{
+        'Content-Type': 'application/json',
+    }, **make_auth(juan)}, data=json.dumps({
+        'process_name': 'simple',
+        'form_array': [{
+            'ref': 'start_form',
+            'data': {
+                'data': 'yes',
+            },
+        }],
+    }))
+
+    assert res.status_code == 201
+
+    embedded.stop()
+
+    execution = Execution.get_all()[0]
+    ptr = execution.proxy.pointers.get()[0]
+
+    assert ptr.node_id == 'mid_node'
+
+    # the assigned user was notified through the same queue
+    assert len(embedded.queue.notifications['email']) == 1
+
+    state = mongo[config['EXECUTION_COLLECTION']].find_one({
+        'id': execution.id,
+    })
+
+    assert state['values']['start_form']['data'] == 'yes'
@@ -1,4 +1,8 @@
-from cacahuate.grammar import Condition, ConditionTransformer
+from lark.exceptions import VisitError
+import pytest
+
+from cacahuate.grammar import Condition, ConditionTransformer, \
+    compile_condition
 
 
 def test_condition():
@@ -108,3 +112,72 @@ def test_everything():
 
     tree = Condition().parse('!!3<0 || !(form.input == "0" && ("da" != "de"))')
     assert ConditionTransformer(values).transform(tree) is True
+
+
+def test_compiled_condition():
+    values = {
+        'form': {
+            'input': 'no',
+            'number': 2,
+            'yes': True,
+            'no': False,
+        },
+    }
+
+    cases = [
+        'form.input == "no"',
+        'form.input != "no"',
+        'form.number > 1',
+        'form.number <= 1.5',
+        '!form.yes',
+        '!!form.yes && !form.no',
+        'form.yes || form.no',
+        '!!3<0 || !(form.input == "0" && ("da" != "de"))',
+        '(form.number >= 2) == form.yes',
+    ]
+
+    for case in cases:
+        tree = Condition().parse(case)
+
+        assert compile_condition(tree)(values) is \
+            ConditionTransformer(values).transform(tree)
+
+
+def test_compiled_condition_chain():
+    values = {
+        'set': {
+            'A': True,
+            'B': False,
+            'C': True,
+        },
+    }
+
+    tree = Condition().parse('set.B || set.B || set.C')
+    assert compile_condition(tree)(values) is True
+
+    tree = Condition().parse('set.A && set.C && set.B')
+    assert compile_condition(tree)(values) is False
+
+
+def test_chained_comparison():
+    values = {
+        'set': {
+            'A': 1,
+            'B': 2,
+            'C': 3,
+        },
+    }
+
+    for case in ['set.A < set.B < set.C', 'set.A == set.B == set.C']:
+        tree = Condition().parse(case)
+
+        with pytest.raises(ValueError):
+            compile_condition(tree)
+
+        # lark wraps the ValueError raised by the transformer
+        with pytest.raises((ValueError, VisitError)):
+            ConditionTransformer(values).transform(tree)
+
+
+def test_parser_is_shared():
+    assert Condition().parser is Condition().parser
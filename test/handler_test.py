@@ -6,7 +6,7 @@ import requests
 
 from cacahuate.handler import Handler
 from cacahuate.models import Execution, Pointer, User
-from cacahuate.node import Action, Form
+from cacahuate.node import Form
 from cacahuate.xml import Xml
 
 from .utils import make_pointer, make_user, assert_near_date, random_string
@@ -38,9 +38,7 @@ def test_create_pointer(config):
     handler = Handler(config)
 
     xml = Xml.load(config, 'simple')
-    xmliter = iter(xml)
-
-    node = Action(next(xmliter), xmliter)
+    node = xml.get_start_node()
 
     exc = Execution.validate(
         process_name='simple.2018-02-19.xml',
@@ -88,7 +86,7 @@ def test_wakeup(config, mongo):
 
     # test manager is notified
     channel.basic_publish.assert_called_once()
-    channel.exchange_declare.assert_called_once()
+    channel.exchange_declare.assert_not_called()
 
     args = channel.basic_publish.call_args[1]
 
@@ -388,6 +386,38 @@ def test_call_handler_delete_process(config, mongo):
     assert Pointer.count() == 0
 
 
+def test_skip_duplicated_message(config, mocker):
+    handler = Handler(config)
+    mocker.patch.object(handler, 'call')
+    body = json.dumps({
+        'command': 'step',
+        'pointer_id': 'a',
+        'user_identifier': 'juan',
+        'input': [],
+    })
+
+    handler(MagicMock(), None, MagicMock(message_id='first'), body)
+    handler(MagicMock(), None, MagicMock(message_id='first'), body)
+
+    handler.call.assert_called_once()
+
+    handler(MagicMock(), None, MagicMock(message_id='second'), body)
+    handler(MagicMock(), None, None, body)
+
+    assert handler.call.call_count == 3
+
+    # not remembered if it failed
+    handler.call.side_effect = KeyError
+
+    with pytest.raises(KeyError):
+        handler(MagicMock(), None, MagicMock(message_id='third'), body)
+
+    handler.call.side_effect = None
+    handler(MagicMock(), None, MagicMock(message_id='third'), body)
+
+    assert handler.call.call_count == 5
+
+
 def test_approve(config, mongo):
     ''' tests that a validation node can go forward on approval '''
     # test setup
@@ -1303,6 +1333,128 @@ def test_false_condition_node(config, mongo):
     assert ptr.node_id == 'condition2'
 
 
+def test_chained_sync_nodes(config, mongo):
+    ''' sync nodes are run by the same step up to SYNC_CHAIN_LENGTH of them,
+    the rest are queued '''
+    config['SYNC_CHAIN_LENGTH'] = 1
+    handler = Handler(config)
+    user = make_user('juan', 'Juan')
+    ptr = make_pointer('condition.2018-05-17.xml', 'start_node')
+    execution = ptr.proxy.execution.get()
+    channel = MagicMock()
+
+    mongo[config["EXECUTION_COLLECTION"]].insert_one({
+        '_type': 'execution',
+        'id': execution.id,
+        'state': Xml.load(config, 'condition').get_state(),
+    })
+
+    handler.call({
+        'command': 'step',
+        'pointer_id': ptr.id,
+        'user_identifier': user.identifier,
+        'input': [Form.state_json('mistery', [
+            {
+                'name': 'password',
+                'type': 'text',
+                'value': '123456',
+            },
+        ])],
+    }, channel)
+
+    # condition1 was run by this step, condition2 was queued
+    ptr = Pointer.get_all()[0]
+    assert ptr.node_id == 'condition2'
+
+    channel.basic_publish.assert_called_once()
+    args = channel.basic_publish.call_args[1]
+    assert json.loads(args['body']) == {
+        'command': 'step',
+        'pointer_id': ptr.id,
+        'input': [Form.state_json('condition2', [
+            {
+                'name': 'condition',
+                'state': 'valid',
+                'type': 'bool',
+                'value': True,
+            },
+        ])],
+        'user_identifier': '__system__',
+    }
+
+    # the chained node left the same records as a queued one
+    state = next(mongo[config["EXECUTION_COLLECTION"]].find({
+        'id': execution.id,
+    }))
+    assert state['state']['items']['condition1']['state'] == 'valid'
+    assert state['values']['condition1']['condition'] is False
+    assert state['actors']['condition1'] == '__system__'
+
+    reg = next(mongo[config["POINTER_COLLECTION"]].find({
+        'node.id': 'condition1',
+    }))
+    assert reg['finished_at'] is not None
+
+
+def test_no_chain_with_redelivery(config, mongo):
+    ''' when messages are delivered again, a worker that dies right after a
+    step must have left the next sync node in the queue '''
+    config['SYNC_CHAIN_LENGTH'] = 1
+    config['RABBIT_NO_ACK'] = False
+    handler = Handler(config)
+    user = make_user('juan', 'Juan')
+    ptr = make_pointer('condition.2018-05-17.xml', 'start_node')
+    execution = ptr.proxy.execution.get()
+    channel = MagicMock()
+
+    mongo[config["EXECUTION_COLLECTION"]].insert_one({
+        '_type': 'execution',
+        'id': execution.id,
+        'state': Xml.load(config, 'condition').get_state(),
+    })
+
+    # the worker dies if it runs a second step
+    step = handler.step
+    steps = []
+
+    def dying_step(pointer, *args):
+        steps.append(pointer.node_id)
+
+        if len(steps) > 1:
+            raise SystemExit
+
+        return step(pointer, *args)
+
+    handler.step = dying_step
+
+    handler.call({
+        'command': 'step',
+        'pointer_id': ptr.id,
+        'user_identifier': user.identifier,
+        'input': [Form.state_json('mistery', [
+            {
+                'name': 'password',
+                'type': 'text',
+                'value': '123456',
+            },
+        ])],
+    }, channel)
+
+    assert steps == ['start_node']
+
+    # another worker gets the queued step of condition1
+    ptr = Pointer.get_all()[0]
+    assert ptr.node_id == 'condition1'
+
+    channel.basic_publish.assert_called_once()
+    body = channel.basic_publish.call_args[1]['body']
+
+    Handler(config).call(json.loads(body), MagicMock())
+
+    ptr = Pointer.get_all()[0]
+    assert ptr.node_id == 'condition2'
+
+
 def test_anidated_conditions(config, mongo):
     ''' conditional node won't be executed if its condition is false '''
     # test setup
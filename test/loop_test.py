@@ -1,7 +1,179 @@
-from cacahuate.loop import Loop
+from pymongo.errors import AutoReconnect
+from unittest.mock import MagicMock, call
+import pika
+import simplejson as json
+
+from cacahuate.loop import Loop, Pool, ThreadsafeChannel
 
 
 def test_import(config):
     loop = Loop(config)
 
     assert loop
+
+
+def test_threadsafe_channel():
+    connection = MagicMock()
+    channel = MagicMock()
+
+    ThreadsafeChannel(connection, channel).basic_publish(exchange='', body='')
+
+    channel.basic_publish.assert_not_called()
+
+    callback = connection.add_callback_threadsafe.call_args[0][0]
+    callback()
+
+    channel.basic_publish.assert_called_once_with(exchange='', body='')
+
+
+def test_pool_keeps_executions_in_one_lane(config):
+    pool = Pool(config, 4)
+    pool.lanes = [MagicMock() for i in range(4)]
+
+    for execution_id in ['a', 'b', 'a', 'c', 'a']:
+        pool(None, execution_id, None, json.dumps({
+            'command': 'cancel',
+            'execution_id': execution_id,
+        }))
+
+    received = [
+        [call[0][0][0] for call in lane.messages.put.call_args_list]
+        for lane in pool.lanes
+    ]
+
+    assert [methods.count('a') for methods in received if 'a' in methods] \
+        == [3]
+
+
+def test_reconnect(config, mocker):
+    connection = MagicMock()
+    connection.channel.return_value.start_consuming.side_effect = \
+        KeyboardInterrupt
+    connect = mocker.patch('cacahuate.loop.pika.BlockingConnection')
+    connect.side_effect = [
+        pika.exceptions.AMQPConnectionError(),
+        pika.exceptions.AMQPConnectionError(),
+        connection,
+    ]
+    sleep = mocker.patch('cacahuate.loop.time.sleep')
+
+    Loop(config).start()
+
+    assert connect.call_count == 3
+    assert [c[0][0] for c in sleep.call_args_list] == [1, 2]
+
+
+def test_topology_declared_per_connection(config, mocker):
+    first = MagicMock()
+    first.channel.return_value.start_consuming.side_effect = \
+        pika.exceptions.AMQPConnectionError
+    second = MagicMock()
+    second.channel.return_value.start_consuming.side_effect = \
+        KeyboardInterrupt
+    mocker.patch('cacahuate.loop.pika.BlockingConnection', side_effect=[
+        first, second,
+    ])
+    mocker.patch('cacahuate.loop.time.sleep')
+
+    Loop(config).start()
+
+    for connection in (first, second):
+        channel = connection.channel.return_value
+
+        channel.queue_declare.assert_called_once_with(
+            queue=config['RABBIT_QUEUE'],
+            durable=True,
+            arguments=None,
+        )
+        channel.exchange_declare.assert_called_once_with(
+            exchange=config['RABBIT_NOTIFY_EXCHANGE'],
+            exchange_type='direct',
+        )
+
+
+def test_ack_after_handling(config, mocker):
+    config['RABBIT_NO_ACK'] = False
+    config['RABBIT_WORKER_CONFIRMS'] = False
+    config['RABBIT_ACK_BATCH_SIZE'] = 1
+    connection = MagicMock()
+    channel = connection.channel.return_value
+    mocker.patch(
+        'cacahuate.loop.pika.BlockingConnection',
+        return_value=connection,
+    )
+    loop = Loop(config)
+    loop.handler = MagicMock()
+
+    def consume(*args):
+        callback = channel.basic_consume.call_args[0][0]
+        callback(channel, MagicMock(delivery_tag=1), None, b'{}')
+
+        loop.handler.assert_called_once()
+        channel.basic_ack.assert_called_once_with(
+            delivery_tag=1,
+            multiple=True,
+        )
+
+        raise KeyboardInterrupt
+
+    channel.start_consuming.side_effect = consume
+
+    loop.start()
+
+    assert channel.basic_consume.call_args[1]['no_ack'] is False
+
+
+def test_reject_failed_message(config, mocker):
+    config['RABBIT_NO_ACK'] = False
+    config['RABBIT_WORKER_CONFIRMS'] = False
+    config['RABBIT_ACK_BATCH_SIZE'] = 1
+    connection = MagicMock()
+    channel = connection.channel.return_value
+    mocker.patch(
+        'cacahuate.loop.pika.BlockingConnection',
+        return_value=connection,
+    )
+    loop = Loop(config)
+    loop.handler = MagicMock(side_effect=[
+        AutoReconnect('mongo is down'),
+        Exception('boom'),
+        None,
+    ])
+
+    def consume(*args):
+        callback = channel.basic_consume.call_args[0][0]
+
+        for tag in (1, 2, 3):
+            callback(channel, MagicMock(delivery_tag=tag), None, b'{}')
+
+        # the transient failure is handled again, the other one goes to the
+        # dead letter queue and the next message is handled
+        assert loop.handler.call_count == 3
+        assert [
+            c for c in channel.method_calls
+            if c[0] in ('basic_ack', 'basic_nack')
+        ] == [
+            call.basic_nack(delivery_tag=1, requeue=True),
+            call.basic_nack(delivery_tag=2, requeue=False),
+            call.basic_ack(delivery_tag=3, multiple=True),
+        ]
+
+        raise KeyboardInterrupt
+
+    channel.start_consuming.side_effect = consume
+
+    loop.start()
+
+    channel.queue_declare.assert_any_call(
+        queue=config['RABBIT_QUEUE'],
+        durable=True,
+        arguments={
+            'x-dead-letter-exchange': '',
+            'x-dead-letter-routing-key': config['RABBIT_DEAD_LETTER_QUEUE'],
+        },
+    )
+    channel.queue_declare.assert_any_call(
+        queue=config['RABBIT_DEAD_LETTER_QUEUE'],
+        durable=True,
+        arguments=None,
+    )
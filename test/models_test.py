@@ -0,0 +1,61 @@
+from cacahuate.models import Execution, Pointer, User, Transaction, \
+    get_many_by
+
+from .utils import make_pointer, make_user
+
+
+def test_transaction_save_and_add():
+    execution = Execution(process_name='simple.2018-02-19.xml').save()
+    juan = make_user('juan', 'Juan')
+    pointer = Pointer(node_id='mid_node')
+
+    with Transaction() as transaction:
+        transaction.save(pointer)
+        transaction.add(pointer, 'execution', execution)
+        transaction.add(juan, 'tasks', pointer)
+
+        assert Pointer.get(pointer.id) is None
+
+    assert Pointer.get(pointer.id).node_id == 'mid_node'
+    assert pointer.proxy.execution.get() == execution
+    assert pointer in execution.proxy.pointers
+    assert pointer in juan.proxy.tasks
+    assert juan in pointer.proxy.candidates
+
+
+def test_transaction_delete():
+    pointer = make_pointer('simple.2018-02-19.xml', 'mid_node')
+    execution = pointer.proxy.execution.get()
+    juan = make_user('juan', 'Juan')
+    juan.proxy.tasks.add(pointer)
+
+    with Transaction() as transaction:
+        transaction.delete(pointer)
+
+    assert Pointer.get(pointer.id) is None
+    assert juan.proxy.tasks.count() == 0
+    assert execution.proxy.pointers.count() == 0
+
+
+def test_transaction_discarded_on_error():
+    pointer = Pointer(node_id='mid_node')
+
+    try:
+        with Transaction() as transaction:
+            transaction.save(pointer)
+
+            raise ValueError
+    except ValueError:
+        pass
+
+    assert Pointer.get(pointer.id) is None
+
+
+def test_get_many_by():
+    juan = make_user('juan', 'Juan')
+    pepe = make_user('pepe', 'Pepe')
+
+    assert get_many_by(User, 'identifier', ['pepe', 'nones', 'juan']) == [
+        pepe, None, juan,
+    ]
+    assert get_many_by(User, 'identifier', []) == []
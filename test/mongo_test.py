@@ -0,0 +1,91 @@
+from unittest.mock import MagicMock
+import pytest
+
+from cacahuate.mongo import PoolStats, client_options, get_client, get_db, \
+    get_entry, pool_stats, write_concern_options
+
+
+def test_client_is_shared(config, mocker):
+    mocker.patch.object(get_entry, 'instances', {})
+    MongoClient = mocker.patch('cacahuate.mongo.MongoClient')
+
+    assert get_client(config) is get_client(config)
+    assert get_db(config) is get_client(config)[config['MONGO_DBNAME']]
+    assert MongoClient.call_count == 1
+
+    args, kwargs = MongoClient.call_args
+    assert args == (config['MONGO_URI'],)
+    assert isinstance(kwargs['event_listeners'][0], PoolStats)
+    assert kwargs['maxPoolSize'] == config['MONGO_MAX_POOL_SIZE']
+
+    assert pool_stats(config)['checked_out'] == 0
+
+
+def test_client_not_shared_after_fork(config, mocker):
+    mocker.patch.object(get_entry, 'instances', {})
+    mocker.patch('cacahuate.mongo.MongoClient', side_effect=MagicMock)
+    getpid = mocker.patch('os.getpid', return_value=100)
+
+    parent = get_client(config)
+
+    getpid.return_value = 101
+
+    assert get_client(config) is not parent
+
+
+def test_client_options(config):
+    config['MONGO_WAIT_QUEUE_TIMEOUT_MS'] = None
+    config['MONGO_READ_PREFERENCE'] = 'secondaryPreferred'
+    config['MONGO_WRITE_CONCERN'] = {'w': 'majority', 'wtimeout': 5000}
+
+    assert client_options(config) == {
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'],
+        'serverSelectionTimeoutMS':
+            config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        'readPreference': 'secondaryPreferred',
+        'w': 'majority',
+        'wTimeoutMS': 5000,
+    }
+
+
+def test_write_concern_options(config):
+    assert write_concern_options({}) == {}
+    assert write_concern_options({'j': True}) == {'journal': True}
+
+    with pytest.raises(ValueError):
+        write_concern_options({'wTimeoutMS': 5000})
+
+
+def test_pool_stats(mocker):
+    monotonic = mocker.patch('time.monotonic', return_value=10)
+    stats = PoolStats()
+    event = MagicMock()
+
+    stats.connection_created(event)
+    stats.connection_created(event)
+
+    stats.connection_check_out_started(event)
+    monotonic.return_value = 12
+    stats.connection_checked_out(event)
+
+    stats.connection_check_out_started(event)
+    monotonic.return_value = 13
+    stats.connection_check_out_failed(event)
+
+    stats.connection_check_out_started(event)
+    stats.connection_checked_out(event)
+    stats.connection_checked_in(event)
+
+    stats.connection_closed(event)
+
+    assert stats.to_json() == {
+        'open': 1,
+        'checked_out': 1,
+        'checkouts': 2,
+        'failed_checkouts': 1,
+        'wait_time': 3,
+        'max_wait_time': 2,
+        'waits': [1, 0, 0, 0, 0, 0, 1, 1, 0],
+    }
@@ -2,14 +2,13 @@ from unittest.mock import MagicMock
 import requests
 
 from cacahuate.xml import Xml
-from cacahuate.node import make_node, Form
+from cacahuate.node import Form
+from cacahuate.session import StateSession
 
 
 def test_resolve_params(config):
     xml = Xml.load(config, 'exit_request')
-    xmliter = iter(xml)
-    next(xmliter)
-    node = make_node(next(xmliter), xmliter)
+    node = xml.get_node('manager')
 
     state = {
         'values': {
@@ -42,11 +41,7 @@ def test_request_node(config, mocker):
     )
 
     xml = Xml.load(config, 'request.2018-05-18')
-    xmliter = iter(xml)
-
-    next(xmliter)
-    request = next(xmliter)
-    node = make_node(request, xmliter)
+    node = xml.get_node('request_node')
 
     response = node.make_request({
         'request': {
@@ -85,3 +80,63 @@ def test_form_state_json():
             'item_order': [],
         },
     }
+
+
+def test_validation_reject_follows_dependencies(config):
+    xml = Xml.load(config, 'validation-reloaded')
+    node = xml.get_node('node4')
+
+    def filled(form_id):
+        return {
+            'state': 'valid',
+            'actors': {
+                'items': {
+                    'juan': {
+                        'forms': [{
+                            'ref': form_id,
+                            'inputs': {
+                                'items': {
+                                    'task': {},
+                                },
+                            },
+                        }],
+                    },
+                },
+            },
+        }
+
+    state = {
+        'id': 'exec',
+        'state': {
+            'items': {
+                'node1': filled('form1'),
+                'node2': filled('form2'),
+                'node3': filled('form3'),
+                'node4': filled('approval'),
+                'node5': {
+                    'state': 'unfilled',
+                    'actors': {'items': {}},
+                },
+            },
+        },
+        'values': {
+            'node4': {
+                'response': 'reject',
+                'comment': 'nones',
+                'inputs': [{'ref': 'node1.juan.0:form1.task'}],
+            },
+        },
+    }
+
+    session = StateSession(MagicMock(), 'exec')
+    session.document = state
+
+    assert node.next(xml, state, session, config).id == 'node1'
+
+    assert session.updates['state.items.node2.actors.items.juan.forms.0.'
+                           'inputs.items.task.state'] == 'invalid'
+    assert session.updates['state.items.node4.comment'] == 'nones'
+    assert 'state.items.node3.state' not in session.updates
+
+    # the state seen by the rest of the step is already updated
+    assert state['state']['items']['node2']['state'] == 'invalid'
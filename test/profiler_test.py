@@ -0,0 +1,85 @@
+import os
+import pstats
+import time
+
+from cacahuate.profiler import Profiler, collapse, set_process
+
+
+def busy():
+    started = time.monotonic()
+
+    while time.monotonic() - started < 0.05:
+        pass
+
+
+def make_profiler(config, tmpdir, **settings):
+    config['PROFILER_PATH'] = str(tmpdir)
+    config['PROFILER_INTERVAL'] = 0.001
+    config.update(settings)
+
+    return Profiler(config)
+
+
+def test_disabled(config, tmpdir):
+    profiler = make_profiler(config, tmpdir)
+
+    with profiler.profile():
+        busy()
+
+    assert os.listdir(str(tmpdir)) == []
+    assert profiler.count == 0
+
+
+def test_every_nth_message(config, tmpdir):
+    profiler = make_profiler(config, tmpdir, PROFILER_EVERY=2)
+
+    for i in range(4):
+        with profiler.profile():
+            set_process('simple')
+            busy()
+
+    filename = 'simple.{}.collapsed'.format(os.getpid())
+    assert os.listdir(str(tmpdir)) == [filename]
+
+    with open(str(tmpdir.join(filename))) as f:
+        lines = f.read().splitlines()
+
+    assert lines
+    assert sum(int(line.rsplit(' ', 1)[1]) for line in lines) > 10
+    assert any('profiler_test.py:busy' in line for line in lines)
+
+
+def test_signal_window(config, tmpdir, mocker):
+    profiler = make_profiler(config, tmpdir, PROFILER_MODE='cprofile')
+    monotonic = mocker.patch('time.monotonic', return_value=100)
+
+    with profiler.profile():
+        set_process('simple')
+
+    assert os.listdir(str(tmpdir)) == []
+
+    profiler.handle_signal(None, None)
+
+    with profiler.profile():
+        set_process('simple')
+
+    monotonic.return_value = 100 + config['PROFILER_WINDOW']
+
+    with profiler.profile():
+        set_process('other')
+
+    assert os.listdir(str(tmpdir)) == [
+        'simple.{}.prof'.format(os.getpid()),
+    ]
+    pstats.Stats(str(tmpdir.join(os.listdir(str(tmpdir))[0])))
+
+
+def test_collapse():
+    def inner():
+        import sys
+
+        return collapse(sys._getframe())
+
+    assert inner().endswith(
+        'profiler_test.py:test_collapse;profiler_test.py:inner'
+    )
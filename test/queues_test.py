@@ -0,0 +1,159 @@
+from unittest.mock import MagicMock
+import pika
+import pytest
+import simplejson as json
+
+from cacahuate.errors import MisconfiguredProvider
+from cacahuate.models import Pointer
+from cacahuate.queues import get_queue
+from cacahuate.queues.memory import MemoryQueue
+from cacahuate.queues.rabbit import RabbitQueue
+from cacahuate.queues.redis import RedisQueue
+from cacahuate.rabbit import ChannelPool
+
+
+def publish(channel, config, body, message_id=None):
+    channel.basic_publish(
+        exchange='',
+        routing_key=config['RABBIT_QUEUE'],
+        body=body,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            message_id=message_id,
+        ),
+    )
+
+
+def test_get_queue(config, mocker):
+    mocker.patch.object(get_queue, 'instances', {})
+
+    assert isinstance(get_queue(config), RabbitQueue)
+    assert isinstance(get_queue(config).get_channel(), ChannelPool)
+
+    config['QUEUE_BACKEND'] = 'memory'
+
+    assert isinstance(get_queue(config), MemoryQueue)
+    assert get_queue(config) is get_queue(config)
+
+    config['QUEUE_BACKEND'] = 'kafka'
+
+    with pytest.raises(MisconfiguredProvider):
+        get_queue(config)
+
+
+def test_channel_routes_messages(config):
+    queue = MemoryQueue(config)
+    channel = queue.get_channel()
+
+    publish(channel, config, '{"command": "step"}', 'abc')
+    channel.basic_publish(
+        exchange=config['RABBIT_NOTIFY_EXCHANGE'],
+        routing_key='email',
+        body='{"recipient": "juan"}',
+    )
+    channel.basic_publish(exchange='', routing_key='other', body='{}')
+
+    method, properties, body = queue.get()
+
+    assert method.delivery_tag == 1
+    assert properties.message_id == 'abc'
+    assert body == '{"command": "step"}'
+
+    assert queue.commands.empty()
+    assert list(queue.notifications['email']) == ['{"recipient": "juan"}']
+
+
+def test_memory_consume(config, mocker):
+    Handler = mocker.patch('cacahuate.queues.base.Handler')
+    Handler.return_value.side_effect = [Exception('boom'), None]
+    counter = MagicMock()
+    counter.value = 0
+
+    queue = MemoryQueue(config)
+    channel = queue.get_channel()
+
+    publish(channel, config, '{"command": "cancel"}')
+    publish(channel, config, '{"command": "step"}')
+    queue.stop()
+
+    queue.consume(counter)
+
+    # a failed message does not stop the worker
+    assert [
+        call[0][3] for call in Handler.return_value.call_args_list
+    ] == ['{"command": "cancel"}', '{"command": "step"}']
+    assert counter.value == 2
+
+
+def test_memory_consume_threads(config, mocker):
+    config['WORKER_THREADS'] = 2
+    Handler = mocker.patch('cacahuate.loop.Handler')
+    queue = MemoryQueue(config)
+
+    publish(queue.get_channel(), config, json.dumps({
+        'command': 'cancel',
+        'execution_id': 'exec',
+    }))
+    queue.stop()
+
+    queue.consume()
+
+    Handler.return_value.assert_called_once()
+
+
+def test_redis_queue(config):
+    config['REDIS_STREAM_BLOCK'] = 10
+    queue = RedisQueue(config)
+    queue.create_group()
+
+    publish(queue.get_channel(), config, '{"command": "step"}', 'abc')
+
+    method, properties, body = queue.get()
+
+    assert properties.message_id == 'abc'
+    assert body == b'{"command": "step"}'
+
+    # pending until acknowledged, delivered again to a new consumer with the
+    # same name
+    again = RedisQueue(config)
+    assert again.get()[0].delivery_tag == method.delivery_tag
+
+    queue.ack(method)
+
+    redis = Pointer.get_redis()
+    assert redis.xlen(config['REDIS_STREAM']) == 0
+    assert redis.xpending(
+        config['REDIS_STREAM'], config['REDIS_STREAM_GROUP'],
+    )['pending'] == 0
+
+
+def test_redis_claims_abandoned(config, mocker):
+    config['REDIS_STREAM_BLOCK'] = 10
+    config['REDIS_STREAM_CLAIM_IDLE'] = 0
+
+    dead = RedisQueue(config)
+    dead.consumer = 'dead'
+    dead.create_group()
+
+    publish(dead.get_channel(), config, '{"command": "step"}')
+    method, _, _ = dead.get()
+
+    queue = RedisQueue(config)
+
+    assert queue.get()[0].delivery_tag == method.delivery_tag
+
+
+def test_redis_notify(config):
+    queue = RedisQueue(config)
+
+    queue.get_channel().basic_publish(
+        exchange=config['RABBIT_NOTIFY_EXCHANGE'],
+        routing_key='email',
+        body='{}',
+    )
+
+    entries = Pointer.get_redis().xrange(
+        config['REDIS_NOTIFY_STREAM'] + ':email',
+    )
+
+    assert [fields for _, fields in entries] == [{b'body': b'{}'}]
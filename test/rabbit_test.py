@@ -0,0 +1,130 @@
+from threading import Thread
+from unittest.mock import MagicMock
+import pika
+import pytest
+
+from cacahuate.rabbit import ChannelPool
+
+
+def publish(pool, body='{}'):
+    return pool.basic_publish(
+        exchange='',
+        routing_key='cacahuate_process',
+        body=body,
+    )
+
+
+def test_channel_reused(config, mocker):
+    BlockingConnection = mocker.patch('pika.BlockingConnection')
+    channel = BlockingConnection.return_value.channel.return_value
+    pool = ChannelPool(config, 2)
+
+    publish(pool)
+    publish(pool)
+
+    assert BlockingConnection.call_count == 1
+    assert channel.basic_publish.call_count == 2
+    channel.queue_declare.assert_called_once_with(
+        queue='cacahuate_process',
+        durable=True,
+        arguments=None,
+    )
+    channel.exchange_declare.assert_called_once()
+    channel.confirm_delivery.assert_not_called()
+
+
+def test_pool_size(config, mocker):
+    mocker.patch('pika.BlockingConnection')
+    pool = ChannelPool(config, 2)
+
+    first = pool.acquire()
+    second = pool.acquire()
+
+    assert first is not second
+    assert pool.created == 2
+
+    pool.release(first)
+
+    assert pool.acquire() is first
+
+
+def test_waiter_creates_after_discard(config, mocker):
+    mocker.patch('pika.BlockingConnection', side_effect=lambda *a: MagicMock())
+    pool = ChannelPool(config, 1)
+    first = pool.acquire()
+    acquired = []
+
+    waiter = Thread(target=lambda: acquired.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.1)
+
+    # blocked while the pool is full
+    assert waiter.is_alive()
+
+    pool.discard(first)
+    waiter.join(1)
+
+    assert not waiter.is_alive()
+    assert acquired[0] is not first
+    assert pool.created == 1
+
+
+def test_reconnect(config, mocker):
+    BlockingConnection = mocker.patch('pika.BlockingConnection', side_effect=[
+        MagicMock(), MagicMock(),
+    ])
+    pool = ChannelPool(config, 1)
+
+    publish(pool)
+
+    dead = pool.idle.queue[0]
+    dead.channel.basic_publish.side_effect = \
+        pika.exceptions.AMQPConnectionError
+
+    publish(pool, '{"a": 1}')
+
+    assert BlockingConnection.call_count == 2
+    assert pool.created == 1
+    dead.connection.close.assert_called_once()
+
+    alive = pool.idle.queue[0]
+    alive.channel.basic_publish.assert_called_once_with(
+        exchange='',
+        routing_key='cacahuate_process',
+        body='{"a": 1}',
+    )
+    # declared again in the new connection
+    alive.channel.queue_declare.assert_called_once()
+
+
+def test_dead_idle_connection(config, mocker):
+    BlockingConnection = mocker.patch('pika.BlockingConnection', side_effect=[
+        MagicMock(), MagicMock(),
+    ])
+    pool = ChannelPool(config, 1)
+
+    publish(pool)
+
+    dead = pool.idle.queue[0]
+    dead.connection.process_data_events.side_effect = \
+        pika.exceptions.StreamLostError
+
+    publish(pool)
+
+    assert BlockingConnection.call_count == 2
+    dead.channel.basic_publish.assert_called_once()
+
+
+def test_confirms(config, mocker):
+    config['RABBIT_PUBLISHER_CONFIRMS'] = True
+    BlockingConnection = mocker.patch('pika.BlockingConnection')
+    channel = BlockingConnection.return_value.channel.return_value
+    channel.basic_publish.return_value = False
+    pool = ChannelPool(config, 1)
+
+    with pytest.raises(pika.exceptions.NackError):
+        publish(pool)
+
+    channel.confirm_delivery.assert_called()
+    assert channel.basic_publish.call_count == 2
+    assert pool.created == 0
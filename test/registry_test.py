@@ -0,0 +1,158 @@
+import os
+import pytest
+import shutil
+
+from cacahuate.errors import ProcessNotFound, MalformedProcess
+from cacahuate.registry import Registry
+
+# the process files shipped with the tests
+FIXTURES = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), '..', 'xml',
+)
+
+
+@pytest.fixture
+def xml_dir(config, tmpdir):
+    for filename in [
+        'oldest.2018-02-14.xml',
+        'oldest.2018-02-17.xml',
+        'simple.2018-02-19.xml',
+    ]:
+        shutil.copy(
+            os.path.join(config['XML_PATH'], filename),
+            str(tmpdir),
+        )
+
+    config['XML_PATH'] = str(tmpdir)
+    config['XML_REFRESH_INTERVAL'] = 0
+
+    return str(tmpdir)
+
+
+def test_find(config, xml_dir):
+    registry = Registry(config)
+
+    assert registry.find('oldest').filename == 'oldest.2018-02-17.xml'
+    assert registry.find('oldest', '2018-02-14').filename == \
+        'oldest.2018-02-14.xml'
+
+    with pytest.raises(ProcessNotFound):
+        registry.find('nones')
+
+    with pytest.raises(ProcessNotFound):
+        registry.find('oldest', '2018-01-01')
+
+
+def test_processes(config, xml_dir):
+    registry = Registry(config)
+
+    assert [p.filename for p in registry.processes()] == [
+        'simple.2018-02-19.xml',
+        'oldest.2018-02-17.xml',
+        'oldest.2018-02-14.xml',
+    ]
+
+
+def test_refresh(config, xml_dir):
+    registry = Registry(config)
+
+    assert registry.find('simple')
+    generation = registry.generation
+
+    shutil.copy(
+        os.path.join(xml_dir, 'simple.2018-02-19.xml'),
+        os.path.join(xml_dir, 'simple.2018-03-01.xml'),
+    )
+
+    assert registry.find('simple').filename == 'simple.2018-03-01.xml'
+    assert registry.generation == generation + 1
+
+    os.remove(os.path.join(xml_dir, 'simple.2018-03-01.xml'))
+
+    assert registry.find('simple').filename == 'simple.2018-02-19.xml'
+    assert registry.generation == generation + 2
+
+    registry.find('simple')
+
+    assert registry.generation == generation + 2
+
+
+def test_refresh_interval(config, xml_dir):
+    config['XML_REFRESH_INTERVAL'] = 60
+    registry = Registry(config)
+
+    assert registry.find('simple')
+
+    shutil.copy(
+        os.path.join(xml_dir, 'simple.2018-02-19.xml'),
+        os.path.join(xml_dir, 'simple.2018-03-01.xml'),
+    )
+
+    assert registry.find('simple').filename == 'simple.2018-02-19.xml'
+
+
+def test_malformed_reported_once(config, xml_dir, mocker):
+    with open(os.path.join(xml_dir, 'broken.2018-01-01.xml'), 'w') as f:
+        f.write('<process-spec>')
+
+    error = mocker.patch('cacahuate.registry.LOGGER.error')
+    registry = Registry(config)
+
+    with pytest.raises(MalformedProcess):
+        registry.find('broken')
+
+    with pytest.raises(MalformedProcess):
+        registry.find('broken')
+
+    assert 'broken.2018-01-01.xml' not in [
+        p.filename for p in registry.processes()
+    ]
+    error.assert_called_once()
+
+
+def write_variant(xml_dir, source, filename, old, new):
+    ''' copies a process file replacing a piece of it '''
+    with open(os.path.join(FIXTURES, source)) as f:
+        document = f.read()
+
+    assert old in document
+
+    with open(os.path.join(xml_dir, filename), 'w') as f:
+        f.write(document.replace(old, new, 1))
+
+
+def test_unknown_input_breaks_only_its_file(config, xml_dir):
+    write_variant(
+        xml_dir, 'simple.2018-02-19.xml', 'bogus.2018-01-01.xml',
+        'type="text"', 'type="bogus"',
+    )
+    registry = Registry(config)
+
+    assert registry.find('simple').filename == 'simple.2018-02-19.xml'
+
+    with pytest.raises(MalformedProcess) as e:
+        registry.find('bogus')
+
+    assert 'bogus' in str(e.value)
+    assert 'bogus.2018-01-01.xml' not in [
+        p.filename for p in registry.processes()
+    ]
+
+
+def test_invalid_condition_breaks_only_its_file(config, xml_dir):
+    write_variant(
+        xml_dir, 'else.2018-07-10.xml', 'else.2018-07-10.xml',
+        '<condition>secret01.password == "incorrect!"</condition>',
+        '<condition>secret01.password == == "incorrect!"</condition>',
+    )
+    registry = Registry(config)
+
+    with pytest.raises(MalformedProcess) as e:
+        registry.find('else')
+
+    assert 'condition01' in str(e.value)
+    assert [p.filename for p in registry.processes()] == [
+        'simple.2018-02-19.xml',
+        'oldest.2018-02-17.xml',
+        'oldest.2018-02-14.xml',
+    ]
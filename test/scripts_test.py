@@ -1,5 +1,9 @@
+import os
 import pytest
-from cacahuate.main import xml_validate
+import shutil
+
+from cacahuate.compiler import read
+from cacahuate.main import xml_validate, xml_compile
 
 
 def test_xml_validation():
@@ -92,3 +96,31 @@ def test_xml_validation_undefined_form_by_scope():
     assert str(cm.value) == \
         'xml/condition_undefined_form_by_scope.2018-07-10.xml:42 variable ' \
         'used in if is not defined \'task.answer\''
+
+
+def test_xml_compile(tmpdir, config):
+    config['COMPILED_SECRET'] = 'secret'
+    shutil.copy('xml/simple.2018-02-19.xml', str(tmpdir))
+    path = os.path.join(str(tmpdir), 'simple.2018-02-19.xml')
+
+    xml_compile([path], config)
+
+    assert read(path, 'secret').get_node('mid_node').name == 'Segundo paso'
+
+
+def test_xml_compile_requires_secret(tmpdir, config):
+    with pytest.raises(SystemExit) as cm:
+        xml_compile(['xml/simple.2018-02-19.xml'], config)
+
+    assert str(cm.value) == \
+        'COMPILED_SECRET must be set to sign the compiled files'
+
+
+def test_xml_compile_invalid(config):
+    config['COMPILED_SECRET'] = 'secret'
+
+    with pytest.raises(SystemExit) as cm:
+        xml_compile(['xml/condition_id_repeat.2018-05-28.xml'], config)
+
+    assert str(cm.value) == \
+        "xml/condition_id_repeat.2018-05-28.xml:26 Duplicated id: 'start_node'"
@@ -0,0 +1,103 @@
+from unittest.mock import MagicMock
+import pytest
+
+from cacahuate.errors import InconsistentState
+from cacahuate.session import Batch, StateSession
+
+
+def make_session(document):
+    storage = MagicMock()
+    storage.get_execution.return_value = document
+
+    return StateSession(storage, 'exec')
+
+
+def test_reads_once():
+    session = make_session({'id': 'exec', 'state': {}})
+
+    session.state
+    session.set({'state.a': 1})
+    session.state
+
+    session.storage.get_execution.assert_called_once_with('exec')
+
+
+def test_not_found():
+    session = make_session(None)
+
+    with pytest.raises(InconsistentState):
+        session.state
+
+
+def test_set_like_mongo():
+    session = make_session({
+        'id': 'exec',
+        'forms': [{'state': 'valid'}],
+    })
+
+    session.set({
+        'values.form.field': 'yes',
+        'forms.0.state': 'invalid',
+    })
+
+    assert session.state == {
+        'id': 'exec',
+        'values': {'form': {'field': 'yes'}},
+        'forms': [{'state': 'invalid'}],
+    }
+
+
+def test_nested_paths_are_merged():
+    session = make_session({'id': 'exec'})
+    actor = {'state': 'valid', 'forms': [{'state': 'valid'}]}
+
+    session.set({'actors.juan': actor})
+    session.set({'actors.juan.forms.0.state': 'invalid'})
+
+    assert session.updates == {
+        'actors.juan': {'state': 'valid', 'forms': [{'state': 'invalid'}]},
+    }
+
+    # the caller's object is not modified
+    assert actor['forms'][0]['state'] == 'valid'
+
+    session.set({'actors': {}})
+
+    assert session.updates == {'actors': {}}
+
+
+def test_flush_once():
+    session = make_session({'id': 'exec'})
+
+    with session:
+        session.set({'status': 'finished'})
+        session.set({'actors.node': 'juan'})
+
+    session.storage.write.assert_called_once_with('execution', [
+        ('update', 'exec', {
+            'status': 'finished',
+            'actors.node': 'juan',
+        }),
+    ])
+
+    session.flush()
+
+    session.storage.write.assert_called_once()
+
+
+def test_batch():
+    storage = MagicMock()
+    document = {'id': 'ptr', 'notified_users': []}
+
+    with Batch(storage, 'pointer') as batch:
+        batch.update_one('old', {'finished': True})
+        batch.insert_one(document)
+
+        document['notified_users'] = ['juan']
+
+        storage.write.assert_not_called()
+
+    storage.write.assert_called_once_with('pointer', [
+        ('update', 'old', {'finished': True}),
+        ('insert', {'id': 'ptr', 'notified_users': ['juan']}),
+    ])
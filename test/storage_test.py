@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+import pytest
+
+from cacahuate.errors import MisconfiguredProvider
+from cacahuate.storage import get_storage
+from cacahuate.storage.memory import MemoryStorage
+from cacahuate.storage.mongo import MongoStorage
+
+
+def pointer_entry(id, execution_id, node_id, started_at, seconds=None):
+    return {
+        'id': id,
+        'process_id': 'simple',
+        'execution': {'id': execution_id},
+        'node': {'id': node_id},
+        'started_at': started_at,
+        'finished_at': started_at + timedelta(seconds=seconds)
+        if seconds is not None else None,
+    }
+
+
+@pytest.fixture(params=['mongo', 'memory'])
+def backend(request, config, mongo):
+    config['STORAGE_BACKEND'] = request.param
+
+    if request.param == 'mongo':
+        return MongoStorage(config)
+
+    return MemoryStorage(config)
+
+
+def test_get_storage(config, mocker):
+    mocker.patch.object(get_storage, 'instances', {})
+
+    assert isinstance(get_storage(config), MongoStorage)
+
+    config['STORAGE_BACKEND'] = 'memory'
+
+    assert isinstance(get_storage(config), MemoryStorage)
+    assert get_storage(config) is get_storage(config)
+
+    config['STORAGE_BACKEND'] = 'redis'
+
+    with pytest.raises(MisconfiguredProvider):
+        get_storage(config)
+
+
+def test_executions(backend):
+    backend.insert_execution({
+        'id': 'exec',
+        'status': 'ongoing',
+        'state': {},
+    })
+    backend.insert_execution({
+        'id': 'other',
+        'status': 'ongoing',
+    })
+
+    backend.write('execution', [
+        ('update', 'exec', {'state.items.start': 'valid'}),
+        ('update', 'exec', {'status': 'finished'}),
+    ])
+
+    execution = backend.get_execution('exec')
+    execution.pop('_id', None)
+
+    assert execution == {
+        'id': 'exec',
+        'status': 'finished',
+        'state': {'items': {'start': 'valid'}},
+    }
+    assert backend.get_execution('missing') is None
+
+    # documents are copies
+    execution['status'] = 'cancelled'
+    assert backend.get_execution('exec')['status'] == 'finished'
+
+    assert [e['id'] for e in backend.list_executions()] == ['exec', 'other']
+    assert [e['id'] for e in backend.list_executions(1, 1)] == ['other']
+
+
+def test_pointers(backend):
+    now = datetime.now()
+
+    backend.insert_pointer(pointer_entry('a', 'exec', 'start', now))
+    backend.insert_pointer(
+        pointer_entry('b', 'exec', 'mid', now + timedelta(days=1))
+    )
+    backend.insert_pointer(pointer_entry('c', 'other', 'mid', now))
+
+    backend.write('pointer', [
+        ('update', 'b', {'actors.items.juan': {'state': 'valid'}}),
+    ])
+
+    pointers = backend.list_pointers('exec')
+
+    assert [p['id'] for p in pointers] == ['b', 'a']
+    assert pointers[0]['actors'] == {'items': {'juan': {'state': 'valid'}}}
+
+    assert [p['id'] for p in backend.list_pointers('exec', 'start')] == ['a']
+    assert [p['id'] for p in backend.list_pointers('exec', None, 1)] == ['a']
+
+
+def test_node_statistics():
+    backend = MemoryStorage({})
+    now = datetime.now()
+
+    backend.insert_pointer(pointer_entry('a', 'exec', 'start', now, 2))
+    backend.insert_pointer(pointer_entry('b', 'other', 'start', now, 4))
+    backend.insert_pointer(pointer_entry('c', 'other', 'mid', now))
+
+    assert backend.node_statistics('simple') == [{
+        '_id': {'process_id': 'simple', 'node': 'mid'},
+        'process_id': 'simple',
+        'node': 'mid',
+        'max': None,
+        'min': None,
+        'average': None,
+    }, {
+        '_id': {'process_id': 'simple', 'node': 'start'},
+        'process_id': 'simple',
+        'node': 'start',
+        'max': 4.0,
+        'min': 2.0,
+        'average': 3.0,
+    }]
@@ -0,0 +1,79 @@
+from unittest.mock import MagicMock
+import signal
+
+from cacahuate.supervisor import Slot, Supervisor
+
+
+def test_backoff(config):
+    supervisor = Supervisor(config, 1, None)
+    slot = Slot(0, None)
+
+    slot.started_at = 0
+    assert supervisor.backoff(slot, 1) == 1
+
+    slot.started_at = 2
+    assert supervisor.backoff(slot, 3) == 2
+
+    slot.started_at = 5
+    assert supervisor.backoff(slot, 6) == 4
+
+    # lived long enough
+    slot.started_at = 10
+    assert supervisor.backoff(slot, 100) == 1
+
+
+def test_restart_dead_worker(config):
+    target = MagicMock()
+    supervisor = Supervisor(config, 1, target)
+    supervisor.context = MagicMock()
+    slot = Slot(0, MagicMock())
+
+    supervisor.check(slot, 0)
+
+    supervisor.context.Process.assert_called_once_with(
+        target=supervisor.run,
+        args=(config, slot.counter),
+        name='cacahuated-0',
+    )
+
+    slot.process.is_alive.return_value = False
+    supervisor.check(slot, 5)
+
+    assert slot.process is None
+    assert slot.restart_at == 6
+
+    supervisor.check(slot, 5.5)
+    assert supervisor.context.Process.call_count == 1
+
+    supervisor.check(slot, 6)
+    assert supervisor.context.Process.call_count == 2
+
+
+def test_worker_ignores_profiling_signal_on_start(config, mocker):
+    mocker.patch('signal.signal')
+    target = MagicMock()
+    supervisor = Supervisor(config, 1, target)
+
+    supervisor.run(config, None)
+
+    # a SIGUSR2 forwarded before the profiler is installed is ignored
+    signal.signal.assert_any_call(signal.SIGUSR2, signal.SIG_IGN)
+    target.assert_called_once_with(config, None)
+
+
+def test_report(config, mocker):
+    info = mocker.patch('cacahuate.supervisor.LOGGER.info')
+    supervisor = Supervisor(config, 1, None)
+    slot = Slot(0, MagicMock())
+    slot.process = MagicMock(pid=42)
+    slot.reported_at = 0
+    slot.counter.value = 30
+    supervisor.slots = [slot]
+
+    supervisor.report(10)
+
+    info.assert_called_once_with(
+        'worker 0 (pid 42): 3.00 messages/s, 30 in total'
+    )
+    assert slot.reported == 30
+    assert slot.reported_at == 10
@@ -1,7 +1,7 @@
 import os
 import pytest
 
-from cacahuate.errors import ProcessNotFound
+from cacahuate.errors import ElementNotFound, ProcessNotFound
 from xml.dom.minidom import parse
 from cacahuate.xml import Xml, form_to_dict
 
@@ -47,50 +47,38 @@ def test_load_specific_version(config):
     assert xml.public is False
 
 
-def test_make_iterator(config):
-    ''' test that the iter function actually returns an interator over the
-    nodes and edges of the process '''
+def test_get_nodes(config):
+    ''' the nodes of the process are given in document order '''
     xml = Xml.load(config, 'simple')
 
-    expected_nodes = [
-        'action',
-        'action',
+    assert [
+        (type(node).__name__, node.id) for node in xml.get_nodes()
+    ] == [
+        ('Action', 'start_node'),
+        ('Action', 'mid_node'),
+        ('Action', 'final_node'),
     ]
 
-    for given, expected in zip(xml, expected_nodes):
-        assert given.tagName == expected
 
+def test_get_node(config):
+    xml = Xml.load(config, 'simple')
 
-def test_find(config):
-    xmliter = iter(Xml.load(config, 'simple'))
-
-    start = next(xmliter)
-
-    assert start.tagName == 'action'
-    assert start.getAttribute('id') == 'start_node'
-
-    echo = xmliter.find(
-        lambda e: e.getAttribute('id') == 'mid_node'
-    )
-
-    assert echo.tagName == 'action'
-    assert echo.getAttribute('id') == 'mid_node'
+    start = xml.get_start_node()
 
-    end = xmliter.find(
-        lambda e: e.getAttribute('id') == 'final_node'
-    )
+    assert start.id == 'start_node'
+    assert xml.get_node('mid_node') is xml.get_successor(start.id)
+    assert xml.get_successor('mid_node').id == 'final_node'
 
-    assert end.tagName == 'action'
-    assert end.getAttribute('id') == 'final_node'
+    with pytest.raises(ElementNotFound):
+        xml.get_node('nones')
 
 
 def test_skip_else(config):
-    xmliter = iter(Xml.load(config, 'else'))
-
-    xmliter.find(lambda x: x.getAttribute('id') == 'action01')
+    xml = Xml.load(config, 'else')
 
+    # the end of the if's block skips the elif and else that follow it
     with pytest.raises(StopIteration):
-        xmliter.next_skipping_elifelse()
+        xml.get_successor('action01')
 
 
 def test_form_to_dict(config):
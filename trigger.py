@@ -6,6 +6,9 @@ import os
 import pika
 import simplejson as json
 
+from cacahuate.dedup import new_message_id
+from cacahuate.queues import get_queue
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -13,21 +16,11 @@ class Trigger:
 
     def __init__(self):
         config = Config(os.path.dirname(os.path.realpath(__file__)))
-        config.from_pyfile('settings.py')
+        config.from_object('cacahuate.settings')
         config.from_envvar('CACAHUATE_SETTINGS', silent=True)
 
-        connection = pika.BlockingConnection(pika.ConnectionParameters(
-            host=config['RABBIT_HOST'],
-        ))
-        channel = connection.channel()
-
-        channel.queue_declare(
-            queue=config['RABBIT_QUEUE'],
-            durable=True,
-        )
-
         self.config = config
-        self.channel = channel
+        self.channel = get_queue(config).get_channel()
 
     def start(self, args):
         self.channel.basic_publish(
@@ -39,6 +32,7 @@ class Trigger:
             }),
             properties=pika.BasicProperties(
                 delivery_mode=2,
+                message_id=new_message_id(),
             ),
         )
 
@@ -55,6 +49,7 @@ class Trigger:
             }),
             properties=pika.BasicProperties(
                 delivery_mode=2,
+                message_id=new_message_id(),
             ),
         )
 